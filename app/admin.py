@@ -1,14 +1,82 @@
+from django import forms
+from django.conf import settings
 from django.contrib import admin
 
-from app.models import Globe, Language
+from app.globes import read_geo_json_file
+from app.models import Globe, Language, StoredGraph, ParseJob
+
+
+
+class GlobeForm(forms.ModelForm):
+	"""
+	The GeoJSON is uploaded as a file instead of being edited in a textarea.
+	The file is validated while it is being read (see read_geo_json_file) and
+	the form never loads the globe's current GeoJSON string.
+	"""
+	
+	geo_json_file = forms.FileField(
+		label = 'GeoJSON file',
+		required = False,
+		help_text = (
+			'A GeoJSON FeatureCollection. If the globe already exists, '
+			'uploading a file replaces its GeoJSON.'
+		)
+	)
+	
+	class Meta:
+		model = Globe
+		fields = ('name', 'description',)
+	
+	def clean_geo_json_file(self):
+		"""
+		Reads and validates the uploaded file, if any. A file is required for
+		new globes.
+		"""
+		f = self.cleaned_data.get('geo_json_file')
+		
+		if not f:
+			if self.instance.pk is None:
+				raise forms.ValidationError('Please upload a GeoJSON file.')
+			return None
+		
+		limit = settings.GLOBE_FILE_SIZE_LIMIT
+		if f.size > limit:
+			raise forms.ValidationError(
+				'The file exceeds the {} MB limit.'.format(limit // 1024 // 1024))
+		
+		try:
+			self.geo_json, self.meta = read_geo_json_file(
+				f, settings.GLOBE_FEATURE_LIMIT)
+		except ValueError as error:
+			raise forms.ValidationError(str(error))
+		
+		return f
+	
+	def save(self, commit=True):
+		if self.cleaned_data.get('geo_json_file'):
+			self.instance.set_geo_json(self.geo_json, self.meta)
+		
+		return super().save(commit)
 
 
 
 @admin.register(Globe)
 class GlobeAdmin(admin.ModelAdmin):
-	list_display = ('name', 'created', 'last_modified',)
+	form = GlobeForm
+	list_display = ('name', 'byte_size', 'feature_count', 'last_modified',)
 	search_fields = ('name',)
-	readonly_fields = ('created', 'last_modified',)
+	readonly_fields = (
+		'byte_size', 'feature_count',
+		'west', 'south', 'east', 'north',
+		'content_hash', 'created', 'last_modified',
+	)
+	
+	def get_queryset(self, request):
+		"""
+		Defers the GeoJSON string in all the admin views: the list and search
+		views have no use for it and the change form uploads a file instead.
+		"""
+		return super().get_queryset(request).defer('geo_json')
 
 
 
@@ -20,3 +88,32 @@ class LanguageAdmin(admin.ModelAdmin):
 
 
 
+@admin.register(StoredGraph)
+class StoredGraphAdmin(admin.ModelAdmin):
+	list_display = ('key', 'name', 'created',)
+	search_fields = ('key', 'name',)
+	readonly_fields = ('key', 'created',)
+	
+	def get_queryset(self, request):
+		"""
+		Defers the encoded graph, which is of no use in the admin.
+		"""
+		return super().get_queryset(request).defer('data')
+
+
+
+@admin.register(ParseJob)
+class ParseJobAdmin(admin.ModelAdmin):
+	list_display = ('key', 'status', 'created', 'started', 'finished',)
+	list_filter = ('status',)
+	search_fields = ('key',)
+	readonly_fields = ('key', 'created', 'started', 'finished',)
+	
+	def get_queryset(self, request):
+		"""
+		Defers the .dot string and the result, which can both be huge.
+		"""
+		return super().get_queryset(request).defer('contents', 'result')
+
+
+
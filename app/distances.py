@@ -0,0 +1,246 @@
+"""
+Great-circle distances between languages, computed on the server, so that
+graphs can be compared with geography without exporting them.
+
+The distances are the haversine formula's, computed a tile of rows at a time
+(see DistanceMatrix): the trigonometric functions of the halved latitudes and
+longitudes are computed once per language, so that within a tile the sines of
+the differences are outer products and only the arcsine remains to be
+computed per pair. The rows per tile are chosen for the tile's arrays to take
+about DISTANCE_TILE_BYTES, so that the memory taken does not grow with the
+square of the number of languages unless the whole matrix is asked for.
+
+The binary format of the matrix is laid out in little-endian columns, as the
+wire format of app.packing:
+* the header: DISTANCES_MAGIC, version, number of languages;
+* the ISO 639-3 codes, 4 NUL-padded bytes each;
+* the Float32 distances in km, row by row.
+"""
+from django.conf import settings
+
+from app import warmup
+from app.models import Language
+from app.packing import CODE_SIZE
+from app.stats import EARTH_RADIUS
+
+import struct
+
+import numpy as np
+
+
+
+"""
+The binary format's media type, magic string, version and header: magic,
+version, padding, number of languages.
+"""
+DISTANCES_CONTENT_TYPE = 'application/x-sanavirta-distances'
+DISTANCES_MAGIC = b'SNVD'
+DISTANCES_VERSION = 1
+
+DISTANCES_HEADER = struct.Struct('<4sHxxI')
+
+
+"""
+The float64 arrays that a tile's computation holds at once, for sizing the
+tiles; see DistanceMatrix.get_tile_rows.
+"""
+ARRAYS_PER_TILE = 4
+
+
+"""
+The most nearest neighbours that can be asked for per language.
+"""
+MAX_NEAREST = 100
+
+
+
+class DistanceMatrix:
+	"""
+	The distances between the given languages, computed on demand a tile of
+	rows at a time. The codes, latitudes and longitudes are lists in the
+	order of the matrix's rows and columns.
+	"""
+	
+	def __init__(self, codes, latitudes, longitudes):
+		self.codes = list(codes)
+		
+		phi = np.radians(np.asarray(latitudes, dtype=np.float64))
+		lam = np.radians(np.asarray(longitudes, dtype=np.float64))
+		
+		self.cos_phi = np.cos(phi)
+		self.sin_half_phi = np.sin(phi / 2)
+		self.cos_half_phi = np.cos(phi / 2)
+		self.sin_half_lam = np.sin(lam / 2)
+		self.cos_half_lam = np.cos(lam / 2)
+	
+	def __len__(self):
+		return len(self.codes)
+	
+	def get_tile_rows(self):
+		"""
+		Returns the number of rows per tile for the tile's arrays to take
+		about DISTANCE_TILE_BYTES; at least 1.
+		"""
+		row_bytes = max(len(self), 1) * 8 * ARRAYS_PER_TILE
+		return max(settings.DISTANCE_TILE_BYTES // row_bytes, 1)
+	
+	def get_tile(self, start, stop):
+		"""
+		Returns the float64 array of the distances, in km, between the rows
+		from start to stop and all the columns.
+		"""
+		rows = slice(start, stop)
+		
+		# sin((b - a) / 2) = sin(b / 2) cos(a / 2) - cos(b / 2) sin(a / 2)
+		tile = np.multiply.outer(self.cos_half_phi[rows], self.sin_half_phi)
+		tile -= np.multiply.outer(self.sin_half_phi[rows], self.cos_half_phi)
+		np.square(tile, out=tile)
+		
+		dlam = np.multiply.outer(self.cos_half_lam[rows], self.sin_half_lam)
+		dlam -= np.multiply.outer(self.sin_half_lam[rows], self.cos_half_lam)
+		np.square(dlam, out=dlam)
+		dlam *= np.multiply.outer(self.cos_phi[rows], self.cos_phi)
+		
+		tile += dlam
+		del dlam
+		
+		np.clip(tile, 0, 1, out=tile)
+		np.sqrt(tile, out=tile)
+		np.arcsin(tile, out=tile)
+		tile *= 2 * EARTH_RADIUS
+		
+		return tile
+	
+	def iter_tiles(self):
+		"""
+		Yields the (start, tile) tuples of the whole matrix, top down.
+		"""
+		step = self.get_tile_rows()
+		
+		for start in range(0, len(self), step):
+			yield start, self.get_tile(start, min(start + step, len(self)))
+	
+	def get_matrix(self):
+		"""
+		Returns the whole float64 matrix.
+		"""
+		matrix = np.empty((len(self), len(self)), dtype=np.float64)
+		
+		for start, tile in self.iter_tiles():
+			matrix[start:start + len(tile)] = tile
+		
+		return matrix
+	
+	def get_nearest(self, k):
+		"""
+		Returns the (indexes, distances) arrays of the k nearest neighbours of
+		each language, closest first; ties are broken by the order of the
+		languages. A language is not its own neighbour; other languages at the
+		same location are. Only a tile of the matrix is held at a time.
+		"""
+		indexes = np.empty((len(self), k), dtype=np.int64)
+		distances = np.empty((len(self), k), dtype=np.float64)
+		
+		for start, tile in self.iter_tiles():
+			rows = np.arange(len(tile))
+			tile[rows, rows + start] = np.inf
+			
+			# the k-th smallest distance of each row; the columns closer than
+			# it are kept and so are the first of those as close as it
+			kth = np.partition(tile, k - 1, axis=1)[:, k - 1:k]
+			closer = tile < kth
+			ties = tile == kth
+			room = k - np.count_nonzero(closer, axis=1)[:, None]
+			ties &= np.cumsum(ties, axis=1) <= room
+			closer |= ties
+			
+			nearest = np.nonzero(closer)[1].reshape(len(tile), k)
+			nearest_distances = tile[rows[:, None], nearest]
+			
+			order = np.lexsort((nearest, nearest_distances), axis=1)
+			
+			indexes[start:start + len(tile)] = nearest[rows[:, None], order]
+			distances[start:start + len(tile)] = nearest_distances[rows[:, None], order]
+		
+		return indexes, distances
+	
+	def iter_binary(self):
+		"""
+		Yields the chunks of the matrix in the binary format, a tile at a
+		time; see the module's docstring.
+		"""
+		yield DISTANCES_HEADER.pack(DISTANCES_MAGIC, DISTANCES_VERSION, len(self))
+		
+		yield b''.join(
+			code.encode()[:CODE_SIZE].ljust(CODE_SIZE, b'\0') for code in self.codes)
+		
+		for start, tile in self.iter_tiles():
+			yield tile.astype('<f4').tobytes()
+	
+	def get_binary_size(self):
+		"""
+		Returns the byte size of the matrix in the binary format.
+		"""
+		return DISTANCES_HEADER.size + len(self) * CODE_SIZE + len(self) ** 2 * 4
+
+
+
+def find_locations(codes):
+	"""
+	Returns the (codes, latitudes, longitudes, skipped) tuple of the given
+	ISO 639-3 codes: the first three lists hold the languages with a known
+	location, in the given order; the skipped list holds the others. The
+	locations are looked up in the table warmed up by app.warmup, if any, or
+	else in the database, in a single query.
+	"""
+	locations = warmup.languages
+	
+	if locations is None:
+		locations = {
+			iso_code: (latitude, longitude)
+			for iso_code, latitude, longitude in Language.objects.filter(
+				iso_code__in=set(codes),
+				latitude__isnull=False, longitude__isnull=False
+			).values_list('iso_code', 'latitude', 'longitude')
+		}
+	
+	found, latitudes, longitudes, skipped = [], [], [], []
+	
+	for code in codes:
+		if code in locations:
+			found.append(code)
+			latitudes.append(locations[code][0])
+			longitudes.append(locations[code][1])
+		else:
+			skipped.append(code)
+	
+	return found, latitudes, longitudes, skipped
+
+
+
+def read_nearest(params, num_languages):
+	"""
+	Returns the number of nearest neighbours requested in the QueryDict's
+	nearest param, None if not set. Raises ValueError if the param is not
+	valid; asking for more neighbours than there are other languages is.
+	"""
+	if not params.get('nearest'):
+		return None
+	
+	limit = min(MAX_NEAREST, num_languages - 1)
+	
+	try:
+		assert limit >= 1
+	except AssertionError:
+		raise ValueError('Nearest neighbours need at least two languages.')
+	
+	try:
+		k = int(params['nearest'])
+		assert 1 <= k <= limit
+	except (ValueError, AssertionError):
+		raise ValueError('Nearest should be a number between 1 and {}.'.format(limit))
+	
+	return k
+
+
+
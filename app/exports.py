@@ -0,0 +1,204 @@
+"""
+Exporting maps as SVG images on the server. The SVG document is never built in
+memory: it is yielded piece by piece, so that it can be streamed to the client
+while the globe paths and the graph edges are still being written.
+"""
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+
+
+
+class SvgExport:
+	"""
+	The map is drawn in pixels: the projected coordinates (see app.projections)
+	are multiplied by the scale, so that the centre of the projection is at
+	(0, 0). The crop rectangle (left, top, width, height) is given in these
+	pixels too and becomes the viewBox of the image.
+	
+	Rings and edges that are entirely outside the crop rectangle are skipped.
+	"""
+	
+	colours = {
+		'ocean': '#3687AA',
+		'earth': '#ffffff',
+		'edge': '#F44A07',
+		'node': '#1D1E21',
+	}
+	
+	def __init__(self, projection, crop, scale=500, colours={}):
+		"""
+		Constructor. The colours dict can override any of the defaults.
+		"""
+		self.projection = projection
+		self.crop = crop
+		self.scale = scale
+		
+		self.colours = dict(self.colours)
+		self.colours.update(colours)
+	
+	
+	def iter_svg(self, features, graph=None):
+		"""
+		Yields the SVG document as strings. The features are these returned
+		by app.projections.project_geo_json; the graph, if any, is a dict as
+		returned by app.graphs.Graph.to_dict.
+		"""
+		left, top, width, height = self.crop
+		
+		yield (
+			'<?xml version="1.0" encoding="UTF-8"?>\n'
+			'<svg xmlns="http://www.w3.org/2000/svg" version="1.1" '
+			'width="{w}" height="{h}" viewBox="{l} {t} {w} {h}">\n'
+			'<defs><marker id="arrow" viewBox="0 0 10 10" refX="10" refY="5" '
+			'markerWidth="6" markerHeight="6" orient="auto">'
+			'<path d="M0,0L10,5L0,10z"/></marker></defs>\n'
+			'<rect x="{l}" y="{t}" width="{w}" height="{h}" fill={ocean}/>\n'
+		).format(
+			l=left, t=top, w=width, h=height,
+			ocean=quoteattr(self.colours['ocean']))
+		
+		yield '<g fill={} stroke="none">\n'.format(
+			quoteattr(self.colours['earth']))
+		yield from self.iter_globe(features)
+		yield '</g>\n'
+		
+		if graph is not None:
+			yield from self.iter_graph(graph)
+		
+		yield '</svg>\n'
+	
+	
+	def iter_globe(self, features):
+		"""
+		Yields a <path> element per feature. Each part of a feature becomes a
+		subpath, so that holes are cut out by the even-odd rule.
+		"""
+		for feature in features:
+			commands = []
+			for part in feature:
+				for ring in part:
+					command = self._ring_to_path(ring)
+					if command:
+						commands.append(command)
+			
+			if commands:
+				yield '<path fill-rule="evenodd" d="{}"/>\n'.format(
+					''.join(commands))
+	
+	
+	def iter_graph(self, graph):
+		"""
+		Yields the edges and then the nodes of the given graph dict. Nodes
+		that are hidden by the projection are skipped, as are their edges.
+		"""
+		names = sorted(graph['nodes'])
+		nodes = [graph['nodes'][name] for name in names]
+		
+		longitudes = [node['longitude'] for node in nodes]
+		latitudes = [node['latitude'] for node in nodes]
+		
+		x, y = self.projection.project(longitudes, latitudes)
+		visible = self.projection.is_visible(longitudes, latitudes)
+		
+		x = (x * self.scale).tolist()
+		y = (y * self.scale).tolist()
+		
+		points = {}
+		for index, name in enumerate(names):
+			if visible[index]:
+				points[name] = (x[index], y[index])
+		
+		yield '<g stroke={} fill="none">\n'.format(
+			quoteattr(self.colours['edge']))
+		
+		for edge in graph['edges']:
+			try:
+				x1, y1 = points[edge['head']]
+				x2, y2 = points[edge['tail']]
+			except KeyError:
+				continue
+			
+			if not self._intersects(min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)):
+				continue
+			
+			attrs = ''
+			if 'colour' in edge:
+				attrs += ' stroke={}'.format(quoteattr(edge['colour']))
+			if 'opacity' in edge:
+				attrs += ' stroke-opacity="{:.3f}"'.format(edge['opacity'])
+			if 'weight' in edge:
+				attrs += ' stroke-width="{:g}"'.format(edge['weight'])
+			if edge['is_directed']:
+				attrs += ' marker-end="url(#arrow)"'
+			
+			yield '<line x1="{:.1f}" y1="{:.1f}" x2="{:.1f}" y2="{:.1f}"{}/>\n'.format(
+				x1, y1, x2, y2, attrs)
+		
+		yield '</g>\n'
+		
+		yield '<g fill={} font-family="monospace" font-size="12">\n'.format(
+			quoteattr(self.colours['node']))
+		
+		for index, name in enumerate(names):
+			if name not in points:
+				continue
+			
+			cx, cy = points[name]
+			if not self._intersects(cx, cy, cx, cy):
+				continue
+			
+			attrs = ''
+			if 'colour' in nodes[index]:
+				attrs += ' fill={}'.format(quoteattr(nodes[index]['colour']))
+			if 'opacity' in nodes[index]:
+				attrs += ' fill-opacity="{:.3f}"'.format(nodes[index]['opacity'])
+			if 'strokecolour' in nodes[index]:
+				attrs += ' stroke={}'.format(quoteattr(nodes[index]['strokecolour']))
+			
+			text_attrs = ''
+			if 'fontcolour' in nodes[index]:
+				text_attrs += ' fill={}'.format(quoteattr(nodes[index]['fontcolour']))
+			
+			yield (
+				'<circle cx="{x:.1f}" cy="{y:.1f}" r="5"{a}/>'
+				'<text x="{x:.1f}" y="{ty:.1f}"{ta}>{name}</text>\n'
+			).format(
+				x=cx, y=cy, ty=cy - 8, a=attrs, ta=text_attrs,
+				name=escape(name))
+		
+		yield '</g>\n'
+	
+	
+	def _ring_to_path(self, ring):
+		"""
+		Returns the path commands of the given flat [x0, y0, x1, ...] ring or
+		the empty string if the ring is outside the crop rectangle.
+		"""
+		if len(ring) < 4:
+			return ''
+		
+		coords = np.array(ring, dtype=np.float64) * self.scale
+		xs, ys = coords[0::2], coords[1::2]
+		
+		if not self._intersects(xs.min(), ys.min(), xs.max(), ys.max()):
+			return ''
+		
+		pairs = ['{:.1f},{:.1f}'.format(x, y) for x, y in zip(xs.tolist(), ys.tolist())]
+		
+		return 'M' + 'L'.join(pairs) + 'Z'
+	
+	
+	def _intersects(self, min_x, min_y, max_x, max_y):
+		"""
+		Checks whether the given box intersects the crop rectangle.
+		"""
+		left, top, width, height = self.crop
+		
+		return not (
+			max_x < left or min_x > left + width
+			or max_y < top or min_y > top + height
+		)
+
+
+
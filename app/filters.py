@@ -0,0 +1,248 @@
+"""
+Server-side filtering of graphs: by a bounding box on the nodes' coordinates,
+by a subset of the nodes, by a minimum edge weight and by edge direction.
+
+The filters are evaluated over a GraphIndex, which is built once per Graph
+instance (see Graph.get_index), so that the cost of a filtered graph is about
+proportional to the size of the result:
+* the nodes are bucketed into a grid of CELL_SIZE degrees, so a bounding box
+only looks at the nodes in the cells it overlaps;
+* the edges are listed by their heads, so selecting nodes only looks at the
+edges going out of them;
+* the weighted edges are sorted by weight, so a minimum weight is a bisection.
+"""
+from bisect import bisect_left
+
+import math
+
+
+
+"""
+The side of the grid cells of the node index, in degrees.
+"""
+CELL_SIZE = 5
+
+
+"""
+The values of the edges param and the edge dicts of the Graph they select.
+"""
+EDGE_KINDS = {
+	'all': ('undirected', 'directed'),
+	'undirected': ('undirected',),
+	'directed': ('directed',),
+}
+
+
+
+class GraphFilter:
+	"""
+	The criteria for selecting a part of a graph. None means no criterion.
+	
+	The node criteria (bbox, subset) select the nodes and thus the edges, as
+	an edge is only kept if both its endpoints are; the edge criteria
+	(min_weight, edge kinds) select edges only and do not drop any nodes.
+	"""
+	
+	def __init__(self, bbox=None, subset=None, min_weight=None, kinds=None):
+		"""
+		Constructor. The bbox is a (west, south, east, north) tuple; if west
+		is greater than east, the box crosses the antimeridian. The subset is a
+		set of node names; the kinds are a tuple of EDGE_KINDS values.
+		"""
+		self.bbox = bbox
+		self.subset = subset
+		self.min_weight = min_weight
+		self.kinds = kinds or EDGE_KINDS['all']
+	
+	def is_empty(self):
+		"""
+		Returns True if the filter would keep the whole graph.
+		"""
+		return self.bbox is None and self.subset is None \
+			and self.min_weight is None and self.kinds == EDGE_KINDS['all']
+	
+	def selects_nodes(self):
+		"""
+		Returns True if the filter drops nodes.
+		"""
+		return self.bbox is not None or self.subset is not None
+
+
+
+def read_filter(params):
+	"""
+	Returns the GraphFilter instance described by the given QueryDict; its
+	is_empty method tells whether any filter is requested. Raises ValueError if
+	the params are not valid.
+		
+		bbox		# west,south,east,north in degrees
+		subset		# comma-separated node names
+		min_weight	# edges without weight are dropped too
+		edges		# all, undirected, or directed; defaults to all
+	"""
+	bbox = None
+	if params.get('bbox'):
+		try:
+			bbox = tuple(float(item) for item in params['bbox'].split(','))
+			assert len(bbox) == 4
+		except (ValueError, AssertionError):
+			raise ValueError('Bounding box should be west,south,east,north.')
+		
+		west, south, east, north = bbox
+		try:
+			assert -180 <= west <= 180 and -180 <= east <= 180
+			assert -90 <= south <= north <= 90
+		except AssertionError:
+			raise ValueError('Bounding box out of range.')
+	
+	subset = None
+	if params.get('subset'):
+		subset = set(item.strip() for item in params['subset'].split(','))
+		subset.discard('')
+	
+	min_weight = None
+	if params.get('min_weight'):
+		try:
+			min_weight = float(params['min_weight'])
+			assert math.isfinite(min_weight)
+		except (ValueError, AssertionError):
+			raise ValueError('Minimum weight should be a number.')
+	
+	try:
+		kinds = EDGE_KINDS[params.get('edges') or 'all']
+	except KeyError:
+		raise ValueError('Edges should be one of {}.'.format(
+			', '.join(sorted(EDGE_KINDS))))
+	
+	return GraphFilter(bbox, subset, min_weight, kinds)
+
+
+
+class GraphIndex:
+	"""
+	The indexes of a Graph instance that GraphFilter instances are evaluated
+	over. The index is a snapshot: it does not see changes to the graph.
+	"""
+	
+	def __init__(self, graph):
+		self.graph = graph
+		
+		self.cells = {}
+		for name, info in graph.nodes.items():
+			key = self.get_cell(info['latitude'], info['longitude'])
+			self.cells.setdefault(key, []).append(name)
+		
+		self.heads = {}
+		weighted = []
+		
+		for kind in EDGE_KINDS['all']:
+			for key, info in getattr(graph, kind).items():
+				self.heads.setdefault(key[0], []).append((kind, key))
+				if info.get('weight') is not None:
+					weighted.append((info['weight'], kind, key))
+		
+		weighted.sort(key=lambda item: item[0])
+		
+		self.weights = [item[0] for item in weighted]
+		self.weighted = [item[1:] for item in weighted]
+	
+	@staticmethod
+	def get_cell(latitude, longitude):
+		"""
+		Returns the (row, column) key of the grid cell of the given position.
+		"""
+		return math.floor(latitude / CELL_SIZE), math.floor(longitude / CELL_SIZE)
+	
+	def select(self, graph_filter):
+		"""
+		Returns a new Graph instance with the nodes and edges that pass the
+		given GraphFilter. The node and edge dicts are shared with the indexed
+		graph, not copied.
+		"""
+		graph = self.graph.__class__()
+		graph.name = self.graph.name
+		
+		if graph_filter.selects_nodes():
+			names = self.select_nodes(graph_filter.bbox, graph_filter.subset)
+			graph.nodes = {name: self.graph.nodes[name] for name in names}
+		else:
+			graph.nodes = dict(self.graph.nodes)
+		
+		for kind, key in self.iter_edge_candidates(graph_filter, graph.nodes):
+			info = getattr(self.graph, kind)[key]
+			
+			if kind not in graph_filter.kinds:
+				continue
+			
+			if graph_filter.min_weight is not None:
+				weight = info.get('weight')
+				if weight is None or weight < graph_filter.min_weight:
+					continue
+			
+			if key[0] not in graph.nodes or key[1] not in graph.nodes:
+				continue
+			
+			getattr(graph, kind)[key] = info
+		
+		return graph
+	
+	def select_nodes(self, bbox, subset):
+		"""
+		Returns the set of the names of the nodes that are within the given
+		bbox and subset, either of which can be None.
+		"""
+		if bbox is None:
+			return {name for name in subset if name in self.graph.nodes}
+		
+		west, south, east, north = bbox
+		
+		if west <= east:
+			ranges = [(west, east)]
+		else:
+			ranges = [(west, 180), (-180, east)]
+		
+		bottom, top = self.get_cell(south, 0)[0], self.get_cell(north, 0)[0]
+		names = set()
+		
+		for left, right in ranges:
+			first, last = self.get_cell(0, left)[1], self.get_cell(0, right)[1]
+			
+			for row in range(bottom, top + 1):
+				for column in range(first, last + 1):
+					for name in self.cells.get((row, column), []):
+						if subset is not None and name not in subset:
+							continue
+						
+						info = self.graph.nodes[name]
+						if south <= info['latitude'] <= north \
+								and left <= info['longitude'] <= right:
+							names.add(name)
+		
+		return names
+	
+	def iter_edge_candidates(self, graph_filter, nodes):
+		"""
+		Yields the (kind, key) tuples of the edges that might pass the given
+		filter, the given nodes being those that it selects. The cheapest
+		index available is used: the edges going out of the selected nodes,
+		the edges heavy enough, or else all the edges of the requested kinds.
+		"""
+		min_weight = graph_filter.min_weight
+		
+		if min_weight is not None:
+			start = bisect_left(self.weights, min_weight)
+			num_weighted = len(self.weights) - start
+		
+		if graph_filter.selects_nodes() and (min_weight is None
+				or sum(len(self.heads.get(name, [])) for name in nodes) < num_weighted):
+			for name in nodes:
+				yield from self.heads.get(name, [])
+		elif min_weight is not None:
+			yield from self.weighted[start:]
+		else:
+			for kind in graph_filter.kinds:
+				for key in getattr(self.graph, kind):
+					yield kind, key
+
+
+
@@ -0,0 +1,315 @@
+"""
+Helpers for the GeoJSON strings that globes are made of.
+"""
+from utils.json import JsonStream
+
+import codecs
+import hashlib
+import json
+import math
+
+
+
+"""
+Positions may exceed the longitude and latitude ranges by this many degrees,
+as real data (e.g. Natural Earth) has rounding errors at the antimeridian.
+"""
+RANGE_TOLERANCE = 1e-6
+
+
+"""
+The nesting depth of the positions within the coordinates of each geometry
+type, e.g. a Polygon is a list of rings, i.e. of lists of positions.
+"""
+GEOMETRY_DEPTHS = {
+	'Point': 0,
+	'MultiPoint': 1,
+	'LineString': 1,
+	'MultiLineString': 2,
+	'Polygon': 2,
+	'MultiPolygon': 3,
+}
+
+
+
+def read_metadata(geo_json):
+	"""
+	Returns the dict of metadata that is stored alongside a globe's GeoJSON:
+	byte_size, feature_count, bbox and content_hash. The bbox follows the
+	GeoJSON order (west, south, east, north) and is None if the string does
+	not contain any positions.
+	
+	Raises ValueError if the string is not valid JSON.
+	"""
+	if isinstance(geo_json, bytes):
+		raw = geo_json
+		geo_json = geo_json.decode()
+	else:
+		raw = geo_json.encode()
+	
+	data = json.loads(geo_json)
+	
+	feature_count = 0
+	bbox = None
+	
+	for feature in iter_features(data):
+		feature_count += 1
+		bbox = extend_bbox(bbox, iter_positions(feature.get('geometry')))
+	
+	return {
+		'byte_size': len(raw),
+		'feature_count': feature_count,
+		'bbox': bbox,
+		'content_hash': hashlib.sha256(raw).hexdigest()
+	}
+
+
+
+def extend_bbox(bbox, positions):
+	"""
+	Returns the (west, south, east, north) bbox that encloses the given bbox
+	and the given (longitude, latitude) tuples. The bbox can be None, as is
+	the returned one if there are no positions either.
+	"""
+	if bbox is None:
+		west, south, east, north = None, None, None, None
+	else:
+		west, south, east, north = bbox
+	
+	for longitude, latitude in positions:
+		if west is None:
+			west, east = longitude, longitude
+			south, north = latitude, latitude
+			continue
+		
+		if longitude < west:
+			west = longitude
+		elif longitude > east:
+			east = longitude
+		
+		if latitude < south:
+			south = latitude
+		elif latitude > north:
+			north = latitude
+	
+	if west is None:
+		return None
+	
+	return (west, south, east, north)
+
+
+
+def read_geo_json_file(f, max_features=None, chunk_size=1024 * 64):
+	"""
+	Reads the GeoJSON FeatureCollection in the given binary file, e.g. an
+	uploaded one, and validates it on the way: the structure of the collection
+	and of each feature, the ranges of the coordinates and, if a maximum is
+	given, the number of features. The file is read in chunks and only one
+	feature at a time is decoded, so the object tree of the whole collection
+	is never built.
+	
+	Returns the (geo_json, metadata) tuple of the decoded string and the dict
+	of its metadata as returned by read_metadata. Raises ValueError with a
+	message that is fit for the user.
+	"""
+	reader = HashingReader(f)
+	stream = JsonStream(reader, chunk_size)
+	
+	feature_count = 0
+	bbox = None
+	is_collection = False
+	
+	try:
+		stream.expect('{')
+		
+		while True:
+			key = stream.decode()
+			if not isinstance(key, str):
+				raise ValueError('Invalid JSON object.')
+			stream.expect(':')
+			
+			if key == 'features':
+				stream.expect('[')
+				
+				closed = stream.peek() == ']'
+				if closed:
+					stream.expect(']')
+				
+				while not closed:
+					feature_count += 1
+					if max_features is not None and feature_count > max_features:
+						raise ValueError('There are more than {} features.'.format(
+							max_features))
+					
+					try:
+						positions = iter_valid_positions(stream.decode())
+						bbox = extend_bbox(bbox, positions)
+					except ValueError as error:
+						raise ValueError('Feature {}: {}'.format(feature_count, error))
+					
+					closed = stream.expect(',]') == ']'
+			else:
+				value = stream.decode()
+				if key == 'type':
+					is_collection = value == 'FeatureCollection'
+			
+			if stream.expect(',}') == '}':
+				break
+		
+		if stream.peek():
+			raise ValueError('Unexpected data after the JSON object.')
+	except UnicodeDecodeError:
+		raise ValueError('The file is not UTF-8 encoded.')
+	
+	if not is_collection:
+		raise ValueError('The file is not a GeoJSON FeatureCollection.')
+	
+	if not feature_count:
+		raise ValueError('The collection has no features.')
+	
+	return ''.join(reader.pieces), {
+		'byte_size': reader.byte_size,
+		'feature_count': feature_count,
+		'bbox': bbox,
+		'content_hash': reader.hash.hexdigest()
+	}
+
+
+
+class HashingReader:
+	"""
+	Wraps a binary file into a UTF-8 text file that keeps track of the size,
+	hash and decoded text of what has been read so far.
+	"""
+	
+	def __init__(self, f):
+		self.f = f
+		self.decoder = codecs.getincrementaldecoder('utf-8')()
+		self.hash = hashlib.sha256()
+		self.byte_size = 0
+		self.pieces = []
+	
+	def read(self, size):
+		"""
+		Returns the next piece of text, of at most the given size in bytes;
+		returns the empty string only at the end of the file.
+		"""
+		while True:
+			chunk = self.f.read(size)
+			
+			self.hash.update(chunk)
+			self.byte_size += len(chunk)
+			
+			text = self.decoder.decode(chunk, final=not chunk)
+			if text or not chunk:
+				self.pieces.append(text)
+				return text
+
+
+
+def iter_valid_positions(feature):
+	"""
+	Validates the given GeoJSON feature and yields the (longitude, latitude)
+	tuples of its geometry. Raises ValueError if the feature is malformed or
+	a position is out of range.
+	"""
+	if not isinstance(feature, dict) or feature.get('type') != 'Feature':
+		raise ValueError('Not a GeoJSON feature.')
+	
+	geometries = [feature.get('geometry')]
+	
+	while geometries:
+		geometry = geometries.pop()
+		if geometry is None:
+			continue
+		
+		if not isinstance(geometry, dict):
+			raise ValueError('Invalid geometry.')
+		
+		kind = geometry.get('type')
+		
+		if kind == 'GeometryCollection':
+			if not isinstance(geometry.get('geometries'), list):
+				raise ValueError('Invalid geometry collection.')
+			geometries.extend(geometry['geometries'])
+			continue
+		
+		if kind not in GEOMETRY_DEPTHS:
+			raise ValueError('Unknown geometry type.')
+		
+		stack = [(geometry.get('coordinates'), GEOMETRY_DEPTHS[kind])]
+		
+		while stack:
+			item, depth = stack.pop()
+			if not isinstance(item, list):
+				raise ValueError('Invalid {} coordinates.'.format(kind))
+			
+			if depth:
+				stack.extend((child, depth - 1) for child in item)
+				continue
+			
+			try:
+				assert len(item) >= 2
+				longitude, latitude = float(item[0]), float(item[1])
+				assert not isinstance(item[0], (bool, str))
+				assert not isinstance(item[1], (bool, str))
+			except (AssertionError, TypeError, ValueError):
+				raise ValueError('Invalid {} position.'.format(kind))
+			
+			if not (math.isfinite(longitude) and math.isfinite(latitude)) \
+					or abs(longitude) > 180 + RANGE_TOLERANCE \
+					or abs(latitude) > 90 + RANGE_TOLERANCE:
+				raise ValueError('Position out of range: {}, {}.'.format(
+					item[0], item[1]))
+			
+			yield item[0], item[1]
+
+
+
+def iter_features(data):
+	"""
+	Yields the feature dicts of the given GeoJSON object. Bare geometries are
+	treated as a single feature.
+	"""
+	if not isinstance(data, dict):
+		return
+	
+	if data.get('type') == 'FeatureCollection':
+		for feature in data.get('features') or []:
+			if isinstance(feature, dict):
+				yield feature
+	elif data.get('type') == 'Feature':
+		yield data
+	elif 'type' in data:
+		yield {'type': 'Feature', 'geometry': data, 'properties': {}}
+
+
+
+def iter_positions(geometry):
+	"""
+	Yields the (longitude, latitude) tuples of the given GeoJSON geometry,
+	including these of the members of geometry collections.
+	"""
+	if not isinstance(geometry, dict):
+		return
+	
+	if geometry.get('type') == 'GeometryCollection':
+		for member in geometry.get('geometries') or []:
+			yield from iter_positions(member)
+		return
+	
+	stack = [geometry.get('coordinates')]
+	
+	while stack:
+		item = stack.pop()
+		if not isinstance(item, list) or not item:
+			continue
+		
+		if isinstance(item[0], (int, float)):
+			if len(item) >= 2:
+				yield (item[0], item[1])
+		else:
+			stack.extend(item)
+
+
+
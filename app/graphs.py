@@ -2,9 +2,189 @@
 Graph instances combine the relevant information from .dot files and the
 languages geographical coordinates.
 """
+from django.conf import settings
+
+from app import warmup
+from app.filters import GraphIndex
+from app.profiling import phase
 from app.models import Language
 
+import csv
+import io
+import math
+import multiprocessing
 import re
+import time
+import tracemalloc
+
+import numpy as np
+
+
+
+"""
+The values of the directed column of edge lists that mark directed edges;
+anything else makes for an undirected edge.
+"""
+DIRECTED_VALUES = ('1', 'true', 'yes', 'directed', '->',)
+
+
+"""
+The number of chunks of subgraphs per worker of a parallel parse, so that the
+workers stay busy even if the subgraphs are of uneven sizes.
+"""
+CHUNKS_PER_WORKER = 4
+
+
+"""
+Matches everything but braces, for split_subgraphs to scan these.
+"""
+BRACES_REGEX = re.compile(r'[^{}]+')
+
+
+"""
+The tokens that iter_dot_statements scans for: those of Graph.clean_regex,
+the semicolons that end statements, and runs of anything else. The last
+alternative matches what the end of the text leaves unterminated, which is
+then read as Graph.clean_regex reads it.
+"""
+STATEMENT_REGEX = re.compile(
+	r'''
+	(?P<quoted>"[^"\\]*(?:\\.[^"\\]*)*")
+	|(?P<comment>/\*.*?\*/|//[^\n]*\n)
+	|(?P<newlines>\n+)
+	|(?P<bracket>[][{}])
+	|(?P<semicolon>;)
+	|(?P<text>[^"/\n[\]{};]+|/(?![/*]))
+	|(?P<unterminated>"|/\*.*|//[^\n]*)
+	''',
+	flags = re.DOTALL | re.VERBOSE
+)
+
+
+
+class ParseBudgetExceeded(ValueError):
+	"""
+	Raised when parsing a .dot string exceeds its ParseBudget.
+	"""
+	pass
+
+
+
+class ParseBudget:
+	"""
+	Limits the work that a single parse may do, so that pathological input is
+	rejected instead of pinning a worker: the number of tokens (statements and
+	attributes), the nesting depth of braces and brackets, and the wall-clock
+	seconds counted from the budget's creation. None means no limit.
+	
+	The bytes of max_memory are the limit of the peak memory allocated by the
+	current phase of the parse, which is only known, and thus only checked,
+	while a memory profile is active (see app.profiling). It is not checked
+	by the worker processes of a parallel parse (see parse_subgraph_chunk).
+	"""
+	
+	def __init__(self, max_tokens=None, max_depth=None, max_seconds=None,
+			max_memory=None):
+		"""
+		Constructor.
+		"""
+		self.max_tokens = max_tokens
+		self.max_depth = max_depth
+		self.max_memory = max_memory
+		
+		self.tokens = 0
+		
+		if max_seconds is None:
+			self.deadline = None
+		else:
+			self.deadline = time.monotonic() + max_seconds
+	
+	@classmethod
+	def from_settings(cls, name='PARSE_BUDGET'):
+		"""
+		Returns a new budget with the limits of the given settings dict.
+		"""
+		return cls(**getattr(settings, name, {}))
+	
+	def spend(self, tokens=1):
+		"""
+		Accounts for the given number of tokens. Raises ParseBudgetExceeded if
+		there are too many of them, if the deadline has passed, or if the
+		memory is over the limit.
+		"""
+		self.tokens += tokens
+		
+		if self.max_tokens is not None and self.tokens > self.max_tokens:
+			raise ParseBudgetExceeded('The file has too many statements.')
+		
+		if self.deadline is not None and time.monotonic() > self.deadline:
+			raise ParseBudgetExceeded('The file took too long to parse.')
+		
+		if self.max_memory is not None and tracemalloc.is_tracing():
+			if tracemalloc.get_traced_memory()[1] > self.max_memory:
+				raise ParseBudgetExceeded('The file takes too much memory to parse.')
+	
+	def enter(self, depth):
+		"""
+		Raises ParseBudgetExceeded if the given nesting depth is too deep.
+		"""
+		if self.max_depth is not None and depth > self.max_depth:
+			raise ParseBudgetExceeded('The file is nested too deeply.')
+
+
+
+class EdgeAggregation:
+	"""
+	The policy for merging an edge into an equal one already in a graph, i.e.
+	one between the same nodes in the same direction or, if undirected, in
+	either direction. The weights are summed, maxed, or the first or the last
+	kept; the styling (colour and opacity) is that of the first or the last.
+	"""
+	
+	weight_policies = ('sum', 'max', 'first', 'last',)
+	style_policies = ('first', 'last',)
+	
+	def __init__(self, weight='last', style='last'):
+		"""
+		Constructor. Raises ValueError if a policy is not known. The defaults
+		amount to the last edge replacing the others.
+		"""
+		if weight not in self.weight_policies or style not in self.style_policies:
+			raise ValueError('Unknown edge aggregation policy.')
+		
+		self.weight = weight
+		self.style = style
+	
+	@classmethod
+	def from_settings(cls):
+		"""
+		Returns the policy of the EDGE_AGGREGATION settings dict.
+		"""
+		return cls(**getattr(settings, 'EDGE_AGGREGATION', {}))
+	
+	def merge(self, old, new):
+		"""
+		Returns the information dict of the merger of the given edges'.
+		"""
+		if self.style == 'first':
+			merged = {key: old[key] for key in ('colour', 'opacity',) if key in old}
+		else:
+			merged = {key: new[key] for key in ('colour', 'opacity',) if key in new}
+		
+		weights = [item['weight'] for item in (old, new) if 'weight' in item]
+		
+		if self.weight == 'first':
+			weights = [old['weight']] if 'weight' in old else []
+		elif self.weight == 'last':
+			weights = [new['weight']] if 'weight' in new else []
+		
+		if weights:
+			if self.weight == 'sum':
+				merged['weight'] = sum(weights)
+			else:
+				merged['weight'] = max(weights)
+		
+		return merged
 
 
 
@@ -15,28 +195,56 @@ class Graph:
 	and/or strokecolour.
 	
 	The edge dicts are of the form (node, node): {}. The latter might contain
-	the edge's weight, colour, and/or opacity.
+	the edge's weight, colour, and/or opacity. The keys of the undirected
+	edges are canonical, i.e. sorted, so that an edge is only listed once
+	whichever way round it is given; see add_edge.
 	"""
 	
-	def __init__(self):
+	def __init__(self, languages=None, aggregation=None):
 		"""
-		Constructor.
+		Constructor. The languages, if given, is a {iso_code: (latitude,
+		longitude)} table (see app.warmup.load_language_table) that replaces
+		the database as the source of the nodes' locations. Otherwise the
+		table warmed up by app.warmup is used, if any.
+		
+		The aggregation is the EdgeAggregation instance that merges repeated
+		edges; defaults to the EDGE_AGGREGATION setting.
 		"""
 		self.name = ''
 		self.nodes = {}
 		self.undirected = {}
 		self.directed = {}
+		
+		self.languages = languages
+		
+		if aggregation is None:
+			aggregation = EdgeAggregation.from_settings()
+		self.aggregation = aggregation
+		self.skipped = set()
+		
+		self.index = None
 	
 	
-	def add_node(self, node_name, information={}):
+	def add_node(self, node_name, information=None):
 		"""
-		Only adds nodes that are present in the database.
+		Only adds nodes that are present in the database (or the languages
+		table, see the constructor) with their locations. The names of the
+		others are collected in self.skipped. Raises ValueError if a given
+		coordinate is not finite: NaN and the infinities are not valid JSON.
 		"""
+		if information is None:
+			information = {}
+		
 		try:
-			lang = Language.objects.get(iso_code=node_name)
-			assert type(lang.latitude) is float
-			assert type(lang.longitude) is float
-		except (Language.DoesNotExist, AssertionError):
+			for key in ('latitude', 'longitude'):
+				if key in information:
+					assert math.isfinite(information[key])
+		except AssertionError:
+			raise ValueError('Node coordinates should be finite numbers.')
+		
+		lang = self.find_language(node_name)
+		if lang is None:
+			self.skipped.add(node_name)
 			return
 		
 		try:
@@ -49,86 +257,419 @@ class Graph:
 		except AssertionError:
 			return
 		
+		iso_code, latitude, longitude = lang
+		
+		self.index = None
+		
 		if 'latitude' not in information:
-			information['latitude'] = lang.latitude
+			information['latitude'] = latitude
 		if 'longitude' not in information:
-			information['longitude'] = lang.longitude
+			information['longitude'] = longitude
 		
-		self.nodes[lang.iso_code] = information
+		self.nodes[iso_code] = information
 	
 	
-	def add_edge(self, node_one, node_two, is_directed=False, information={}):
+	def find_language(self, node_name):
 		"""
-		Only adds edges between already known nodes.
+		Returns the (iso_code, latitude, longitude) tuple of the given language
+		or None if the language or its location is not known.
 		"""
+		languages = self.languages
+		if languages is None:
+			languages = warmup.languages
+		
+		if languages is not None:
+			try:
+				latitude, longitude = languages[node_name]
+			except KeyError:
+				return None
+			return node_name, latitude, longitude
+		
+		try:
+			lang = Language.objects.get(iso_code=node_name)
+			assert type(lang.latitude) is float
+			assert type(lang.longitude) is float
+		except (Language.DoesNotExist, AssertionError):
+			return None
+		
+		return lang.iso_code, lang.latitude, lang.longitude
+	
+	
+	def add_edge(self, node_one, node_two, is_directed=False, information=None):
+		"""
+		Only adds edges between already known nodes. Returns the key of the
+		edge, or None if the edge is not added. An edge that is already in the
+		graph is merged with the given one by the graph's EdgeAggregation.
+		Raises ValueError if the given weight is not finite, as add_node.
+		"""
+		if information is None:
+			information = {}
+		
+		if information.get('weight') is not None:
+			try:
+				assert math.isfinite(information['weight'])
+			except AssertionError:
+				raise ValueError('Edge weights should be finite numbers.')
+		
 		try:
 			assert node_one in self.nodes
 			assert node_two in self.nodes
 		except AssertionError:
-			return
+			return None
 		
 		try:
 			for key in information:
 				assert key in ('weight', 'colour', 'opacity',)
 		except AssertionError:
-			return
+			return None
+		
+		self.index = None
 		
 		if is_directed:
-			# self.directed.add((node_one, node_two, information['weight']))
-			self.directed[(node_one, node_two)] = information
+			edges = self.directed
+			key = (node_one, node_two)
+		else:
+			edges = self.undirected
+			key = (min(node_one, node_two), max(node_one, node_two))
+		
+		if key in edges:
+			edges[key] = self.aggregation.merge(edges[key], information)
 		else:
-			# self.undirected.add((node_one, node_two, information['weight']))
-			self.undirected[(node_one, node_two)] = information
+			edges[key] = information
+		
+		return key
 	
 	
-	def read_dot_string(self, string):
+	def read_dot_string(self, string, budget=None, workers=None):
 		"""
 		Populates the graph with the contents of the .dot string given.
 		http://www.graphviz.org/doc/info/lang.html
+		
+		The parse is limited by the given ParseBudget, which defaults to the
+		PARSE_BUDGET setting. Raises ValueError (ParseBudgetExceeded if the
+		budget runs out).
+		
+		Large strings can have their subgraphs parsed by a pool of the given
+		number of worker processes, which defaults to the PARSE_WORKERS
+		setting; see GraphElement.parse_subgraphs.
+		"""
+		for item in self.iter_dot_string(string, budget, workers):
+			pass
+	
+	
+	def iter_dot_string(self, string, budget=None, workers=None):
+		"""
+		Generator version of read_dot_string: populates the graph one
+		statement at a time and yields what each statement has added, i.e.
+		('node', node_name) and ('edge', (is_directed, (head, tail))) tuples.
+		Statements naming an already added node or edge yield it again.
+		
+		The whole string is parsed before the first item is yielded, so
+		ValueError is raised, if at all, before the graph is touched; save for
+		the coordinates that add_node rejects, which are only checked then.
+		"""
+		if budget is None:
+			budget = ParseBudget.from_settings()
+		
+		if workers is None:
+			workers = getattr(settings, 'PARSE_WORKERS', 1)
+		
+		with phase('clean'):
+			string = self._clean_dot_string(string, budget)
+		
+		with phase('parse'):
+			graph_elem = GraphElement(budget, workers)
+			graph_elem.parse(string)
+		
+		with phase('populate'):
+			yield from graph_elem.iter_populate(self)
+	
+	
+	def iter_dot_lines(self, lines, budget=None):
+		"""
+		Streaming version of iter_dot_string: the .dot text is given as an
+		iterable of strings, e.g. the lines of a file, and is read one
+		top-level statement at a time (see iter_dot_statements), each
+		statement populating the graph before the next one is read. The
+		graph's name is set before the first item is yielded.
+		
+		Unlike iter_dot_string, which adds all the nodes before the edges, the
+		statements are added in the order of the text: an edge is only added
+		if the statements of its nodes precede it. ValueError can be raised
+		after some items are yielded.
+		"""
+		if budget is None:
+			budget = ParseBudget.from_settings()
+		
+		statements = iter_dot_statements(lines, budget)
+		self.name = next(statements)
+		
+		for statement in statements:
+			subgraphs, rest = SubgraphElement.parse_all(statement, budget)
+			nodes, _ = NodeStmtElement.parse_all(rest, budget)
+			
+			for node in nodes:
+				node.populate(self)
+				if node.name in self.nodes:
+					yield 'node', node.name
+			
+			for subgraph in subgraphs:
+				yield from subgraph.iter_populate(self)
+	
+	
+	def read_edge_list(self, edges, nodes=None, delimiter=',', budget=None):
+		"""
+		Populates the graph with the rows of the given edge list and, if given,
+		node table. These are CSV strings or iterables of CSV lines, e.g. open
+		files, and are read one row at a time straight into the graph. Each of
+		them starts with a header row naming its columns:
+		
+		edges	# head, tail; optionally directed, weight, colour
+		nodes	# name; optionally latitude, longitude, colour, fontcolour,
+				# strokecolour
+		
+		The endpoints of the edges are added as nodes unless the node table
+		already has them. The values are validated by add_node and add_edge.
+		
+		The parse is limited by the given ParseBudget as in read_dot_string.
+		Raises ValueError if a header lacks a required column, if the CSV is
+		malformed, or if a weight or a coordinate is not finite (NaN and the
+		infinities would not make valid JSON).
+		"""
+		for item in self.iter_edge_list(edges, nodes, delimiter, budget):
+			pass
+	
+	
+	def iter_edge_list(self, edges, nodes=None, delimiter=',', budget=None):
+		"""
+		Generator version of read_edge_list, yielding what each row has added
+		as iter_dot_string does. Unlike there, the rows are parsed as they are
+		read, so ValueError can be raised after some items are yielded.
+		"""
+		if budget is None:
+			budget = ParseBudget.from_settings()
+		
+		if nodes is not None:
+			for row in self._iter_csv_rows(nodes, delimiter, ('name',), budget):
+				information = {}
+				
+				for item in ('latitude', 'longitude'):
+					try:
+						information[item] = float(row[item])
+					except (KeyError, TypeError, ValueError):
+						continue
+				
+				if row.get('colour'):
+					colour, opacity = AttrStmtElement.parse_colour(row['colour'])
+					information['colour'] = colour
+					if opacity is not None:
+						information['opacity'] = opacity
+				
+				for item in ('fontcolour', 'strokecolour'):
+					if row.get(item):
+						information[item] = row[item]
+				
+				self.add_node(row['name'], information)
+				if row['name'] in self.nodes:
+					yield 'node', row['name']
+		
+		tried = set(self.nodes)
+		
+		for row in self._iter_csv_rows(edges, delimiter, ('head', 'tail'), budget):
+			for name in (row['head'], row['tail']):
+				if name not in tried:
+					self.add_node(name)
+					tried.add(name)
+					if name in self.nodes:
+						yield 'node', name
+			
+			information = {}
+			
+			weight = row.get('weight')
+			if weight:
+				try:
+					information['weight'] = int(weight)
+				except ValueError:
+					try:
+						information['weight'] = float(weight)
+					except ValueError:
+						pass
+			
+			if row.get('colour'):
+				colour, opacity = AttrStmtElement.parse_colour(row['colour'])
+				information['colour'] = colour
+				if opacity is not None:
+					information['opacity'] = opacity
+			
+			is_directed = (row.get('directed') or '').lower() in DIRECTED_VALUES
+			
+			key = self.add_edge(row['head'], row['tail'], is_directed, information)
+			if key is not None:
+				yield 'edge', (is_directed, key)
+	
+	
+	def _iter_csv_rows(self, lines, delimiter, required, budget):
+		"""
+		Helper for read_edge_list. Yields the rows of the given CSV as dicts
+		of stripped values, short rows padded with empty strings, spending a
+		budget token per row.
+		"""
+		if isinstance(lines, str):
+			lines = io.StringIO(lines, newline='')
+		
+		reader = csv.reader(lines, delimiter=delimiter)
+		
+		try:
+			header = [item.strip().lower() for item in next(reader)]
+		except StopIteration:
+			raise ValueError('The table is empty.')
+		except csv.Error:
+			raise ValueError('The table could not be read.')
+		
+		for column in required:
+			if column not in header:
+				raise ValueError('The table lacks the {} column.'.format(column))
+		
+		try:
+			for row in reader:
+				if not row:
+					continue
+				budget.spend()
+				values = [item.strip() for item in row]
+				values += [''] * (len(header) - len(values))
+				yield dict(zip(header, values))
+		except csv.Error:
+			raise ValueError('The table could not be read.')
+	
+	
+	"""
+	The tokens that _clean_dot_string scans for: quoted strings (which are
+	kept), comments (which are dropped, an unterminated block comment running
+	to the end), newlines, and the brackets that make up the nesting depth.
+	None of the alternatives can backtrack into another, so the scan is linear.
+	"""
+	clean_regex = re.compile(
+		r'''
+		(?P<quoted>"[^"\\]*(?:\\.[^"\\]*)*")
+		|(?P<comment>/\*.*?\*/|/\*.*|//[^\n]*)
+		|(?P<newlines>\n+)
+		|(?P<bracket>[][{}])
+		''',
+		flags = re.DOTALL | re.VERBOSE
+	)
+	
+	def _clean_dot_string(self, string, budget=None):
+		"""
+		Returns the given .dot string without comments and newlines. Comment
+		markers within quoted strings are left alone.
+		
+		If a ParseBudget is given, the nesting depth is checked against it.
+		"""
+		depth = 0
+		
+		def replace(match):
+			nonlocal depth
+			
+			if match.lastgroup == 'quoted':
+				return match.group().replace('\n', ' ')
+			
+			if match.lastgroup == 'bracket':
+				if match.group() in '{[':
+					depth += 1
+					if budget is not None:
+						budget.enter(depth)
+				else:
+					depth -= 1
+				return match.group()
+			
+			return ' '
+		
+		return self.clean_regex.sub(replace, string)
+	
+	
+	def project(self, projection):
+		"""
+		Returns {node: (x, y)} with the nodes' coordinates projected by the
+		given app.projections.Projection instance in a single batch.
+		"""
+		names = list(self.nodes)
+		
+		longitudes = np.fromiter(
+			(self.nodes[name]['longitude'] for name in names),
+			dtype=np.float64, count=len(names))
+		latitudes = np.fromiter(
+			(self.nodes[name]['latitude'] for name in names),
+			dtype=np.float64, count=len(names))
+		
+		x, y = projection.project(longitudes, latitudes)
+		
+		return dict(zip(names, zip(x.tolist(), y.tolist())))
+	
+	
+	def get_index(self):
+		"""
+		Returns the app.filters.GraphIndex of the graph, building it on the
+		first call. Adding nodes or edges drops the index; the graph's dicts
+		should not be changed directly once it is built.
 		"""
-		string = self._clean_dot_string(string)
+		if self.index is None:
+			self.index = GraphIndex(self)
 		
-		graph_elem = GraphElement()
-		graph_elem.parse(string)
-		graph_elem.populate(self)
+		return self.index
 	
 	
-	def _clean_dot_string(self, string):
+	def filter(self, graph_filter):
 		"""
-		Returns the given .dot string without comments and newlines.
+		Returns a new Graph instance with the nodes and edges that pass the
+		given app.filters.GraphFilter; returns the graph itself if the filter
+		is empty.
 		"""
-		string = re.sub(
-			r'(/\*.*\*/|//.*?$|[\n]+)',
-			' ',
-			string,
-			flags = re.DOTALL | re.MULTILINE
-		)
-		return string
+		if graph_filter.is_empty():
+			return self
+		
+		return self.get_index().select(graph_filter)
 	
 	
-	def to_dict(self):
+	def get_edge_dict(self, is_directed, key):
 		"""
-		Returns the graph as dict ready for JSON serialisation.
+		Returns the dict of the given edge as listed by to_dict.
 		"""
+		if is_directed:
+			item = self.directed[key]
+		else:
+			item = self.undirected[key]
+		
+		d = {'head': key[0], 'tail': key[1], 'is_directed': is_directed}
+		for attr in ('weight', 'colour', 'opacity',):
+			if attr in item:
+				d[attr] = item[attr]
+		
+		return d
+	
+	
+	def to_dict(self, projection=None):
+		"""
+		Returns the graph as dict ready for JSON serialisation. If a projection
+		is given, the nodes also get their planar x and y coordinates.
+		"""
+		nodes = self.nodes
+		
+		if projection is not None:
+			nodes = {}
+			for name, (x, y) in self.project(projection).items():
+				nodes[name] = dict(self.nodes[name], x=x, y=y)
+		
 		edges = []
 		
-		for key, item in self.undirected.items():
-			d = {'head': key[0], 'tail': key[1], 'is_directed': False}
-			for attr in ('weight', 'colour', 'opacity',):
-				if attr in item:
-					d[attr] = item[attr]
-			edges.append(d)
+		for key in self.undirected:
+			edges.append(self.get_edge_dict(False, key))
 		
-		for key, item in self.directed.items():
-			d = {'head': key[0], 'tail': key[1], 'is_directed': True}
-			for attr in ('weight', 'colour', 'opacity',):
-				if attr in item:
-					d[attr] = item[attr]
-			edges.append(d)
+		for key in self.directed:
+			edges.append(self.get_edge_dict(True, key))
 		
 		return {
 			'name': self.name,
-			'nodes': self.nodes,
+			'nodes': nodes,
 			'edges': edges
 		}
 
@@ -138,17 +679,77 @@ class Element:
 	"""
 	All .dot language elements should define:
 	* self.regex: as class property in order to avoid re-compilation.
-	* self.parse(string): raising ValueError if the regex fails.
+	* self.read_match(match): reads the element out of a match of the regex,
+	raising ValueError if it is not valid.
 	* self.populate(graph): adds nodes/edges to the given Graph instance.
 	Element subclass instances are helpers for parsing the .dot language.
+	
+	Elements are given the ParseBudget of the parse, if any, and spend a token
+	for each statement and attribute they read.
 	"""
 	regex = None
 	
+	def __init__(self, budget=None):
+		self.budget = budget
+	
 	def parse(self, string):
-		return True
+		"""
+		Reads the first match of the regex in the given string and returns the
+		string without it. Raises ValueError if there is no match.
+		"""
+		match = self.regex.search(string)
+		
+		if match is None:
+			raise ValueError()
+		
+		self.read_match(match)
+		
+		return string[:match.start()] + string[match.end():]
+	
+	def read_match(self, match):
+		pass
 	
 	def populate(self, graph):
 		pass
+	
+	def spend(self, tokens=1):
+		if self.budget is not None:
+			self.budget.spend(tokens)
+	
+	@classmethod
+	def parse_all(cls, string, budget=None):
+		"""
+		Returns the (elements, rest) tuple of the elements of this class in the
+		given string and the string without them. Equivalent to calling parse
+		until it raises ValueError, but each pass over the string reads all the
+		matches at once, which keeps the parse linear rather than quadratic in
+		the number of statements. A further pass is only fruitful if removing
+		the matches has given rise to new ones.
+		"""
+		elements = []
+		
+		while True:
+			pieces = []
+			end = 0
+			
+			for match in cls.regex.finditer(string):
+				element = cls(budget)
+				try:
+					element.read_match(match)
+				except ParseBudgetExceeded:
+					raise
+				except ValueError:
+					return elements, ''.join(pieces) + string[end:]
+				
+				elements.append(element)
+				pieces.append(string[end:match.start()])
+				end = match.end()
+			
+			if not pieces:
+				return elements, string
+			
+			pieces.append(string[end:])
+			string = ''.join(pieces)
 
 
 
@@ -160,7 +761,9 @@ class GraphElement(Element):
 		flags = re.VERBOSE
 	)
 	
-	def __init__(self):
+	def __init__(self, budget=None, workers=1):
+		self.budget = budget
+		self.workers = workers
 		self.name = ''
 		self.nodes = []
 		self.subgraphs = []
@@ -177,32 +780,74 @@ class GraphElement(Element):
 		
 		string = match.group('contents')
 		
-		while True:
-			subgraph = SubgraphElement()
-			try:
-				string = subgraph.parse(string)
-			except ValueError:
-				break
-			self.subgraphs.append(subgraph)
-		
-		while True:
-			node_stmt = NodeStmtElement()
-			try:
-				string = node_stmt.parse(string)
-			except ValueError:
-				break
-			self.nodes.append(node_stmt)
+		self.subgraphs, string = self.parse_subgraphs(string)
+		self.nodes, string = NodeStmtElement.parse_all(string, self.budget)
 		
 		return ''
 	
+	def parse_subgraphs(self, string):
+		"""
+		Returns the (subgraphs, rest) tuple as SubgraphElement.parse_all does.
+		If there are several workers and the string is at least
+		PARSE_PARALLEL_MIN_SIZE characters long, the subgraphs are split off
+		in a single scan (see split_subgraphs) and parsed in chunks by a pool
+		of processes. The chunks are merged in order, so the result is the
+		same as that of the sequential parse, and so are the tokens spent.
+		
+		The remaining tokens of the budget are shared out between the chunks
+		in proportion to their lengths (see share_tokens), so that the workers
+		together do not spend more than the budget; a file whose statements
+		are much denser in some chunks than in others can thus be rejected
+		somewhat short of the sequential parse's limit.
+		"""
+		min_size = getattr(settings, 'PARSE_PARALLEL_MIN_SIZE', 0)
+		
+		if self.workers > 1 and len(string) >= min_size:
+			split = split_subgraphs(string, self.workers * CHUNKS_PER_WORKER)
+			if split is not None and len(split[0]) > 1:
+				chunks, rest = split
+				
+				if self.budget is None or self.budget.max_tokens is None:
+					shares = [None] * len(chunks)
+				else:
+					shares = share_tokens(
+						self.budget.max_tokens - self.budget.tokens, chunks)
+				
+				deadline = None if self.budget is None else self.budget.deadline
+				
+				with multiprocessing.Pool(min(self.workers, len(chunks))) as pool:
+					results = pool.map(parse_subgraph_chunk, [
+						(chunk, share, deadline) for chunk, share in zip(chunks, shares)
+					], chunksize=1)
+				
+				subgraphs = []
+				for items, tokens in results:
+					if self.budget is not None:
+						self.budget.spend(tokens)
+					subgraphs.extend(
+						SubgraphElement.from_tuple(item, self.budget) for item in items)
+				
+				return subgraphs, rest
+		
+		return SubgraphElement.parse_all(string, self.budget)
+	
 	def populate(self, graph):
+		for item in self.iter_populate(graph):
+			pass
+	
+	def iter_populate(self, graph):
+		"""
+		See Graph.iter_dot_string.
+		"""
 		graph.name = self.name
 		
 		for node in self.nodes:
 			node.populate(graph)
+			if node.name in graph.nodes:
+				yield 'node', node.name
 		
 		for subgraph in self.subgraphs:
-			subgraph.populate(graph)
+			yield from subgraph.iter_populate(graph)
 
 
 
@@ -214,34 +859,49 @@ class SubgraphElement(Element):
 		flags = re.VERBOSE
 	)
 	
-	def __init__(self):
+	def __init__(self, budget=None):
+		self.budget = budget
 		self.name = ''
 		self.edges = []
 	
-	def parse(self, string):
+	@classmethod
+	def from_tuple(cls, item, budget=None):
 		"""
-		Subgraphs contain edge statements.
+		Returns the subgraph element of the given tuple, as returned by
+		to_tuple; the elements are sent between processes as such tuples,
+		which are much quicker to pickle.
 		"""
-		match = self.regex.search(string)
+		element = cls(budget)
+		element.name, edges = item
+		element.edges = [EdgeStmtElement.from_tuple(edge, budget) for edge in edges]
 		
-		if match is None:
-			raise ValueError()
+		return element
+	
+	def to_tuple(self):
+		"""
+		Returns the (name, edge tuples) tuple of the subgraph element.
+		"""
+		return self.name, [edge.to_tuple() for edge in self.edges]
+	
+	def read_match(self, match):
+		"""
+		Subgraphs contain edge statements.
+		"""
+		self.spend()
 		
 		self.name = match.group('name')
 		
-		contents = match.group('contents')
-		
-		while True:
-			edge_stmt = EdgeStmtElement()
-			try:
-				contents = edge_stmt.parse(contents)
-			except ValueError:
-				break
-			self.edges.append(edge_stmt)
-		
-		return string[:match.start()] + string[match.end():]
+		self.edges, _ = EdgeStmtElement.parse_all(
+			match.group('contents'), self.budget)
 	
 	def populate(self, graph):
+		for item in self.iter_populate(graph):
+			pass
+	
+	def iter_populate(self, graph):
+		"""
+		See Graph.iter_dot_string.
+		"""
 		is_directed = False
 		if self.name.lower() in ('directed',):
 			is_directed = True
@@ -262,37 +922,234 @@ class SubgraphElement(Element):
 				if t[1] is not None:
 					information['opacity'] = t[1]
 			
-			graph.add_edge(edge.left, edge.right, is_directed, information)
+			key = graph.add_edge(edge.left, edge.right, is_directed, information)
+			if key is not None:
+				yield 'edge', (is_directed, key)
+
+
+
+def split_subgraphs(string, num_chunks):
+	"""
+	Returns the (chunks, rest) tuple of the subgraph statements of the given
+	graph contents, joined into about num_chunks strings of about the same
+	length, and the contents without them. Returns None if the subgraphs are
+	nested, if the braces are unbalanced, or if removing the subgraphs would
+	make for further ones: otherwise a single pass of SubgraphElement.parse_all
+	reads all the subgraphs, so parsing the chunks one after the other is
+	equivalent to parsing the contents.
+	"""
+	# the braces should alternate, opening first: {}{}...{}
+	if BRACES_REGEX.sub('', string).replace('{}', ''):
+		return None
+	
+	spans = [match.span() for match in SubgraphElement.regex.finditer(string)]
+	
+	total = sum(end - start for start, end in spans)
+	size = max(1, total // num_chunks)
+	
+	chunks = []
+	pieces = []
+	length = 0
+	
+	for start, end in spans:
+		pieces.append(string[start:end])
+		length += end - start
+		if length >= size:
+			chunks.append(' '.join(pieces))
+			pieces, length = [], 0
+	
+	if pieces:
+		chunks.append(' '.join(pieces))
+	
+	rest = []
+	end = 0
+	for start, stop in spans:
+		rest.append(string[end:start])
+		end = stop
+	rest.append(string[end:])
+	rest = ''.join(rest)
+	
+	if SubgraphElement.regex.search(rest):  # removing the spans made a new one
+		return None
+	
+	return chunks, rest
+
+
+
+def parse_subgraph_chunk(args):
+	"""
+	Parses the subgraphs of the given chunk (see split_subgraphs). Runs in the
+	worker processes of GraphElement.parse_subgraphs. The (chunk, max tokens,
+	deadline) args carry the remains of the parse's budget, the depth being
+	checked before the split. The budget's max_memory is not: the memory of
+	the worker processes is not traced. Returns the (subgraph tuples, tokens
+	spent) tuple; see SubgraphElement.to_tuple.
+	"""
+	chunk, max_tokens, deadline = args
+	
+	budget = ParseBudget(max_tokens)
+	budget.deadline = deadline  # the monotonic clock is shared by processes
+	
+	elements, _ = SubgraphElement.parse_all(chunk, budget)
+	
+	return [element.to_tuple() for element in elements], budget.tokens
+
+
+
+def share_tokens(max_tokens, chunks):
+	"""
+	Returns the list of the max tokens of each of the given chunks: the given
+	max tokens shared out in proportion to the chunks' lengths, adding up to
+	these exactly.
+	"""
+	total = sum(len(chunk) for chunk in chunks) or 1
+	
+	shares = [max_tokens * len(chunk) // total for chunk in chunks]
+	for i in range(max_tokens - sum(shares)):
+		shares[i % len(shares)] += 1
+	
+	return shares
+
+
+
+def iter_dot_statements(chunks, budget=None):
+	"""
+	Yields the name of the graph of the given .dot text, an iterable of
+	strings (e.g. the lines of a file) or a single string, and then its
+	top-level statements, cleaned as by Graph._clean_dot_string: the node and
+	attribute statements up to their semicolons, and the subgraphs up to
+	their closing braces. The text is read only as far as the statement being
+	yielded. A token that is not known to be complete at the end of the text
+	read so far is scanned again once the text has at least doubled, so that
+	the work stays linear.
+	
+	If a ParseBudget is given, the nesting depth is checked against it.
+	Raises ValueError if the text is not a graph, i.e. graph or digraph, an
+	optional name, and the statements within balanced braces.
+	"""
+	if isinstance(chunks, str):
+		chunks = [chunks]
+	chunks = iter(chunks)
+	
+	text, pos = '', 0
+	more = True
+	
+	name = None
+	pieces = []
+	depth = braces = brackets = 0
+	
+	while True:
+		match = STATEMENT_REGEX.match(text, pos)
+		
+		if more and (match is None or match.end() == len(text) \
+				or match.lastgroup == 'unterminated'):
+			new = [text[pos:]]
+			length = len(new[0])
+			more = False
+			
+			for chunk in chunks:
+				new.append(chunk)
+				length += len(chunk)
+				if length > 2 * len(new[0]):
+					more = True
+					break
+			
+			text, pos = ''.join(new), 0
+			continue
+		
+		if match is None:
+			break
+		
+		pos = match.end()
+		kind, token = match.lastgroup, match.group()
+		
+		if kind in ('comment', 'newlines') or (kind == 'unterminated' and token != '"'):
+			token = ' '
+		elif kind == 'quoted':
+			token = token.replace('\n', ' ')
+		
+		if name is not None and braces == 0:  # after the graph's closing brace
+			if token.strip():
+				raise ValueError()
+			continue
+		
+		if kind == 'bracket':
+			if token in '{[':
+				depth += 1
+				if budget is not None:
+					budget.enter(depth)
+			else:
+				depth -= 1
+			
+			if token == '[':
+				brackets += 1
+			elif token == ']':
+				brackets = max(0, brackets - 1)
+			elif token == '{':
+				braces += 1
+			else:
+				braces -= 1
+			
+			if braces < 0:
+				raise ValueError()
+			
+			if name is None and braces == 1:  # the graph's opening brace
+				match = GraphElement.regex.match(''.join(pieces).strip() + '{}')
+				if match is None:
+					raise ValueError()
+				
+				name = match.group('name')
+				yield name
+				
+				pieces = []
+				continue
+			
+			if braces == 0:  # the graph's closing brace
+				if ''.join(pieces).strip():
+					yield ''.join(pieces)
+				pieces = []
+				continue
+		
+		pieces.append(token)
+		
+		if braces == 1 and ((kind == 'semicolon' and not brackets) \
+				or (kind == 'bracket' and token == '}')):
+			yield ''.join(pieces)
+			pieces = []
+			brackets = 0
+	
+	if name is None or braces:
+		raise ValueError()
 
 
 
 class NodeStmtElement(Element):
+	"""
+	The attribute lists cannot contain [, so that a bracket that is never
+	closed does not make the regex scan to the end from every node name.
+	"""
 	regex = re.compile(
 		r'''
-		(?P<node>\w+)\s+
-		\[(?P<attributes>.*?)\];
+		\b(?P<node>\w+)\s+
+		\[(?P<attributes>[^[]*?)\];
 		''',
 		flags = re.VERBOSE
 	)
 	
-	def __init__(self):
+	def __init__(self, budget=None):
+		self.budget = budget
 		self.name = ''
 		self.attr = {}
 	
-	def parse(self, string):
-		match = self.regex.search(string)
-		
-		if match is None:
-			raise ValueError()
+	def read_match(self, match):
+		self.spend()
 		
 		self.name = match.group('node')
 		
 		if len(match.group('attributes')):
-			attr_stmt = AttrStmtElement()
+			attr_stmt = AttrStmtElement(self.budget)
 			attr_stmt.parse(match.group('attributes'))
 			self.attr = attr_stmt.attr
-		
-		return string[:match.start()] + string[match.end():]
 	
 	def populate(self, graph):
 		if self.name in ('node', 'edge'):  # .dot keywords
@@ -325,25 +1182,42 @@ class NodeStmtElement(Element):
 
 
 class EdgeStmtElement(Element):
+	"""
+	See NodeStmtElement about the attribute lists.
+	"""
 	regex = re.compile(
 		r'''
-		(?P<left>\w+)\s*(?P<arc>->|--)\s*(?P<right>\w+)\s*
-		\[(?P<attributes>.*?)\];
+		\b(?P<left>\w+)\s*(?P<arc>->|--)\s*(?P<right>\w+)\s*
+		\[(?P<attributes>[^[]*?)\];
 		''',
 		flags = re.VERBOSE
 	)
 	
-	def __init__(self):
+	def __init__(self, budget=None):
+		self.budget = budget
 		self.left = None
 		self.right = None
 		self.is_directed = False
 		self.attr = {}
 	
-	def parse(self, string):
-		match = self.regex.search(string)
+	@classmethod
+	def from_tuple(cls, item, budget=None):
+		"""
+		Returns the edge element of the given tuple, as returned by to_tuple.
+		"""
+		element = cls(budget)
+		element.left, element.right, element.is_directed, element.attr = item
 		
-		if match is None:
-			raise ValueError()
+		return element
+	
+	def to_tuple(self):
+		"""
+		Returns the (left, right, is directed, attr) tuple of the element.
+		"""
+		return self.left, self.right, self.is_directed, self.attr
+	
+	def read_match(self, match):
+		self.spend()
 		
 		self.left = match.group('left')
 		self.right = match.group('right')
@@ -352,37 +1226,61 @@ class EdgeStmtElement(Element):
 			self.is_directed = True
 		
 		if len(match.group('attributes')):
-			attr_stmt = AttrStmtElement()
+			attr_stmt = AttrStmtElement(self.budget)
 			attr_stmt.parse(match.group('attributes'))
 			self.attr = attr_stmt.attr
-		
-		return string[:match.start()] + string[match.end():]
 
 
 
 class AttrStmtElement(Element):
-	regex = re.compile(
-		r'''
-		^((?P<name>[-\w.,]+)="?(?P<value>[-\w.,#]+?)"?,?\s*)*$
-		''',
-		flags = re.VERBOSE
-	)
+	"""
+	Attribute lists are scanned from left to right, one name=value pair at a
+	time, so that the work is linear in the length of the list. Values can be
+	quoted and the pairs can be separated by commas. Should a name occur more
+	than once, its first value is kept.
+	"""
+	regex = re.compile(r'\s*(?P<name>[-\w.,]+)="?')
+	value_regex = re.compile(r'[-\w.,#]+')
 	
-	def __init__(self):
+	def __init__(self, budget=None):
+		self.budget = budget
 		self.attr = {}
 	
 	def parse(self, string):
-		while True:
-			string = string.strip()
-			if len(string) == 0:
-				break
+		string = string.strip()
+		pos = 0
+		
+		while pos < len(string):
+			match = self.regex.match(string, pos)
+			if match is None:
+				raise ValueError()
+			
+			name = match.group('name')
 			
-			match = self.regex.match(string)
+			match = self.value_regex.match(string, match.end())
 			if match is None:
 				raise ValueError()
 			
-			self.attr[match.group('name')] = match.group('value')
-			string = string[:match.start('name')]
+			value, pos = match.group(), match.end()
+			
+			if string.startswith('=', pos):
+				# unquoted and followed by the next pair without whitespace:
+				# the name starts after the first comma following the last #
+				cut = value.find(',', value.rfind('#') + 1)
+				if cut < 1 or cut == len(value) - 1:
+					raise ValueError()
+				pos -= len(value) - cut - 1
+				value = value[:cut]
+			else:
+				if len(value) > 1 and value.endswith(','):
+					value = value[:-1]
+				if string.startswith('"', pos):
+					pos += 1
+				if string.startswith(',', pos):
+					pos += 1
+			
+			self.spend()
+			self.attr.setdefault(name, value)
 		
 		return ''
 	
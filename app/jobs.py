@@ -0,0 +1,110 @@
+"""
+The local job queue for parsing .dot files in the background. The queue is
+the ParseJob table: the file API adds jobs to it and the run_jobs management
+command works them off, so no external broker is needed.
+"""
+from django.utils import timezone
+
+from app.graphs import ParseBudget
+from app.models import ParseJob
+from app.parsing import build_graph_response
+from app.profiling import MemoryProfile
+from utils.json import make_json, read_json
+
+import datetime
+import logging
+
+
+
+logger = logging.getLogger('sanavirta.error')
+
+
+
+def claim_job():
+	"""
+	Marks the oldest pending job as running and returns it; returns None if
+	there are no pending jobs. Several workers can safely claim jobs at the
+	same time: a job is only claimed by the worker whose update succeeds.
+	"""
+	pending = ParseJob.objects.filter(status=ParseJob.PENDING)
+	
+	for pk in pending.order_by('created').values_list('pk', flat=True)[:10]:
+		claimed = ParseJob.objects.filter(
+			pk = pk,
+			status = ParseJob.PENDING
+		).update(
+			status = ParseJob.RUNNING,
+			started = timezone.now()
+		)
+		if claimed:
+			return ParseJob.objects.get(pk=pk)
+	
+	return None
+
+
+
+def run_job(job):
+	"""
+	Parses the job's .dot string with the same machinery as the file API, but
+	with the more generous JOB_PARSE_BUDGET, and stores either the result or
+	the error. The memory is profiled as in the file API.
+	"""
+	budget = ParseBudget.from_settings('JOB_PARSE_BUDGET')
+	profile = MemoryProfile('JOB_PARSE_BUDGET')
+	
+	try:
+		with profile:
+			d = build_graph_response(job.contents, read_json(job.options), budget)
+	except ValueError as error:
+		job.status = ParseJob.FAILED
+		job.error = str(error)[:240]
+	except Exception:
+		logger.exception('Parse job %s crashed', job.key)
+		job.status = ParseJob.FAILED
+		job.error = 'File could not be parsed.'
+	else:
+		job.status = ParseJob.DONE
+		job.result = make_json(d)
+	
+	profile.report('Parse job {}'.format(job.key))
+	
+	job.contents = ''
+	job.finished = timezone.now()
+	job.save()
+
+
+
+def fail_stale_jobs(timeout):
+	"""
+	Marks as failed the jobs that have been running for more than the given
+	number of seconds, e.g. because their worker was killed.
+	"""
+	threshold = timezone.now() - datetime.timedelta(seconds=timeout)
+	
+	return ParseJob.objects.filter(
+		status = ParseJob.RUNNING,
+		started__lt = threshold
+	).update(
+		status = ParseJob.FAILED,
+		error = 'The job timed out.',
+		contents = '',
+		finished = timezone.now()
+	)
+
+
+
+def purge_jobs(max_age):
+	"""
+	Deletes the finished jobs that are older than the given number of seconds.
+	"""
+	threshold = timezone.now() - datetime.timedelta(seconds=max_age)
+	
+	deleted, _ = ParseJob.objects.filter(
+		status__in = (ParseJob.DONE, ParseJob.FAILED),
+		finished__lt = threshold
+	).delete()
+	
+	return deleted
+
+
+
@@ -0,0 +1,254 @@
+"""
+Label placement computed on the server, so that clients draw only the labels
+that do not overlap instead of each doing the collision detection itself.
+
+The plan lists, for each node to be labelled, the lowest zoom level from which
+its label is shown and the offset of the label from the node. Levels are
+processed from the highest zoom down. At the highest level the labels are
+placed by priority (see get_priorities), each at the first of the OFFSETS
+where it does not overlap the labels already placed, which are looked up in a
+spatial hash of the canvas. At each lower level, the labels kept from the
+level above are placed again, by priority and at their offsets, and those
+that would overlap are dropped. Thus the labels shown at a level are also
+shown at the levels above, and at no level do they overlap.
+
+The plan does not depend on the view that the labels are drawn in, so that it
+holds as the user rotates the globe: the front end's orthographic view is
+planned for in the sinusoidal projection (see get_positions), whatever its
+centre, and the nodes on the far side of the globe are placed as the others.
+This is an approximation: the sinusoidal projection is only true to the
+orthographic near the prime meridian and the equator, and shears away from
+them, so labels planned not to overlap can overlap on screen in views centred
+elsewhere, e.g. at 120 degrees east. Boxes near the antimeridian are also
+checked against these on its other side.
+"""
+from app.projections import read_projection
+
+import math
+
+import numpy as np
+
+
+
+"""
+The zoom coefficients of the front end's viewport that labels are placed for;
+a label placed for a level is to be shown at that zoom and closer.
+"""
+ZOOM_LEVELS = (0.5, 1, 2, 4, 8, 16)
+
+
+"""
+The canvas pixels of a projected unit at zoom 1, as the front end's globe.
+"""
+SCALE = 500
+
+
+"""
+The size of the labels' characters (bold 12px monospace) and the radius of
+the nodes, in pixels.
+"""
+CHAR_WIDTH = 7.5
+LINE_HEIGHT = 14
+NODE_RADIUS = 15
+
+
+"""
+The positions tried for a label, in order: on the node, above, below, to the
+right and to the left of it; in half label sizes plus the node's radius.
+"""
+OFFSETS = ((0, 0), (0, -1), (0, 1), (1, 0), (-1, 0))
+
+
+"""
+The side of the cells of the spatial hash, in pixels.
+"""
+CELL_SIZE = 64
+
+
+
+class SpatialHash:
+	"""
+	The boxes placed on the canvas, bucketed into square cells: a box is
+	listed in every cell that it overlaps, so a query only looks at the boxes
+	in the cells that the queried box overlaps.
+	"""
+	
+	def __init__(self, cell_size=CELL_SIZE):
+		self.cell_size = cell_size
+		self.cells = {}
+	
+	def iter_cells(self, box):
+		"""
+		Yields the keys of the cells that the given (left, top, right, bottom)
+		box overlaps.
+		"""
+		left, top, right, bottom = box
+		
+		for column in range(
+				math.floor(left / self.cell_size), math.floor(right / self.cell_size) + 1):
+			for row in range(
+					math.floor(top / self.cell_size), math.floor(bottom / self.cell_size) + 1):
+				yield column, row
+	
+	def collides(self, box):
+		"""
+		Returns True if the given box overlaps any of the boxes inserted.
+		"""
+		left, top, right, bottom = box
+		
+		for key in self.iter_cells(box):
+			for other in self.cells.get(key, []):
+				if left < other[2] and other[0] < right \
+						and top < other[3] and other[1] < bottom:
+					return True
+		
+		return False
+	
+	def insert(self, box):
+		"""
+		Adds the given box to the cells that it overlaps.
+		"""
+		for key in self.iter_cells(box):
+			self.cells.setdefault(key, []).append(box)
+
+
+
+def get_priorities(graph):
+	"""
+	Returns the names of the given Graph instance's nodes in the order of
+	their labels' priority: the more edges a node has the sooner, ties broken
+	by name, so that every client gets the same plan.
+	"""
+	degrees = dict.fromkeys(graph.nodes, 0)
+	
+	for edges in (graph.undirected, graph.directed):
+		for head, tail in edges:
+			degrees[head] += 1
+			degrees[tail] += 1
+	
+	return sorted(degrees, key=lambda name: (-degrees[name], name))
+
+
+
+def get_positions(names, graph, projection):
+	"""
+	Returns the (x, y, periods) tuple of the lists of the planar positions of
+	the given nodes of the Graph instance, for the labels to be placed in the
+	given app.projections.Projection instance. The periods are the widths of
+	the plane at the nodes, for wrapping around the antimeridian.
+	
+	The orthographic projection is replaced by the sinusoidal one, whatever
+	its centre: x = longitude * cos(latitude), y = -latitude, in radians.
+	This approximates the orthographic view centred at 0, 0 only; see the
+	module's docstring.
+	"""
+	longitudes = [graph.nodes[name]['longitude'] for name in names]
+	latitudes = [graph.nodes[name]['latitude'] for name in names]
+	
+	if projection.name != 'orthographic':
+		x, y = projection.project(longitudes, latitudes)
+		return x.tolist(), y.tolist(), [2 * math.pi] * len(names)
+	
+	lam = np.radians(np.asarray(longitudes, dtype=np.float64))
+	phi = np.radians(np.asarray(latitudes, dtype=np.float64))
+	
+	cos_phi = np.cos(phi)
+	
+	return (lam * cos_phi).tolist(), (-phi).tolist(), (2 * math.pi * cos_phi).tolist()
+
+
+
+def plan_labels(graph, projection):
+	"""
+	Returns the label plan of the given Graph instance's nodes as placed for
+	the given app.projections.Projection instance: {name: {zoom, dx, dy}},
+	the offsets in canvas pixels. The nodes whose labels do not fit even at
+	the highest level are listed with a zoom of None. The plan does not depend
+	on the centre of an orthographic projection; see get_positions.
+	"""
+	names = get_priorities(graph)
+	x, y, periods = get_positions(names, graph, projection)
+	
+	items = [
+		(name, x_, y_, period, len(name) * CHAR_WIDTH / 2, LINE_HEIGHT / 2)
+		for name, x_, y_, period in zip(names, x, y, periods)
+	]
+	
+	plan = {}
+	
+	for zoom in reversed(ZOOM_LEVELS):
+		spatial_hash = SpatialHash()
+		scale = SCALE * zoom
+		kept = []
+		
+		for item in items:
+			name, x_, y_, period, half_width, half_height = item
+			
+			if name in plan:
+				offsets = [(plan[name]['dx'], plan[name]['dy'])]
+			else:
+				offsets = [
+					(ux * (half_width + NODE_RADIUS), uy * (half_height + NODE_RADIUS))
+					for ux, uy in OFFSETS
+				]
+			
+			for dx, dy in offsets:
+				box = get_box(x_ * scale + dx, y_ * scale + dy, half_width, half_height)
+				
+				if not any(
+						spatial_hash.collides(shift_box(box, shift * period * scale))
+						for shift in (0, -1, 1)):
+					spatial_hash.insert(box)
+					plan[name] = {'zoom': zoom, 'dx': dx, 'dy': dy}
+					kept.append(item)
+					break
+		
+		items = kept
+	
+	for name in names:
+		if name not in plan:
+			plan[name] = {'zoom': None, 'dx': 0, 'dy': 0}
+	
+	return plan
+
+
+
+def get_box(x, y, half_width, half_height):
+	"""
+	Returns the (left, top, right, bottom) box of the given centre and size.
+	"""
+	return x - half_width, y - half_height, x + half_width, y + half_height
+
+
+
+def shift_box(box, dx):
+	"""
+	Returns the given (left, top, right, bottom) box moved right by dx.
+	"""
+	return box[0] + dx, box[1], box[2] + dx, box[3]
+
+
+
+def read_labels(params):
+	"""
+	Returns the Projection instance to place the labels for if the QueryDict's
+	labels param is set, None otherwise: the requested projection or, by
+	default, the orthographic projection, as drawn by the front end; its
+	centre is validated but does not affect the plan. Raises ValueError if
+	the params are not valid.
+	"""
+	if not params.get('labels'):
+		return None
+	
+	projection = read_projection(params)
+	
+	if projection is None:
+		projection = read_projection({
+			'projection': 'orthographic',
+			'centre': params.get('centre', '0,0')
+		})
+	
+	return projection
+
+
+
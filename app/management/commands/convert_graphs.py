@@ -0,0 +1,207 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from app.graphs import Graph, ParseBudget
+from app.warmup import load_language_table
+from utils.json import make_json
+
+import glob
+import multiprocessing
+import os
+import time
+
+
+
+"""
+The languages table of the worker processes, set by init_worker.
+"""
+worker_languages = None
+
+
+
+def init_worker(languages):
+	"""
+	Initialiser of the worker processes. The languages table is sent to each
+	worker once, instead of along with each file.
+	"""
+	global worker_languages
+	worker_languages = languages
+
+
+
+def convert_file(args):
+	"""
+	Parses the given .dot file and writes its JSON into the given output file.
+	Runs in the worker processes, so it does not touch the database. Returns
+	the (path, number of nodes, number of edges, sorted skipped node names,
+	seconds, error message or None) tuple. The files are parsed in parallel
+	already, so each is parsed by a single process.
+	"""
+	path, out_path, budget = args
+	
+	start = time.perf_counter()
+	
+	graph = Graph(languages=worker_languages)
+	
+	try:
+		with open(path, 'r', encoding='utf-8') as f:
+			graph.read_dot_string(f.read(), ParseBudget(**budget), workers=1)
+		
+		with open(out_path, 'w', encoding='utf-8') as f:
+			f.write(make_json(graph.to_dict()))
+	except (OSError, UnicodeDecodeError, ValueError) as error:
+		return path, 0, 0, [], time.perf_counter() - start, str(error) or 'Invalid file.'
+	
+	return (
+		path,
+		len(graph.nodes),
+		len(graph.undirected) + len(graph.directed),
+		sorted(graph.skipped),
+		time.perf_counter() - start,
+		None
+	)
+
+
+
+class Command(BaseCommand):
+	
+	help = (
+		"Converts .dot files into the JSON that the file API returns, using "
+		"a pool of worker processes. The arguments are .dot files, "
+		"directories (all the .dot files therein) or glob patterns. The "
+		"languages' locations are loaded once and handed to the workers, "
+		"which do not query the database. Each file is parsed within the "
+		"JOB_PARSE_BUDGET setting."
+	)
+	
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'paths',
+			nargs = '+',
+			type = str
+		)
+		parser.add_argument(
+			'--output',
+			help = 'Directory to write the JSON files into; created if needed.'
+		)
+		parser.add_argument(
+			'--workers',
+			type = int,
+			default = os.cpu_count() or 1,
+			help = 'Number of worker processes; defaults to the number of CPUs.'
+		)
+	
+	
+	def handle(self, *args, **options):
+		"""
+		The command's main.
+		"""
+		try:
+			assert options['output']
+			assert options['workers'] > 0
+		except AssertionError:
+			raise CommandError("Please refer to --help")
+		
+		paths = self.find_files(options['paths'])
+		if not paths:
+			raise CommandError("No .dot files found")
+		
+		tasks = self.plan_tasks(paths, options['output'])
+		
+		os.makedirs(options['output'], exist_ok=True)
+		
+		start = time.perf_counter()
+		
+		languages = load_language_table()
+		
+		if options['workers'] == 1:
+			init_worker(languages)
+			results = list(map(convert_file, tasks))
+		else:
+			connections.close_all()  # not to be shared with the forked workers
+			with multiprocessing.Pool(
+					options['workers'], init_worker, (languages,)) as pool:
+				results = pool.map(convert_file, tasks, chunksize=1)
+		
+		self.report(results, time.perf_counter() - start)
+		
+		if any(result[5] for result in results):
+			raise CommandError("Some files could not be converted")
+	
+	
+	def find_files(self, args):
+		"""
+		Returns the sorted list of the .dot files that the given command line
+		arguments refer to.
+		"""
+		paths = set()
+		
+		for arg in args:
+			if os.path.isdir(arg):
+				paths.update(glob.glob(os.path.join(arg, '*.dot')))
+			elif os.path.isfile(arg):
+				paths.add(arg)
+			else:
+				matches = glob.glob(arg, recursive=True)
+				if not matches:
+					raise CommandError("No such file: {}".format(arg))
+				paths.update(path for path in matches if os.path.isfile(path))
+		
+		return sorted(paths)
+	
+	
+	def plan_tasks(self, paths, output_dir):
+		"""
+		Returns the list of (path, output path, budget) arguments of
+		convert_file. The output files are named after the input files, which
+		therefore must have unique names. The budget is passed as the settings
+		dict, as the deadline starts with each file.
+		"""
+		budget = dict(getattr(settings, 'JOB_PARSE_BUDGET', {}))
+		
+		tasks = []
+		seen = {}
+		
+		for path in paths:
+			name = os.path.splitext(os.path.basename(path))[0] + '.json'
+			if name in seen:
+				raise CommandError("Both {} and {} would be written to {}".format(
+					seen[name], path, name))
+			seen[name] = path
+			
+			tasks.append((path, os.path.join(output_dir, name), budget))
+		
+		return tasks
+	
+	
+	def report(self, results, seconds):
+		"""
+		Writes a line per file and the summary.
+		"""
+		num_failed = 0
+		skipped = set()
+		
+		for path, num_nodes, num_edges, names, elapsed, error in results:
+			if error:
+				num_failed += 1
+				self.stderr.write("{}: {}".format(path, error))
+				continue
+			
+			skipped.update(names)
+			
+			line = "{}: {} nodes, {} edges in {:.3f}s".format(
+				path, num_nodes, num_edges, elapsed)
+			if names:
+				line += "; skipped {}".format(', '.join(names))
+			self.stdout.write(line)
+		
+		self.stdout.write("Converted {} of {} files in {:.3f}s".format(
+			len(results) - num_failed, len(results), seconds))
+		
+		if skipped:
+			self.stdout.write("Skipped {} unknown languages: {}".format(
+				len(skipped), ', '.join(sorted(skipped))))
+
+
+
@@ -0,0 +1,265 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from app.models import Language
+from utils.json import iter_json_array
+
+
+
+class Command(BaseCommand):
+	
+	help = (
+		"Bulk loads languages and their geographical locations. "
+		"The input is either a Django fixture of app.language objects "
+		"(e.g. app/fixtures/languages.json) or lines of whitespace-separated "
+		"ISO 639-3 code, latitude, and longitude (e.g. app/fixtures/locations). "
+		"The file is read in a streaming fashion and the rows are inserted in "
+		"batches within a single transaction, which makes this command much "
+		"faster than loaddata or harvest_languages for large inventories. "
+		"Warning: this command overwrites other latlng info in the database."
+	)
+	
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'file_name',
+			nargs = 1,
+			type = str
+		)
+		parser.add_argument(
+			'--format',
+			choices = ['auto', 'fixture', 'locations'],
+			default = 'auto',
+			help = 'Input format; auto picks fixture for .json files.'
+		)
+		parser.add_argument(
+			'--batch-size',
+			type = int,
+			default = 1000,
+			help = 'Number of rows per INSERT/UPDATE batch.'
+		)
+		parser.add_argument(
+			'--replace',
+			action = 'store_true',
+			help = 'Delete all languages before loading.'
+		)
+		parser.add_argument(
+			'--defer-indexes',
+			action = 'store_true',
+			help = (
+				'Drop the unique ISO code index before loading and rebuild '
+				'it afterwards. Not supported on SQLite, where this would '
+				'mean copying the whole table twice.'
+			)
+		)
+	
+	
+	def handle(self, *args, **options):
+		"""
+		The command's main.
+		"""
+		try:
+			assert type(options['file_name']) is list
+			assert len(options['file_name']) == 1
+			assert type(options['file_name'][0]) is str
+			assert options['batch_size'] > 0
+		except AssertionError:
+			raise CommandError("Please refer to --help")
+		else:
+			file_name = options['file_name'][0]
+		
+		if options['defer_indexes'] and connection.vendor == 'sqlite':
+			raise CommandError("--defer-indexes is not supported on SQLite")
+		
+		fmt = options['format']
+		if fmt == 'auto':
+			fmt = 'fixture' if file_name.endswith('.json') else 'locations'
+		
+		self.batch_size = options['batch_size']
+		self.skipped = 0
+		
+		with open(file_name, 'r', encoding='utf-8') as f, transaction.atomic():
+			if options['replace']:
+				Language.objects.all().delete()
+			
+			self.known = set(Language.objects.values_list('iso_code', flat=True))
+			self.keep_pks = len(self.known) == 0
+			
+			self.inserts = []
+			self.updates = []
+			self.num_inserted = 0
+			self.num_updated = 0
+			
+			if options['defer_indexes']:
+				self.toggle_unique_index(False)
+			
+			if fmt == 'fixture':
+				rows = self.read_fixture(f)
+			else:
+				rows = self.read_locations(f)
+			
+			try:
+				for row in rows:
+					self.add_row(*row)
+			except ValueError as error:
+				raise CommandError(str(error))
+			
+			self.flush()
+			
+			if options['defer_indexes']:
+				self.toggle_unique_index(True)
+			
+			if self.keep_pks:  # as loaddata does
+				with connection.cursor() as cursor:
+					for sql in connection.ops.sequence_reset_sql(no_style(), [Language]):
+						cursor.execute(sql)
+		
+		if self.skipped:
+			self.stdout.write("Skipped {} incomprehensible entries".format(self.skipped))
+		
+		self.stdout.write("Inserted {}, updated {} languages".format(
+			self.num_inserted, self.num_updated))
+	
+	
+	def read_fixture(self, f):
+		"""
+		Yields (pk, iso_code, latitude, longitude, created) tuples out of the
+		given fixture file, reading one object at a time.
+		"""
+		for item in iter_json_array(f):
+			try:
+				assert item['model'] == 'app.language'
+				fields = item['fields']
+				iso_code = str(fields['iso_code'])
+				assert 0 < len(iso_code) <= 3
+				latitude = self.to_float(fields.get('latitude'))
+				longitude = self.to_float(fields.get('longitude'))
+			except (AssertionError, KeyError, TypeError, ValueError):
+				self.skipped += 1
+				continue
+			
+			created = None
+			if fields.get('created'):
+				created = parse_datetime(fields['created'])
+			
+			yield item.get('pk'), iso_code, latitude, longitude, created
+	
+	
+	def read_locations(self, f):
+		"""
+		Yields (pk, iso_code, latitude, longitude, created) tuples out of the
+		given file of whitespace-separated values, reading line by line.
+		"""
+		for line in f:
+			items = line.split()
+			
+			try:
+				assert len(items) == 3
+				assert 0 < len(items[0]) <= 3
+				latitude = float(items[1])
+				longitude = float(items[2])
+			except (AssertionError, ValueError):
+				self.skipped += 1
+				continue
+			
+			yield None, items[0], latitude, longitude, None
+	
+	
+	def to_float(self, value):
+		"""
+		Returns the given fixture value as float, keeping None.
+		"""
+		if value is None:
+			return None
+		return float(value)
+	
+	
+	def add_row(self, pk, iso_code, latitude, longitude, created):
+		"""
+		Queues the given language for insertion, or for updating if it is
+		already known. The queues are flushed when they are full.
+		"""
+		now = timezone.now()
+		
+		if iso_code in self.known:
+			self.updates.append((latitude, longitude, now, iso_code))
+		else:
+			language = Language(
+				iso_code = iso_code,
+				latitude = latitude,
+				longitude = longitude,
+				created = created or now,
+				last_modified = now
+			)
+			if pk is not None and self.keep_pks:
+				language.pk = pk
+			
+			self.inserts.append(language)
+			self.known.add(iso_code)
+		
+		if len(self.inserts) >= self.batch_size \
+				or len(self.updates) >= self.batch_size:
+			self.flush()
+	
+	
+	def flush(self):
+		"""
+		Writes the queued rows to the database. The inserts go first, as the
+		updates might refer to rows among them.
+		"""
+		if self.inserts:
+			Language.objects.bulk_create(self.inserts, batch_size=self.batch_size)
+			self.num_inserted += len(self.inserts)
+			self.inserts = []
+		
+		if self.updates:
+			qn = connection.ops.quote_name
+			meta = Language._meta
+			
+			sql = 'UPDATE {} SET {} = %s, {} = %s, {} = %s WHERE {} = %s'.format(
+				qn(meta.db_table),
+				qn(meta.get_field('latitude').column),
+				qn(meta.get_field('longitude').column),
+				qn(meta.get_field('last_modified').column),
+				qn(meta.get_field('iso_code').column)
+			)
+			
+			# raw SQL gets no field conversion, so the datetimes are adapted here
+			adapt = connection.ops.adapt_datetimefield_value
+			params = [
+				(latitude, longitude, adapt(modified), iso_code)
+				for latitude, longitude, modified, iso_code in self.updates
+			]
+			
+			with connection.cursor() as cursor:
+				cursor.executemany(sql, params)
+			
+			self.num_updated += len(self.updates)
+			self.updates = []
+	
+	
+	def toggle_unique_index(self, unique):
+		"""
+		Drops or rebuilds the unique index on the ISO code column.
+		"""
+		field = Language._meta.get_field('iso_code')
+		
+		name, path, args, kwargs = field.deconstruct()
+		kwargs['unique'] = False
+		
+		plain = field.__class__(*args, **kwargs)
+		plain.set_attributes_from_name(name)
+		plain.model = Language
+		
+		if unique:
+			old_field, new_field = plain, field
+		else:
+			old_field, new_field = field, plain
+		
+		with connection.schema_editor() as editor:
+			editor.alter_field(Language, old_field, new_field)
+
+
+
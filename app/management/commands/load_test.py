@@ -0,0 +1,437 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from utils.json import iter_json_array, read_json
+
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.request import HTTPCookieProcessor, Request, build_opener
+
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+
+
+"""
+The settings module of the launched server: the project's settings with a
+database of its own, loaded with the fixtures.
+"""
+SETTINGS = '''
+from project.settings import *
+DATABASES = {{'default': {{
+	'ENGINE': 'django.db.backends.sqlite3',
+	'NAME': {database!r},
+}}}}
+DEBUG = False
+ALLOWED_HOSTS = ['127.0.0.1', 'localhost']
+'''
+
+
+"""
+The workloads and their default weights in the mix.
+"""
+WORKLOADS = {
+	'landing': 1,
+	'globe': 4,
+	'sample': 2,
+	'upload': 3,
+}
+
+
+"""
+The boundary of the multipart uploads; the synthetic .dot files never
+contain it.
+"""
+BOUNDARY = b'load-test-boundary'
+
+
+"""
+The percentiles of the latencies that are reported.
+"""
+PERCENTILES = (50, 95, 99)
+
+
+
+class Command(BaseCommand):
+	
+	help = (
+		"Load tests the HTTP API with a mix of concurrent requests: landing "
+		"page views, globe fetches, and sample and synthetic .dot uploads. "
+		"Unless --url is given, a server (gunicorn or Django's runserver) is "
+		"launched against a fresh SQLite database loaded with the fixtures, "
+		"and shut down afterwards. Reports the throughput and the p50, p95 "
+		"and p99 latencies of each workload."
+	)
+	
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--url',
+			help = 'Base URL of an already running server to test instead.'
+		)
+		parser.add_argument(
+			'--server',
+			choices = ['gunicorn', 'runserver'],
+			default = 'gunicorn',
+			help = 'The server to launch; defaults to gunicorn.'
+		)
+		parser.add_argument(
+			'--workers',
+			type = int,
+			default = 4,
+			help = 'Number of gunicorn worker processes.'
+		)
+		parser.add_argument(
+			'--requests',
+			type = int,
+			default = 500,
+			help = 'Total number of requests to send.'
+		)
+		parser.add_argument(
+			'--concurrency',
+			type = int,
+			default = 8,
+			help = 'Number of requests in flight at a time.'
+		)
+		parser.add_argument(
+			'--mix',
+			default = ','.join('{}={}'.format(*item) for item in sorted(WORKLOADS.items())),
+			help = 'Comma-separated workload=weight pairs; the workloads are {}.'.format(
+				', '.join(sorted(WORKLOADS)))
+		)
+		parser.add_argument(
+			'--nodes',
+			type = int,
+			default = 100,
+			help = 'Number of nodes of the synthetic .dot files.'
+		)
+		parser.add_argument(
+			'--edges',
+			type = int,
+			default = 300,
+			help = 'Number of edges of the synthetic .dot files.'
+		)
+		parser.add_argument(
+			'--seed',
+			type = int,
+			default = 0,
+			help = 'Seed of the request schedule and the synthetic files.'
+		)
+	
+	
+	def handle(self, *args, **options):
+		"""
+		The command's main.
+		"""
+		try:
+			assert options['workers'] > 0
+			assert options['requests'] > 0
+			assert options['concurrency'] > 0
+			assert options['nodes'] > 1
+			assert options['edges'] >= 0
+			mix = self.read_mix(options['mix'])
+		except (AssertionError, ValueError):
+			raise CommandError("Please refer to --help")
+		
+		self.rand = random.Random(options['seed'])
+		self.codes = self.load_codes()
+		
+		if options['url']:
+			self.run(options['url'].rstrip('/'), mix, options)
+			return
+		
+		temp_dir = tempfile.mkdtemp(prefix='load_test-')
+		server = None
+		
+		try:
+			env = self.prepare_database(temp_dir)
+			server, url = self.launch_server(env, options)
+			self.run(url, mix, options)
+		finally:
+			if server is not None:
+				server.terminate()
+				try:
+					server.wait(10)
+				except subprocess.TimeoutExpired:
+					server.kill()
+			shutil.rmtree(temp_dir, ignore_errors=True)
+	
+	
+	def read_mix(self, string):
+		"""
+		Returns the {workload: weight} dict of the given --mix value. Raises
+		ValueError.
+		"""
+		mix = {}
+		
+		for item in string.split(','):
+			name, weight = item.split('=')
+			name, weight = name.strip(), float(weight)
+			if name not in WORKLOADS or weight < 0:
+				raise ValueError()
+			mix[name] = weight
+		
+		if not sum(mix.values()) > 0:
+			raise ValueError()
+		
+		return mix
+	
+	
+	def load_codes(self):
+		"""
+		Returns the ISO codes of the languages fixture, which the synthetic
+		.dot files are made of.
+		"""
+		with open(os.path.join(settings.BASE_DIR, 'app/fixtures/languages.json'),
+				encoding='utf-8') as f:
+			return sorted(item['fields']['iso_code'] for item in iter_json_array(f))
+	
+	
+	def prepare_database(self, temp_dir):
+		"""
+		Writes the server's settings module into the given directory, creates
+		its database and loads the fixtures. Returns the environment to run
+		the server with.
+		"""
+		with open(os.path.join(temp_dir, 'load_test_settings.py'), 'w') as f:
+			f.write(SETTINGS.format(database=os.path.join(temp_dir, 'db.sqlite3')))
+		
+		env = dict(os.environ)
+		env['DJANGO_SETTINGS_MODULE'] = 'load_test_settings'
+		env['PYTHONPATH'] = os.pathsep.join(
+			[temp_dir, settings.BASE_DIR] + env.get('PYTHONPATH', '').split(os.pathsep))
+		
+		for command in (
+				['migrate', '--noinput'],
+				['loaddata', 'app/fixtures/globes.json', 'app/fixtures/languages.json']):
+			process = subprocess.run(
+				[sys.executable, 'manage.py'] + command,
+				cwd = settings.BASE_DIR,
+				env = env,
+				stdout = subprocess.PIPE,
+				stderr = subprocess.STDOUT,
+				universal_newlines = True
+			)
+			if process.returncode != 0:
+				raise CommandError("Could not prepare the database:\n" + process.stdout)
+		
+		return env
+	
+	
+	def launch_server(self, env, options):
+		"""
+		Starts the server on a free port and waits for it to respond. Returns
+		the (process, base URL) tuple.
+		"""
+		with socket.socket() as sock:
+			sock.bind(('127.0.0.1', 0))
+			port = sock.getsockname()[1]
+		
+		address = '127.0.0.1:{}'.format(port)
+		
+		if options['server'] == 'gunicorn':
+			args = [
+				sys.executable, '-m', 'gunicorn', 'project.wsgi:application',
+				'--bind', address, '--workers', str(options['workers'])
+			]
+		else:
+			args = [sys.executable, 'manage.py', 'runserver', address, '--noreload']
+		
+		process = subprocess.Popen(
+			args,
+			cwd = settings.BASE_DIR,
+			env = env,
+			stdout = subprocess.DEVNULL,
+			stderr = subprocess.DEVNULL
+		)
+		
+		url = 'http://' + address
+		deadline = time.monotonic() + 30
+		
+		while True:
+			if process.poll() is not None:
+				raise CommandError("The server exited with code {}".format(
+					process.returncode))
+			try:
+				build_opener().open(url + '/api/globes/', timeout=1).read()
+				break
+			except (URLError, OSError):
+				if time.monotonic() > deadline:
+					process.kill()
+					raise CommandError("The server did not start in time")
+				time.sleep(0.2)
+		
+		self.stdout.write("Launched {} at {}".format(options['server'], url))
+		
+		return process, url
+	
+	
+	def run(self, url, mix, options):
+		"""
+		Sends the requests and writes the report.
+		"""
+		self.url = url
+		self.cookies = CookieJar()
+		self.opener = build_opener(HTTPCookieProcessor(self.cookies))
+		
+		try:
+			self.opener.open(url + '/').read()  # sets the CSRF cookie
+			globes = read_json(self.opener.open(url + '/api/globes/?per_page=100').read())
+		except (URLError, OSError, ValueError) as error:
+			raise CommandError("Could not reach the server: {}".format(error))
+		
+		self.csrf_token = ''
+		for cookie in self.cookies:
+			if cookie.name == 'csrftoken':
+				self.csrf_token = cookie.value
+		
+		self.globe_ids = [globe['id'] for globe in globes['globes']]
+		if mix.get('globe') and not self.globe_ids:
+			raise CommandError("There are no globes to fetch")
+		
+		names = sorted(mix)
+		schedule = self.rand.choices(
+			names, [mix[name] for name in names], k=options['requests'])
+		
+		self.uploads = [
+			self.make_dot(options['nodes'], options['edges'], i)
+			for i in range(min(options['requests'], 20))
+		]
+		
+		start = time.perf_counter()
+		
+		with ThreadPoolExecutor(options['concurrency']) as executor:
+			results = list(executor.map(self.send, enumerate(schedule)))
+		
+		self.report(results, time.perf_counter() - start)
+	
+	
+	def make_dot(self, num_nodes, num_edges, number):
+		"""
+		Returns a synthetic .dot file of random languages and edges, half of
+		these directed.
+		"""
+		codes = self.rand.sample(self.codes, min(num_nodes, len(self.codes)))
+		
+		lines = ['graph synthetic{} {{'.format(number)]
+		for code in codes:
+			lines.append('  {} [color="#{:06x}"];'.format(code, self.rand.getrandbits(24)))
+		
+		edges = {'undirected': [], 'directed': []}
+		for i in range(num_edges):
+			head, tail = self.rand.sample(codes, 2)
+			kind = self.rand.choice(sorted(edges))
+			edges[kind].append('  {} {} {} [penwidth="{}"];'.format(
+				head, '->' if kind == 'directed' else '--', tail,
+				self.rand.randint(1, 5)))
+		
+		for kind in sorted(edges):
+			lines.append('subgraph {} {{'.format(kind))
+			lines.extend(edges[kind])
+			lines.append('}')
+		
+		lines.append('}')
+		
+		return '\n'.join(lines).encode()
+	
+	
+	def send(self, item):
+		"""
+		Sends the given (number, workload) request. Returns the (workload,
+		seconds, error or None) tuple.
+		"""
+		number, name = item
+		
+		if name == 'landing':
+			request = Request(self.url + '/')
+		elif name == 'globe':
+			request = Request(self.url + '/api/globe/{}/'.format(
+				self.globe_ids[number % len(self.globe_ids)]))
+		elif name == 'sample':
+			request = Request(self.url + '/api/file/')
+		else:
+			request = self.make_upload(self.uploads[number % len(self.uploads)])
+		
+		start = time.perf_counter()
+		
+		try:
+			self.opener.open(request, timeout=60).read()
+		except HTTPError as error:
+			return name, time.perf_counter() - start, 'HTTP {}'.format(error.code)
+		except (URLError, OSError) as error:
+			return name, time.perf_counter() - start, str(error)
+		
+		return name, time.perf_counter() - start, None
+	
+	
+	def make_upload(self, contents):
+		"""
+		Returns the multipart POST request uploading the given .dot file to
+		the file API, with the CSRF token as the front-end sends it.
+		"""
+		body = b''.join([
+			b'--' + BOUNDARY + b'\r\n',
+			b'Content-Disposition: form-data; name="file"; filename="synthetic.dot"\r\n',
+			b'Content-Type: text/vnd.graphviz\r\n\r\n',
+			contents,
+			b'\r\n--' + BOUNDARY + b'--\r\n',
+		])
+		
+		return Request(self.url + '/api/file/', data=body, headers={
+			'Content-Type': 'multipart/form-data; boundary=' + BOUNDARY.decode(),
+			'X-CSRFToken': self.csrf_token,
+		})
+	
+	
+	def report(self, results, seconds):
+		"""
+		Writes a line of throughput and latencies per workload and in total.
+		Latencies are in milliseconds, throughput in requests per second.
+		"""
+		header = '{:<10}{:>9}{:>8}{:>9}'.format('workload', 'requests', 'errors', 'req/s')
+		for percentile in PERCENTILES:
+			header += '{:>9}'.format('p{}'.format(percentile))
+		self.stdout.write(header)
+		
+		names = sorted(set(result[0] for result in results))
+		
+		for name in names + ['total']:
+			subset = [result for result in results if name in ('total', result[0])]
+			latencies = sorted(result[1] for result in subset if result[2] is None)
+			errors = [result[2] for result in subset if result[2] is not None]
+			
+			line = '{:<10}{:>9}{:>8}{:>9.1f}'.format(
+				name, len(subset), len(errors), len(subset) / seconds)
+			for percentile in PERCENTILES:
+				line += '{:>9.1f}'.format(get_percentile(latencies, percentile) * 1000)
+			self.stdout.write(line)
+			
+			if errors and name != 'total':
+				self.stderr.write("{} errors: {}".format(
+					name, ', '.join(sorted(set(errors)))))
+		
+		self.stdout.write("{} requests in {:.3f}s".format(len(results), seconds))
+
+
+
+def get_percentile(values, percentile):
+	"""
+	Returns the given percentile of the given sorted values by the nearest
+	rank method; returns NaN if there are no values.
+	"""
+	if not values:
+		return float('nan')
+	
+	rank = math.ceil(percentile / 100 * len(values))
+	
+	return values[max(rank, 1) - 1]
+
+
+
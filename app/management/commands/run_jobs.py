@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.jobs import claim_job, run_job, fail_stale_jobs, purge_jobs
+
+import time
+
+
+
+class Command(BaseCommand):
+	
+	help = (
+		"Works off the .dot files submitted to the file API as background "
+		"jobs. Run as many of these workers as needed; they coordinate "
+		"through the database."
+	)
+	
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--once',
+			action = 'store_true',
+			help = 'Exit as soon as there are no pending jobs.'
+		)
+		parser.add_argument(
+			'--sleep',
+			type = float,
+			default = 1.0,
+			help = 'Seconds to wait between polls of an empty queue.'
+		)
+		parser.add_argument(
+			'--timeout',
+			type = int,
+			default = 600,
+			help = 'Seconds after which running jobs are considered dead.'
+		)
+		parser.add_argument(
+			'--purge-after',
+			type = int,
+			default = 60 * 60 * 24,
+			help = 'Seconds after which finished jobs are deleted.'
+		)
+	
+	
+	def handle(self, *args, **options):
+		"""
+		The command's main.
+		"""
+		try:
+			assert options['sleep'] > 0
+			assert options['timeout'] > 0
+			assert options['purge_after'] > 0
+		except AssertionError:
+			raise CommandError("Please refer to --help")
+		
+		num_jobs = 0
+		
+		while True:
+			fail_stale_jobs(options['timeout'])
+			purge_jobs(options['purge_after'])
+			
+			job = claim_job()
+			
+			if job is None:
+				if options['once']:
+					break
+				time.sleep(options['sleep'])
+				continue
+			
+			start = time.perf_counter()
+			run_job(job)
+			
+			num_jobs += 1
+			self.stdout.write("Job {} {} in {:.3f}s".format(
+				job.key, job.status, time.perf_counter() - start))
+		
+		self.stdout.write("Done {} jobs".format(num_jobs))
+
+
+
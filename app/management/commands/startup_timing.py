@@ -0,0 +1,120 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from utils.json import read_json
+
+import os
+import subprocess
+import sys
+import time
+
+
+
+"""
+Run in a fresh interpreter, so that nothing is imported yet. Prints the JSON
+list of [stage, seconds] pairs.
+"""
+SCRIPT = '''
+import json, time
+laps = []
+start = time.perf_counter()
+def lap(stage):
+	global start
+	laps.append([stage, time.perf_counter() - start])
+	start = time.perf_counter()
+import django
+lap('import django')
+import numpy
+lap('import numpy')
+django.setup()
+lap('django.setup')
+import project.urls
+lap('import project.urls')
+import project.wsgi
+lap('wsgi application')
+from app import warmup
+laps.extend(['warm-up: ' + key, value] for key, value in sorted(warmup.timings.items()))
+print(json.dumps(laps))
+'''
+
+
+
+class Command(BaseCommand):
+	
+	help = (
+		"Reports how long a fresh process takes to start up: the interpreter, "
+		"the imports of Django, NumPy and the views, the setup of the apps "
+		"and, if the WARMUP setting is on, the warm-up stages (which are part "
+		"of loading the WSGI application). The timings are measured in a new "
+		"process, as the current one has everything imported already."
+	)
+	
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--runs',
+			type = int,
+			default = 3,
+			help = 'Number of processes to start; the best timings are reported.'
+		)
+	
+	
+	def handle(self, *args, **options):
+		"""
+		The command's main.
+		"""
+		try:
+			assert options['runs'] > 0
+		except AssertionError:
+			raise CommandError("Please refer to --help")
+		
+		env = dict(os.environ)
+		env.setdefault('DJANGO_SETTINGS_MODULE', settings.SETTINGS_MODULE)
+		
+		best = None
+		
+		for i in range(options['runs']):
+			laps, total = self.time_startup(env)
+			if best is None or total < best[1]:
+				best = (laps, total)
+		
+		laps, total = best
+		
+		interpreter = total - sum(seconds for stage, seconds in laps
+			if not stage.startswith('warm-up: '))
+		
+		self.stdout.write('{:<32}{:>8.3f}s'.format('interpreter', interpreter))
+		for stage, seconds in laps:
+			self.stdout.write('{:<32}{:>8.3f}s'.format(stage, seconds))
+		self.stdout.write('{:<32}{:>8.3f}s'.format('total', total))
+	
+	
+	def time_startup(self, env):
+		"""
+		Starts a new process running SCRIPT. Returns the ([stage, seconds]
+		list, total seconds) tuple.
+		"""
+		start = time.perf_counter()
+		
+		process = subprocess.run(
+			[sys.executable, '-c', SCRIPT],
+			cwd = settings.BASE_DIR,
+			env = env,
+			stdout = subprocess.PIPE,
+			stderr = subprocess.PIPE,
+			universal_newlines = True
+		)
+		
+		total = time.perf_counter() - start
+		
+		if process.returncode != 0:
+			raise CommandError("The process failed:\n" + process.stderr)
+		
+		try:
+			laps = read_json(process.stdout.strip().splitlines()[-1])
+		except (IndexError, ValueError):
+			raise CommandError("Unexpected output:\n" + process.stdout)
+		
+		return laps, total
+
+
+
@@ -0,0 +1,333 @@
+"""
+Runtime metrics of the service in the Prometheus text format: request
+latencies and response sizes per view, error counts, the sizes of the files
+parsed and the hits and misses of the in-process caches.
+
+Each process keeps its own metrics in memory and, if the METRICS_DIR setting
+is set, writes them into a file of its own therein, at most every
+METRICS_FLUSH_SECONDS: the metrics recorded in between are written by a timer
+thread once the interval is over, and by an exit handler, so that idle
+processes publish their last metrics too. The metrics view then adds up the
+files of all the processes, e.g. of all the gunicorn workers. The files of
+finished processes are kept, so that the counts do not go back; the directory
+should be emptied when the server (re)starts. Without METRICS_DIR, the view
+only shows the metrics of the process that serves it.
+"""
+from django.conf import settings
+
+from utils.json import make_json, read_json
+
+import atexit
+import math
+import os
+import threading
+import time
+
+
+
+"""
+The bucket bounds of the histograms, in seconds and in bytes.
+"""
+LATENCY_BUCKETS = (
+	0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60,)
+SIZE_BUCKETS = tuple(256 * 4 ** i for i in range(10))  # 256 B to 64 MB
+
+
+"""
+The metrics: name: (type, help, label names, buckets of the histograms).
+"""
+METRICS = {
+	'sanavirta_request_duration_seconds': (
+		'histogram', 'Time to respond to a request; to the first byte if streamed.',
+		('view', 'method', 'status'), LATENCY_BUCKETS),
+	'sanavirta_response_size_bytes': (
+		'histogram', 'Size of the response body, if known.',
+		('view',), SIZE_BUCKETS),
+	'sanavirta_errors_total': (
+		'counter', 'Responses with a 4xx or 5xx status.',
+		('view', 'status'), None),
+	'sanavirta_parse_size_bytes': (
+		'histogram', 'Size of the files uploaded for parsing.',
+		('format',), SIZE_BUCKETS),
+	'sanavirta_cache_requests_total': (
+		'counter', 'Lookups of the in-process and Django caches.',
+		('cache', 'result'), None),
+}
+
+
+"""
+The metrics of this process: (name, label values): value, the value being a
+float for counters and a [bucket counts..., sum, count] list for histograms.
+"""
+values = {}
+values_lock = threading.Lock()
+
+
+"""
+The pid that the values belong to (they are reset in forked children), the
+time of the last flush, whether the values have changed since and the timer
+of the pending flush, if any.
+"""
+owner_pid = os.getpid()
+last_flush = 0
+is_dirty = False
+flush_timer = None
+
+
+
+def claim_values():
+	"""
+	Resets the values if this process has been forked since they were last
+	recorded, so that a worker does not count its parent's requests. Expects
+	values_lock to be held.
+	"""
+	global owner_pid, last_flush, is_dirty, flush_timer
+	
+	if owner_pid != os.getpid():
+		owner_pid = os.getpid()
+		last_flush = 0
+		is_dirty = False
+		flush_timer = None  # the timer thread is not forked
+		values.clear()
+
+
+
+def inc(name, amount=1, **labels):
+	"""
+	Increments the given counter.
+	"""
+	key = (name, tuple(labels[label] for label in METRICS[name][2]))
+	
+	global is_dirty
+	
+	with values_lock:
+		claim_values()
+		values[key] = values.get(key, 0) + amount
+		is_dirty = True
+	
+	maybe_flush()
+
+
+
+def observe(name, value, **labels):
+	"""
+	Records the given value in the given histogram.
+	"""
+	global is_dirty
+	
+	buckets = METRICS[name][3]
+	key = (name, tuple(labels[label] for label in METRICS[name][2]))
+	
+	with values_lock:
+		claim_values()
+		is_dirty = True
+		
+		if key not in values:
+			values[key] = [0] * (len(buckets) + 2)
+		
+		item = values[key]
+		for i, bound in enumerate(buckets):
+			if value <= bound:
+				item[i] += 1
+				break
+		
+		item[-2] += value
+		item[-1] += 1
+	
+	maybe_flush()
+
+
+
+def record_cache(cache, is_hit):
+	"""
+	Counts a hit or a miss of the given cache.
+	"""
+	inc('sanavirta_cache_requests_total', cache=cache,
+		result='hit' if is_hit else 'miss')
+
+
+
+def get_file_path(pid=None):
+	"""
+	Returns the path of the metrics file of the given process; defaults to
+	the current process.
+	"""
+	return os.path.join(settings.METRICS_DIR,
+		'metrics-{}.json'.format(pid or os.getpid()))
+
+
+
+def maybe_flush(force=False):
+	"""
+	Writes the values into this process's file in METRICS_DIR, if set, if
+	they have changed and if METRICS_FLUSH_SECONDS have passed since the last
+	time; if the time has not passed yet, a timer is started to flush them
+	once it has. The file is replaced atomically, so that readers never see
+	it half-written, and while the lock is held, so that a flush racing with
+	another cannot replace the newer values with older ones.
+	"""
+	global last_flush, is_dirty, flush_timer
+	
+	if not getattr(settings, 'METRICS_DIR', None):
+		return
+	
+	with values_lock:
+		claim_values()
+		
+		if not force and not is_dirty:
+			return
+		
+		wait = last_flush + settings.METRICS_FLUSH_SECONDS - time.monotonic()
+		
+		if not force and wait > 0:
+			if flush_timer is None:
+				flush_timer = threading.Timer(wait, flush_pending)
+				flush_timer.daemon = True
+				flush_timer.start()
+			return
+		
+		last_flush = time.monotonic()
+		is_dirty = False
+		data = make_json([[name, list(labels), value]
+			for (name, labels), value in values.items()])
+		
+		path = get_file_path()
+		temp_path = path + '.tmp'
+		
+		with open(temp_path, 'w', encoding='utf-8') as f:
+			f.write(data)
+		
+		os.replace(temp_path, path)
+
+
+
+def flush_pending():
+	"""
+	Flushes the values that have changed since the last flush, if any; run
+	by the flush timer and at exit.
+	"""
+	global flush_timer
+	
+	with values_lock:
+		flush_timer = None
+	
+	maybe_flush(force=is_dirty)
+
+
+
+atexit.register(flush_pending)
+
+
+
+def collect():
+	"""
+	Returns the values of all the processes added up, in the form of the
+	values dict; see the module's docstring.
+	"""
+	if not getattr(settings, 'METRICS_DIR', None):
+		with values_lock:
+			claim_values()
+			return {
+				key: list(value) if isinstance(value, list) else value
+				for key, value in values.items()
+			}
+	
+	maybe_flush(force=True)
+	
+	total = {}
+	
+	for name in sorted(os.listdir(settings.METRICS_DIR)):
+		if not name.startswith('metrics-') or not name.endswith('.json'):
+			continue
+		
+		try:
+			with open(os.path.join(settings.METRICS_DIR, name), encoding='utf-8') as f:
+				items = read_json(f.read())
+		except (OSError, ValueError):
+			continue
+		
+		for metric, labels, value in items:
+			if metric not in METRICS:
+				continue
+			
+			key = (metric, tuple(labels))
+			
+			if isinstance(value, list):
+				if key not in total:
+					total[key] = [0] * len(value)
+				total[key] = [a + b for a, b in zip(total[key], value)]
+			else:
+				total[key] = total.get(key, 0) + value
+	
+	return total
+
+
+
+def render(collected):
+	"""
+	Returns the given collected values in the Prometheus text format.
+	"""
+	lines = []
+	
+	for name in sorted(METRICS):
+		kind, description, label_names, buckets = METRICS[name]
+		
+		lines.append('# HELP {} {}'.format(name, description))
+		lines.append('# TYPE {} {}'.format(name, kind))
+		
+		keys = sorted(key for key in collected if key[0] == name)
+		
+		for key in keys:
+			labels = list(zip(label_names, key[1]))
+			value = collected[key]
+			
+			if kind == 'counter':
+				lines.append('{}{} {}'.format(name, format_labels(labels),
+					format_value(value)))
+				continue
+			
+			cumulative = 0
+			for bound, count in zip(buckets + (math.inf,), value[:-2] + [None]):
+				cumulative = value[-1] if count is None else cumulative + count
+				lines.append('{}_bucket{} {}'.format(name,
+					format_labels(labels + [('le', format_value(bound))]),
+					format_value(cumulative)))
+			
+			lines.append('{}_sum{} {}'.format(name, format_labels(labels),
+				format_value(value[-2])))
+			lines.append('{}_count{} {}'.format(name, format_labels(labels),
+				format_value(value[-1])))
+	
+	return '\n'.join(lines) + '\n'
+
+
+
+def format_labels(labels):
+	"""
+	Returns the {name="value",...} string of the given (name, value) pairs.
+	"""
+	if not labels:
+		return ''
+	
+	return '{' + ','.join(
+		'{}="{}"'.format(name, str(value)
+			.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+		for name, value in labels
+	) + '}'
+
+
+
+def format_value(value):
+	"""
+	Returns the given number as the text format writes it.
+	"""
+	if value == math.inf:
+		return '+Inf'
+	
+	if isinstance(value, float) and value.is_integer():
+		return str(int(value))
+	
+	return str(value)
+
+
+
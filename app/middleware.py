@@ -0,0 +1,55 @@
+from django.utils.deprecation import MiddlewareMixin
+
+from app.metrics import inc, observe
+
+import time
+
+
+
+"""
+The request methods that label the metrics as such; the others are labelled
+as other, so that clients cannot make up label values at will.
+"""
+METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS',)
+
+
+
+class MetricsMiddleware(MiddlewareMixin):
+	"""
+	Records the latency and the response size of each request, and counts the
+	error responses, labelled by the name of the url that the request was
+	routed to (see app.metrics).
+	"""
+	
+	def process_request(self, request):
+		request.metrics_start = time.perf_counter()
+	
+	
+	def process_response(self, request, response):
+		start = getattr(request, 'metrics_start', None)
+		if start is None:
+			return response
+		
+		match = getattr(request, 'resolver_match', None)
+		view = match.url_name if match and match.url_name else 'unresolved'
+		
+		method = request.method if request.method in METHODS else 'other'
+		
+		observe('sanavirta_request_duration_seconds', time.perf_counter() - start,
+			view=view, method=method, status=str(response.status_code))
+		
+		if response.streaming:
+			size = response.get('Content-Length')
+		else:
+			size = len(response.content)
+		
+		if size is not None:
+			observe('sanavirta_response_size_bytes', int(size), view=view)
+		
+		if response.status_code >= 400:
+			inc('sanavirta_errors_total', view=view, status=str(response.status_code))
+		
+		return response
+
+
+
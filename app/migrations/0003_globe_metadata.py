@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+import hashlib
+import json
+
+
+# A frozen copy of app.globes.read_metadata and its helpers as they were when
+# this migration was written, so that later changes to these do not change it.
+
+def iter_features(data):
+    if not isinstance(data, dict):
+        return
+    if data.get('type') == 'FeatureCollection':
+        for feature in data.get('features') or []:
+            if isinstance(feature, dict):
+                yield feature
+    elif data.get('type') == 'Feature':
+        yield data
+    elif 'type' in data:
+        yield {'type': 'Feature', 'geometry': data, 'properties': {}}
+
+
+def iter_positions(geometry):
+    if not isinstance(geometry, dict):
+        return
+    if geometry.get('type') == 'GeometryCollection':
+        for member in geometry.get('geometries') or []:
+            yield from iter_positions(member)
+        return
+    stack = [geometry.get('coordinates')]
+    while stack:
+        item = stack.pop()
+        if not isinstance(item, list) or not item:
+            continue
+        if isinstance(item[0], (int, float)):
+            if len(item) >= 2:
+                yield (item[0], item[1])
+        else:
+            stack.extend(item)
+
+
+def read_metadata(geo_json):
+    if isinstance(geo_json, bytes):
+        raw = geo_json
+        geo_json = geo_json.decode()
+    else:
+        raw = geo_json.encode()
+    data = json.loads(geo_json)
+    feature_count = 0
+    bbox = None
+    for feature in iter_features(data):
+        feature_count += 1
+        for longitude, latitude in iter_positions(feature.get('geometry')):
+            if bbox is None:
+                bbox = (longitude, latitude, longitude, latitude)
+            else:
+                bbox = (
+                    min(bbox[0], longitude), min(bbox[1], latitude),
+                    max(bbox[2], longitude), max(bbox[3], latitude),
+                )
+    return {
+        'byte_size': len(raw),
+        'feature_count': feature_count,
+        'bbox': bbox,
+        'content_hash': hashlib.sha256(raw).hexdigest(),
+    }
+
+
+def fill_metadata(apps, schema_editor):
+    Globe = apps.get_model('app', 'Globe')
+    for globe in Globe.objects.all():
+        try:
+            meta = read_metadata(globe.geo_json)
+        except ValueError:
+            continue
+        globe.byte_size = meta['byte_size']
+        globe.feature_count = meta['feature_count']
+        globe.content_hash = meta['content_hash']
+        if meta['bbox'] is not None:
+            globe.west, globe.south, globe.east, globe.north = meta['bbox']
+        globe.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_auto_20151203_1257'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='globe',
+            name='byte_size',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Size of the GeoJSON string in bytes.'),
+        ),
+        migrations.AddField(
+            model_name='globe',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, help_text='SHA-256 hex digest of the GeoJSON string.', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='globe',
+            name='east',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='globe',
+            name='feature_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of features in the GeoJSON.'),
+        ),
+        migrations.AddField(
+            model_name='globe',
+            name='north',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='globe',
+            name='south',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='globe',
+            name='west',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_metadata, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_globe_metadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredGraph',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(editable=False, help_text='The permalink key.', max_length=16, unique=True)),
+                ('name', models.CharField(blank=True, max_length=240)),
+                ('data', models.BinaryField(help_text='The graph encoded by app.packing.pack_graph().')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, editable=False, help_text='Timestamp of database entry creation.')),
+            ],
+            options={
+                'ordering': ['-created'],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_storedgraph'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParseJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(editable=False, help_text='The key the client polls the job by.', max_length=16, unique=True)),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('running', 'running'), ('done', 'done'), ('failed', 'failed')], db_index=True, default='pending', max_length=8)),
+                ('contents', models.TextField(blank=True, help_text='The .dot string; emptied once the job is finished.')),
+                ('options', models.TextField(default='{}', help_text='JSON of the file API params the job was submitted with.')),
+                ('result', models.TextField(blank=True, help_text='JSON of the file API response.')),
+                ('error', models.CharField(blank=True, max_length=240)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, editable=False, help_text='Timestamp of database entry creation.')),
+                ('started', models.DateTimeField(editable=False, null=True)),
+                ('finished', models.DateTimeField(editable=False, null=True)),
+            ],
+            options={
+                'ordering': ['created'],
+            },
+        ),
+    ]
@@ -1,5 +1,10 @@
 from django.db import models
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
 from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from app.globes import read_metadata
 
 
 
@@ -12,6 +17,28 @@ class Globe(models.Model):
 	geo_json = models.TextField(
 		verbose_name = 'GeoJSON'
 	)
+	
+	byte_size = models.PositiveIntegerField(
+		default = 0,
+		editable = False,
+		help_text = 'Size of the GeoJSON string in bytes.'
+	)
+	feature_count = models.PositiveIntegerField(
+		default = 0,
+		editable = False,
+		help_text = 'Number of features in the GeoJSON.'
+	)
+	west = models.FloatField(null=True, editable=False)
+	south = models.FloatField(null=True, editable=False)
+	east = models.FloatField(null=True, editable=False)
+	north = models.FloatField(null=True, editable=False)
+	content_hash = models.CharField(
+		max_length = 64,
+		blank = True,
+		editable = False,
+		help_text = 'SHA-256 hex digest of the GeoJSON string.'
+	)
+	
 	created = models.DateTimeField(
 		default = timezone.now,
 		editable = False,
@@ -34,10 +61,85 @@ class Globe(models.Model):
 	
 	def save(self, *args, **kwargs):
 		"""
-		Overrides the default save() method in order to update last_modified.
+		Overrides the default save() method in order to update last_modified
+		and, unless the GeoJSON is deferred, the metadata derived from it.
 		"""
 		self.last_modified = timezone.now()
+		
+		if getattr(self, '_metadata_is_fresh', False):
+			self._metadata_is_fresh = False
+		elif 'geo_json' not in self.get_deferred_fields():
+			self.update_metadata()
+		
 		super().save(*args, **kwargs)
+	
+	def set_geo_json(self, geo_json, meta):
+		"""
+		Sets the GeoJSON string along with its already known metadata (see
+		app.globes.read_geo_json_file), so that the next save() does not have
+		to parse the string again.
+		"""
+		self.geo_json = geo_json
+		self.update_metadata(meta)
+		self._metadata_is_fresh = True
+	
+	def update_metadata(self, meta=None):
+		"""
+		Sets the fields that are derived from the GeoJSON string. These allow
+		listing globes without loading the (often huge) string itself. The
+		metadata is read out of the string unless given.
+		"""
+		if meta is None:
+			try:
+				meta = read_metadata(self.geo_json)
+			except ValueError:
+				meta = {
+					'byte_size': len(self.geo_json.encode()),
+					'feature_count': 0,
+					'bbox': None,
+					'content_hash': ''
+				}
+		
+		self.byte_size = meta['byte_size']
+		self.feature_count = meta['feature_count']
+		self.content_hash = meta['content_hash']
+		
+		if meta['bbox'] is None:
+			self.west, self.south, self.east, self.north = None, None, None, None
+		else:
+			self.west, self.south, self.east, self.north = meta['bbox']
+	
+	def to_dict(self):
+		"""
+		Returns the globe's metadata as dict ready for JSON serialisation.
+		The GeoJSON string is not included.
+		"""
+		if self.west is None:
+			bbox = None
+		else:
+			bbox = [self.west, self.south, self.east, self.north]
+		
+		return {
+			'id': self.pk,
+			'name': self.name,
+			'description': self.description,
+			'byte_size': self.byte_size,
+			'feature_count': self.feature_count,
+			'bbox': bbox,
+			'content_hash': self.content_hash,
+			'last_modified': self.last_modified
+		}
+
+
+
+@receiver(pre_save, sender=Globe)
+def update_raw_globe_metadata(sender, instance, raw, **kwargs):
+	"""
+	Fixtures are saved raw, i.e. without calling Globe.save(); this receiver
+	ensures that their metadata is set nonetheless.
+	"""
+	if raw:
+		instance.update_metadata()
 
 
 
@@ -80,3 +182,135 @@ class Language(models.Model):
 
 
 
+class StoredGraph(models.Model):
+	"""
+	A parsed graph stored under a short permalink. The graph itself is kept in
+	the compact binary encoding of app.packing.
+	"""
+	key = models.CharField(
+		max_length = 16,
+		unique = True,
+		editable = False,
+		help_text = 'The permalink key.'
+	)
+	name = models.CharField(
+		max_length = 240,
+		blank = True
+	)
+	data = models.BinaryField(
+		editable = False,
+		help_text = 'The graph encoded by app.packing.pack_graph().'
+	)
+	
+	created = models.DateTimeField(
+		default = timezone.now,
+		editable = False,
+		help_text = 'Timestamp of database entry creation.'
+	)
+	
+	class Meta:
+		ordering = ['-created']
+	
+	def __str__(self):
+		"""
+		Returns the model's string representation.
+		"""
+		return self.key
+	
+	def save(self, *args, **kwargs):
+		"""
+		Overrides the default save() method in order to generate the key of
+		new entries.
+		"""
+		if not self.key:
+			self.key = generate_key(StoredGraph)
+		super().save(*args, **kwargs)
+
+
+
+class ParseJob(models.Model):
+	"""
+	A .dot file submitted for parsing in the background. The jobs are picked
+	up by the run_jobs management command; see app.jobs.
+	"""
+	PENDING = 'pending'
+	RUNNING = 'running'
+	DONE = 'done'
+	FAILED = 'failed'
+	
+	STATUSES = (
+		(PENDING, 'pending'),
+		(RUNNING, 'running'),
+		(DONE, 'done'),
+		(FAILED, 'failed'),
+	)
+	
+	key = models.CharField(
+		max_length = 16,
+		unique = True,
+		editable = False,
+		help_text = 'The key the client polls the job by.'
+	)
+	status = models.CharField(
+		max_length = 8,
+		choices = STATUSES,
+		default = PENDING,
+		db_index = True
+	)
+	
+	contents = models.TextField(
+		blank = True,
+		help_text = 'The .dot string; emptied once the job is finished.'
+	)
+	options = models.TextField(
+		default = '{}',
+		help_text = 'JSON of the file API params the job was submitted with.'
+	)
+	result = models.TextField(
+		blank = True,
+		help_text = 'JSON of the file API response.'
+	)
+	error = models.CharField(
+		max_length = 240,
+		blank = True
+	)
+	
+	created = models.DateTimeField(
+		default = timezone.now,
+		editable = False,
+		help_text = 'Timestamp of database entry creation.'
+	)
+	started = models.DateTimeField(null=True, editable=False)
+	finished = models.DateTimeField(null=True, editable=False)
+	
+	class Meta:
+		ordering = ['created']
+	
+	def __str__(self):
+		"""
+		Returns the model's string representation.
+		"""
+		return self.key
+	
+	def save(self, *args, **kwargs):
+		"""
+		Overrides the default save() method in order to generate the key of
+		new entries.
+		"""
+		if not self.key:
+			self.key = generate_key(ParseJob, 12)
+		super().save(*args, **kwargs)
+
+
+
+def generate_key(model, length=8):
+	"""
+	Returns a random key that is not used yet by the given model.
+	"""
+	while True:
+		key = get_random_string(length)
+		if not model.objects.filter(key=key).exists():
+			return key
+
+
+
@@ -0,0 +1,388 @@
+"""
+Compact binary encodings of Graph instances.
+
+The storage format is used for storing parsed graphs in the database.
+Decoding does not involve any .dot parsing or database lookups. The encoded
+graph is the magic string followed by the zlib-compressed body. The body
+comprises, in this order:
+* the string table: all node names and colours, each stored only once;
+* the graph name as an index into the string table;
+* the node records, one fixed-size struct per node;
+* the edge records, one fixed-size struct per edge, with the endpoints stored
+as indices into the node records.
+
+The wire format is served by the file API to clients that accept it, as a
+much smaller and faster to produce alternative to JSON. It is laid out in
+little-endian columns that can be read with JavaScript typed arrays, each of
+them starting at a multiple of 4 bytes:
+* the header: WIRE_MAGIC, version, flags, number of nodes, number of edges,
+byte size of the graph name;
+* the graph name in UTF-8;
+* the palette: a string table of all the colours;
+* the node codes: the ISO 639-3 codes, 4 NUL-padded bytes each;
+* Float32 latitude, longitude pairs;
+* Float32 x, y pairs, only if the HAS_XY flag is set;
+* Uint16 colour, fontcolour, strokecolour, opacity quadruples: the colours are
+palette indices and the opacity is in 0-255; NO_INDEX stands for absent;
+* Uint32 head, tail pairs: node indices, with the EDGE_DIRECTED bit of the
+head set for directed edges;
+* Float32 weights, NaN standing for absent;
+* Uint16 colour, opacity pairs, as with the nodes.
+"""
+from array import array
+
+import math
+import struct
+import sys
+import zlib
+
+import numpy as np
+
+
+
+MAGIC = b'SNVG\x01'
+
+
+"""
+Absent strings are encoded with this index.
+"""
+NONE = 0xFFFFFFFF
+
+
+COUNT = struct.Struct('<I')
+STRING_LENGTH = struct.Struct('<H')
+MAX_STRING_LENGTH = 0xFFFF
+
+"""
+name, latitude, longitude, opacity flag, opacity, colour, fontcolour,
+strokecolour
+"""
+NODE = struct.Struct('<IddBdIII')
+
+"""
+head, tail, flags, weight, opacity, colour
+"""
+EDGE = struct.Struct('<IIBddI')
+
+
+"""
+Edge flags.
+"""
+DIRECTED = 1
+HAS_WEIGHT = 2
+INT_WEIGHT = 4
+HAS_OPACITY = 8
+
+
+
+"""
+The wire format's media type, magic string, version and header: magic,
+version, flags, number of nodes, number of edges, byte size of the name.
+"""
+WIRE_CONTENT_TYPE = 'application/x-sanavirta-graph'
+WIRE_MAGIC = b'SNVB'
+WIRE_VERSION = 1
+
+WIRE_HEADER = struct.Struct('<4sHHIII')
+
+"""
+Wire format flags.
+"""
+HAS_XY = 1
+
+"""
+The wire format's absent palette index or opacity, the byte size of the node
+codes, and the bit of the head word marking directed edges.
+"""
+NO_INDEX = 0xFFFF
+CODE_SIZE = 4
+EDGE_DIRECTED = 1 << 31
+
+
+
+class StringTable:
+	"""
+	Interns strings, so that each of them is encoded only once.
+	"""
+	
+	def __init__(self):
+		self.strings = []
+		self.indices = {}
+	
+	def add(self, string):
+		"""
+		Returns the index of the given string, adding it if necessary. None is
+		encoded as NONE.
+		"""
+		if string is None:
+			return NONE
+		
+		try:
+			return self.indices[string]
+		except KeyError:
+			self.indices[string] = len(self.strings)
+			self.strings.append(string)
+			return self.indices[string]
+	
+	def pack(self):
+		"""
+		Returns the bytes of the string table. Raises ValueError if a string
+		is too long for its length to fit in STRING_LENGTH.
+		"""
+		chunks = [COUNT.pack(len(self.strings))]
+		
+		for string in self.strings:
+			encoded = string.encode()
+			
+			try:
+				assert len(encoded) <= MAX_STRING_LENGTH
+			except AssertionError:
+				raise ValueError('The file has a name or a colour that is too long.')
+			
+			chunks.append(STRING_LENGTH.pack(len(encoded)))
+			chunks.append(encoded)
+		
+		return b''.join(chunks)
+
+
+
+def pack_graph(graph):
+	"""
+	Returns the bytes encoding the given Graph instance.
+	"""
+	strings = StringTable()
+	
+	node_indices = {}
+	node_records = []
+	
+	for index, (name, info) in enumerate(graph.nodes.items()):
+		node_indices[name] = index
+		node_records.append(NODE.pack(
+			strings.add(name),
+			info['latitude'], info['longitude'],
+			'opacity' in info, info.get('opacity', 0.0),
+			strings.add(info.get('colour')),
+			strings.add(info.get('fontcolour')),
+			strings.add(info.get('strokecolour'))
+		))
+	
+	edge_records = []
+	
+	for is_directed, edges in ((False, graph.undirected), (True, graph.directed)):
+		for (head, tail), info in edges.items():
+			flags = DIRECTED if is_directed else 0
+			
+			weight = info.get('weight')
+			if weight is not None:
+				flags |= HAS_WEIGHT
+				if isinstance(weight, int):
+					flags |= INT_WEIGHT
+			else:
+				weight = 0.0
+			
+			if 'opacity' in info:
+				flags |= HAS_OPACITY
+			
+			edge_records.append(EDGE.pack(
+				node_indices[head], node_indices[tail], flags,
+				weight, info.get('opacity', 0.0),
+				strings.add(info.get('colour'))
+			))
+	
+	name_index = strings.add(graph.name)
+	
+	body = b''.join([
+		strings.pack(),
+		COUNT.pack(name_index),
+		COUNT.pack(len(node_records)),
+		b''.join(node_records),
+		COUNT.pack(len(edge_records)),
+		b''.join(edge_records),
+	])
+	
+	return MAGIC + zlib.compress(body)
+
+
+
+def unpack_graph(data, graph):
+	"""
+	Populates the given Graph instance with the graph encoded in the given
+	bytes. Raises ValueError if the bytes cannot be decoded or if they hold
+	coordinates or weights that are not finite numbers.
+	"""
+	data = bytes(data)
+	
+	if not data.startswith(MAGIC):
+		raise ValueError('Unknown graph encoding.')
+	
+	try:
+		body = zlib.decompress(data[len(MAGIC):])
+		_unpack_body(body, graph)
+	except (zlib.error, struct.error, IndexError, UnicodeDecodeError):
+		raise ValueError('Corrupt graph encoding.')
+
+
+
+def _unpack_body(body, graph):
+	"""
+	Helper for unpack_graph.
+	"""
+	offset = 0
+	
+	count, = COUNT.unpack_from(body, offset)
+	offset += COUNT.size
+	
+	strings = []
+	for i in range(count):
+		length, = STRING_LENGTH.unpack_from(body, offset)
+		offset += STRING_LENGTH.size
+		strings.append(body[offset:offset+length].decode())
+		offset += length
+	
+	name_index, count = struct.unpack_from('<II', body, offset)
+	offset += 2 * COUNT.size
+	
+	graph.name = strings[name_index]
+	
+	end = offset + count * NODE.size
+	names = []
+	
+	for record in NODE.iter_unpack(body[offset:end]):
+		name, latitude, longitude, has_opacity, opacity, \
+			colour, fontcolour, strokecolour = record
+		
+		if not (math.isfinite(latitude) and math.isfinite(longitude)):
+			raise ValueError('Corrupt graph encoding.')
+		
+		info = {'latitude': latitude, 'longitude': longitude}
+		if colour != NONE:
+			info['colour'] = strings[colour]
+		if has_opacity:
+			info['opacity'] = opacity
+		if fontcolour != NONE:
+			info['fontcolour'] = strings[fontcolour]
+		if strokecolour != NONE:
+			info['strokecolour'] = strings[strokecolour]
+		
+		names.append(strings[name])
+		graph.nodes[strings[name]] = info
+	
+	offset = end
+	
+	count, = COUNT.unpack_from(body, offset)
+	offset += COUNT.size
+	
+	end = offset + count * EDGE.size
+	
+	for head, tail, flags, weight, opacity, colour in \
+			EDGE.iter_unpack(body[offset:end]):
+		info = {}
+		if flags & HAS_WEIGHT:
+			if not math.isfinite(weight):
+				raise ValueError('Corrupt graph encoding.')
+			info['weight'] = int(weight) if flags & INT_WEIGHT else weight
+		if colour != NONE:
+			info['colour'] = strings[colour]
+		if flags & HAS_OPACITY:
+			info['opacity'] = opacity
+		
+		if flags & DIRECTED:
+			graph.directed[(names[head], names[tail])] = info
+		else:
+			graph.undirected[(names[head], names[tail])] = info
+
+
+
+def pack_graph_response(graph, projection=None):
+	"""
+	Returns the bytes encoding the given Graph instance in the wire format.
+	The columns are filled straight from the graph's dicts, in the order that
+	Graph.to_dict lists the nodes and edges. If an app.projections.Projection
+	is given, the nodes' x and y coordinates are included too.
+	
+	Raises ValueError if there are too many colours for the palette.
+	"""
+	palette = StringTable()
+	
+	def colour(string):
+		index = palette.add(string)
+		if index == NONE:
+			return NO_INDEX
+		if index >= NO_INDEX:
+			raise ValueError('Too many colours.')
+		return index
+	
+	def opacity(value):
+		if value is None:
+			return NO_INDEX
+		return int(round(value * 255))
+	
+	node_indices = {}
+	codes = []
+	coords = array('f')
+	node_styles = array('H')
+	
+	for index, (name, info) in enumerate(graph.nodes.items()):
+		node_indices[name] = index
+		codes.append(name.encode()[:CODE_SIZE].ljust(CODE_SIZE, b'\0'))
+		coords.append(info['latitude'])
+		coords.append(info['longitude'])
+		node_styles.append(colour(info.get('colour')))
+		node_styles.append(colour(info.get('fontcolour')))
+		node_styles.append(colour(info.get('strokecolour')))
+		node_styles.append(opacity(info.get('opacity')))
+	
+	endpoints = array('I')
+	weights = array('f')
+	edge_styles = array('H')
+	
+	for is_directed, edges in ((False, graph.undirected), (True, graph.directed)):
+		flag = EDGE_DIRECTED if is_directed else 0
+		for (head, tail), info in edges.items():
+			endpoints.append(node_indices[head] | flag)
+			endpoints.append(node_indices[tail])
+			weights.append(info.get('weight', float('nan')))
+			edge_styles.append(colour(info.get('colour')))
+			edge_styles.append(opacity(info.get('opacity')))
+	
+	flags = 0
+	
+	columns = [b''.join(codes), coords]
+	
+	if projection is not None:
+		flags |= HAS_XY
+		points = np.frombuffer(coords, dtype=np.float32).reshape(-1, 2)
+		x, y = projection.project(points[:,1], points[:,0])
+		columns.append(np.column_stack((x, y)).astype('<f4').tobytes())
+	
+	columns.extend([node_styles, endpoints, weights, edge_styles])
+	
+	name = graph.name.encode()
+	
+	chunks = [
+		WIRE_HEADER.pack(
+			WIRE_MAGIC, WIRE_VERSION, flags,
+			len(node_indices), len(endpoints) // 2, len(name)),
+		_pad(name),
+		_pad(palette.pack()),
+	]
+	
+	for column in columns:
+		if isinstance(column, array):
+			if sys.byteorder == 'big':
+				column.byteswap()
+			column = column.tobytes()
+		chunks.append(_pad(column))
+	
+	return b''.join(chunks)
+
+
+
+def _pad(data):
+	"""
+	Returns the given bytes padded with NULs to a multiple of 4 bytes.
+	"""
+	return data + b'\0' * (-len(data) % 4)
+
+
+
@@ -0,0 +1,105 @@
+"""
+Reading uploaded graphs into the file API's responses, shared by the file API
+and the background parse jobs (see app.jobs): parsing the .dot files and edge
+lists, applying the requested projection, filters, regions, labels and
+statistics, and storing the graphs for permalinks.
+"""
+from app.filters import read_filter
+from app.graphs import Graph, ParseBudgetExceeded
+from app.labels import read_labels, plan_labels
+from app.models import StoredGraph
+from app.packing import pack_graph
+from app.profiling import phase
+from app.projections import read_projection
+from app.regions import read_regions, annotate_nodes
+from app.stats import compute_stats
+
+
+
+"""
+The column delimiters of the edge list formats that the file API accepts
+besides .dot files.
+"""
+DELIMITERS = {
+	'csv': ',',
+	'tsv': '\t',
+}
+
+
+
+def build_graph_response(contents, params, budget=None, nodes=None):
+	"""
+	Parses the given .dot string or edge list (and node table) and returns the
+	file API's response dict. The params are the request's (or the job's)
+	options. Raises ValueError.
+	"""
+	projection = read_projection(params)
+	graph_filter = read_filter(params)
+	index = read_regions(params)
+	label_projection = read_labels(params)
+	
+	graph = read_graph(contents, params, budget, nodes)
+	
+	with phase('to_dict'):
+		filtered = graph.filter(graph_filter)
+		d = filtered.to_dict(projection)
+		
+		if index is not None:
+			d['nodes'] = annotate_nodes(d['nodes'], index)
+		
+		if label_projection is not None:
+			d['labels'] = plan_labels(filtered, label_projection)
+		
+		if params.get('stats'):
+			d['stats'] = compute_stats(filtered)
+	
+	if params.get('permalink'):
+		d['permalink'] = store_graph(graph)
+	
+	return d
+
+
+
+def read_graph(contents, params, budget=None, nodes=None):
+	"""
+	Returns the Graph instance read out of the given .dot string or edge list
+	(and node table). The params' format tells which of these the contents
+	are; the budget is passed on to the Graph's read method. Raises ValueError.
+	
+	The .dot files are profiled in phases by the Graph (see app.profiling);
+	edge lists are parsed and populated as they are read, in a single phase.
+	"""
+	fmt = params.get('format') or 'dot'
+	if fmt != 'dot' and fmt not in DELIMITERS:
+		raise ValueError('Unknown file format.')
+	
+	graph = Graph()
+	
+	try:
+		if fmt == 'dot':
+			graph.read_dot_string(contents, budget)
+		else:
+			with phase('parse'):
+				graph.read_edge_list(contents, nodes, DELIMITERS[fmt], budget)
+	except ParseBudgetExceeded:
+		raise
+	except ValueError:
+		raise ValueError('File could not be parsed.')
+	
+	return graph
+
+
+
+def store_graph(graph):
+	"""
+	Stores the given Graph instance and returns its permalink key.
+	"""
+	stored = StoredGraph()
+	stored.name = graph.name[:240]
+	stored.data = pack_graph(graph)
+	stored.save()
+	
+	return stored.key
+
+
+
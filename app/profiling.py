@@ -0,0 +1,151 @@
+"""
+Sampling the memory that the phases of a request allocate, with tracemalloc.
+
+A MemoryProfile is active in the thread that entered it; the code that does
+the work marks its phases with the phase context manager below, which is a
+no-op unless a profile is active. Each phase starts with tracemalloc's traces
+cleared, so its peak and retained memory are those of its own allocations;
+the request's peak and retained memory are estimated from the phases. As the
+frees of memory allocated in earlier phases go unseen, the estimates err on
+the high side.
+
+Tracing slows allocations down and tracemalloc is process-wide, so profiling
+is off unless the MEMORY_PROFILE setting is on or the parse budget has a
+max_memory (see app.graphs.ParseBudget); and it is meant for processes that
+serve one request at a time, e.g. gunicorn's sync workers.
+"""
+from django.conf import settings
+
+from contextlib import contextmanager
+
+import logging
+import threading
+import tracemalloc
+
+
+
+logger = logging.getLogger('sanavirta.memory')
+
+
+"""
+The profile of the current thread, if any, and the number of active profiles
+in the process; tracing is on while there are any.
+"""
+local = threading.local()
+num_active = 0
+num_active_lock = threading.Lock()
+
+
+
+class MemoryProfile:
+	"""
+	Context manager: tracing is on while any profile is active. The phases
+	list holds (name, peak, retained) tuples, in bytes, in the order of the
+	phases.
+	"""
+	
+	def __init__(self, budget_name='PARSE_BUDGET'):
+		"""
+		Constructor. The profile is enabled if the MEMORY_PROFILE setting is
+		on or if the given parse budget setting has a max_memory.
+		"""
+		self.enabled = bool(getattr(settings, 'MEMORY_PROFILE', False)) \
+			or getattr(settings, budget_name, {}).get('max_memory') is not None
+		
+		self.active = False
+		self.phases = []
+	
+	def __enter__(self):
+		global num_active
+		
+		if self.enabled:
+			with num_active_lock:
+				if not num_active and not tracemalloc.is_tracing():
+					tracemalloc.start()
+				num_active += 1
+			
+			self.active = True
+			local.profile = self
+		
+		return self
+	
+	def __exit__(self, *exc_info):
+		global num_active
+		
+		if self.active:
+			self.active = False
+			local.profile = None
+			
+			with num_active_lock:
+				num_active -= 1
+				if not num_active:
+					tracemalloc.stop()
+	
+	def get_peak(self):
+		"""
+		Returns the estimated peak of the memory allocated during the profile:
+		the highest of the phases' peaks on top of what the earlier phases
+		have retained.
+		"""
+		peak = 0
+		retained = 0
+		
+		for name, phase_peak, phase_retained in self.phases:
+			peak = max(peak, retained + phase_peak)
+			retained += phase_retained
+		
+		return peak
+	
+	def get_retained(self):
+		"""
+		Returns the estimated memory allocated and not freed by the phases.
+		"""
+		return sum(item[2] for item in self.phases)
+	
+	def report(self, label, response=None):
+		"""
+		Logs the profile under the given label and adds the X-Memory-Peak,
+		X-Memory-Retained and X-Memory-Phases headers to the given response,
+		if any. Only profiles of the MEMORY_PROFILE setting are reported.
+		"""
+		if not getattr(settings, 'MEMORY_PROFILE', False):
+			return
+		
+		phases = ', '.join(
+			'{}={}/{}'.format(name, peak, retained)
+			for name, peak, retained in self.phases
+		)
+		
+		if response is not None:
+			response['X-Memory-Peak'] = str(self.get_peak())
+			response['X-Memory-Retained'] = str(self.get_retained())
+			response['X-Memory-Phases'] = phases
+		
+		logger.info('%s peak %d, retained %d bytes; phases (peak/retained) %s',
+			label, self.get_peak(), self.get_retained(), phases or 'none')
+
+
+
+@contextmanager
+def phase(name):
+	"""
+	Context manager marking a phase of the work of the current thread's
+	profile, if any. Phases should not be nested.
+	"""
+	profile = getattr(local, 'profile', None)
+	
+	if profile is None:
+		yield
+		return
+	
+	tracemalloc.clear_traces()
+	
+	try:
+		yield
+	finally:
+		if profile.active:
+			retained, peak = tracemalloc.get_traced_memory()
+			profile.phases.append((name, peak, retained))
+
+
+
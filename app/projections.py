@@ -0,0 +1,436 @@
+"""
+Map projections (in the cartographical sense) computed on the server, so that
+clients can draw globes and graphs without projecting every vertex
+themselves. All projections work on whole NumPy arrays at once.
+
+Projected coordinates are planar and unscaled, i.e. the globe has a radius of
+1; the x axis grows eastwards and the y axis southwards, as on a canvas.
+"""
+from django.core.cache import cache
+
+import io
+import math
+
+import numpy as np
+
+from app.globes import iter_features
+from app.metrics import record_cache
+from utils.json import JsonStream, make_json, read_json
+
+
+
+"""
+The number of decimals that projected coordinates are rounded to, per detail
+level. Vertices that collapse onto their predecessor are dropped.
+"""
+DETAIL_LEVELS = {0: 2, 1: 3, 2: 4, 3: 5}
+
+DEFAULT_DETAIL = 1
+
+
+"""
+Beyond these latitudes the Mercator projection is cut off.
+"""
+MERCATOR_LIMIT = math.radians(85.0511287798)
+
+
+"""
+The number of decimals that the requested centres are rounded to, so that the
+centres that share a cache key also share the projection.
+"""
+CENTRE_DECIMALS = 2
+
+
+
+class Projection:
+	"""
+	A projection is defined by its name and its centre, i.e. the geographical
+	point that is mapped onto (0, 0). For the cylindrical projections only the
+	longitude of the centre matters.
+	"""
+	
+	names = ('orthographic', 'equirectangular', 'mercator',)
+	
+	def __init__(self, name, latitude=0.0, longitude=0.0):
+		"""
+		Constructor. Raises ValueError if the projection is not known or the
+		centre is out of range.
+		"""
+		if name not in self.names:
+			raise ValueError('Unknown projection.')
+		
+		try:
+			assert -90 <= latitude <= 90
+			assert -180 <= longitude <= 180
+		except AssertionError:
+			raise ValueError('Projection centre out of range.')
+		
+		self.name = name
+		self.latitude = latitude
+		self.longitude = longitude
+	
+	
+	def __str__(self):
+		"""
+		Returns the projection's string representation, which is also used in
+		cache keys.
+		"""
+		if self.name == 'orthographic':
+			return '{}:{:.{d}f},{:.{d}f}'.format(
+				self.name, self.latitude, self.longitude, d=CENTRE_DECIMALS)
+		return '{}:{:.{d}f}'.format(self.name, self.longitude, d=CENTRE_DECIMALS)
+	
+	
+	def project(self, longitudes, latitudes):
+		"""
+		Returns the (x, y) tuple of arrays for the given arrays of longitudes
+		and latitudes (in degrees).
+		"""
+		lam = np.radians(np.asarray(longitudes, dtype=np.float64))
+		phi = np.radians(np.asarray(latitudes, dtype=np.float64))
+		
+		lam0 = math.radians(self.longitude)
+		phi0 = math.radians(self.latitude)
+		
+		if self.name == 'orthographic':
+			return self._orthographic(lam - lam0, phi, phi0)
+		
+		# cylindrical projections: wrap the longitudes around the centre
+		x = np.mod(lam - lam0 + math.pi, 2 * math.pi) - math.pi
+		
+		if self.name == 'mercator':
+			phi = np.clip(phi, -MERCATOR_LIMIT, MERCATOR_LIMIT)
+			y = -np.log(np.tan(math.pi / 4 + phi / 2))
+		else:
+			y = -phi
+		
+		return x, y
+	
+	
+	def is_visible(self, longitudes, latitudes):
+		"""
+		Returns the boolean array telling which of the given points are not
+		hidden by the projection, i.e. are not on the far hemisphere of an
+		orthographic projection.
+		"""
+		lam = np.radians(np.asarray(longitudes, dtype=np.float64))
+		phi = np.radians(np.asarray(latitudes, dtype=np.float64))
+		
+		if self.name != 'orthographic':
+			return np.ones(lam.shape, dtype=bool)
+		
+		lam0 = math.radians(self.longitude)
+		phi0 = math.radians(self.latitude)
+		
+		cos_c = math.sin(phi0) * np.sin(phi) \
+			+ math.cos(phi0) * np.cos(phi) * np.cos(lam - lam0)
+		
+		return cos_c >= 0
+	
+	
+	def _orthographic(self, dlam, phi, phi0):
+		"""
+		Projects onto the hemisphere facing the centre. Points on the far
+		hemisphere are pushed radially onto the horizon, which keeps the
+		rings they belong to closed.
+		"""
+		cos_phi = np.cos(phi)
+		cos_dlam = np.cos(dlam)
+		
+		x = cos_phi * np.sin(dlam)
+		y = math.cos(phi0) * np.sin(phi) - math.sin(phi0) * cos_phi * cos_dlam
+		
+		cos_c = math.sin(phi0) * np.sin(phi) + math.cos(phi0) * cos_phi * cos_dlam
+		hidden = cos_c < 0
+		
+		if hidden.any():
+			radius = np.hypot(x[hidden], y[hidden])
+			radius[radius == 0] = 1
+			x[hidden] /= radius
+			y[hidden] /= radius
+		
+		return x, -y
+
+
+
+def read_projection(params):
+	"""
+	Returns the Projection instance described by the given QueryDict or None
+	if no projection is requested. The centre is given as latitude,longitude
+	and rounded to CENTRE_DECIMALS, as in the projection's cache keys. Raises
+	ValueError if the params are not valid.
+	"""
+	name = params.get('projection')
+	if not name:
+		return None
+	
+	centre = params.get('centre', '0,0')
+	
+	try:
+		latitude, longitude = [
+			round(float(item), CENTRE_DECIMALS) for item in centre.split(',')]
+	except ValueError:
+		raise ValueError('Projection centre should be latitude,longitude.')
+	
+	return Projection(name, latitude, longitude)
+
+
+
+def read_detail(params):
+	"""
+	Returns the detail level given in the QueryDict; defaults to DEFAULT_DETAIL.
+	Raises ValueError if the level is not known.
+	"""
+	try:
+		detail = int(params.get('detail', DEFAULT_DETAIL))
+		assert detail in DETAIL_LEVELS
+	except (ValueError, AssertionError):
+		raise ValueError('Detail should be one of {}.'.format(
+			', '.join(map(str, sorted(DETAIL_LEVELS)))))
+	
+	return detail
+
+
+
+def project_geo_json(geo_json, projection, detail=DEFAULT_DETAIL):
+	"""
+	Returns the list of projected features of the given GeoJSON string. Each
+	feature is a list of parts (polygons or lines), each part is a list of
+	rings and each ring is a flat [x0, y0, x1, y1, ...] list.
+	
+	All the vertices of the globe are projected in one go.
+	"""
+	positions = []
+	ring_sizes = []
+	layout = []  # [] of features, each a [] of the parts' numbers of rings
+	
+	for feature in iter_features(read_json(geo_json)):
+		parts = []
+		for part in iter_parts(feature.get('geometry')):
+			num_rings = 0
+			for ring in part:
+				if not ring:
+					continue
+				positions.extend(position[:2] for position in ring)
+				ring_sizes.append(len(ring))
+				num_rings += 1
+			parts.append(num_rings)
+		layout.append(parts)
+	
+	if not positions:
+		return [[] for parts in layout]
+	
+	coords = np.array(positions, dtype=np.float64)
+	x, y = projection.project(coords[:,0], coords[:,1])
+	
+	if projection.name != 'orthographic':
+		x, y, ring_sizes, layout = cut_rings(x, y, ring_sizes, layout, projection)
+	
+	points = np.round(np.column_stack((x, y)), DETAIL_LEVELS[detail])
+	
+	# drop the vertices that collapse onto their predecessor within a ring
+	starts = np.concatenate(([0], np.cumsum(ring_sizes)[:-1]))
+	
+	keep = np.ones(len(points), dtype=bool)
+	keep[1:] = np.any(points[1:] != points[:-1], axis=1)
+	keep[starts] = True
+	
+	kept_sizes = np.add.reduceat(keep.astype(np.int64), starts)
+	
+	flat = points[keep].ravel().tolist()
+	
+	features = []
+	index, offset = 0, 0
+	
+	for parts in layout:
+		feature = []
+		for num_rings in parts:
+			part = []
+			for size in kept_sizes[index:index+num_rings].tolist():
+				part.append(flat[offset:offset+2*size])
+				offset += 2 * size
+			index += num_rings
+			feature.append(part)
+		features.append(feature)
+	
+	return features
+
+
+
+def cut_rings(x, y, ring_sizes, layout, projection):
+	"""
+	Returns the (x, y, ring sizes, layout) tuple of the given rings, projected
+	with the given cylindrical projection, with the rings that cross the map's
+	edge, i.e. the antimeridian of the projection's centre, cut there (see
+	cut_ring). The pieces of a ring replace it in its part. The arguments are
+	as in project_geo_json; these are returned as such if no ring crosses.
+	"""
+	starts = np.concatenate(([0], np.cumsum(ring_sizes)[:-1]))
+	
+	jumps = np.abs(np.diff(x)) > math.pi
+	jumps[starts[1:] - 1] = False  # from the last vertex of a ring to the next
+	
+	if not jumps.any():
+		return x, y, ring_sizes, layout
+	
+	crossing = set(
+		(np.searchsorted(starts, np.nonzero(jumps)[0], side='right') - 1).tolist())
+	
+	xs, ys, sizes, cut_layout = [], [], [], []
+	ring = 0
+	
+	for parts in layout:
+		cut_parts = []
+		for num_rings in parts:
+			num_pieces = 0
+			for i in range(ring, ring + num_rings):
+				piece = slice(starts[i], starts[i] + ring_sizes[i])
+				if i in crossing:
+					pieces = cut_ring(x[piece], y[piece], projection)
+				else:
+					pieces = [(x[piece], y[piece])]
+				
+				for piece_x, piece_y in pieces:
+					xs.append(piece_x)
+					ys.append(piece_y)
+					sizes.append(len(piece_x))
+				num_pieces += len(pieces)
+			
+			ring += num_rings
+			cut_parts.append(num_pieces)
+		cut_layout.append(cut_parts)
+	
+	return np.concatenate(xs), np.concatenate(ys), sizes, cut_layout
+
+
+
+def cut_ring(x, y, projection):
+	"""
+	Returns the [] of the (x, y) array tuples of the pieces of the given ring,
+	cut where it crosses the map's edge, i.e. where consecutive vertices are
+	more than half the map's width apart; the crossing points are
+	interpolated onto the edge. The pieces of an open ring (a line) are left
+	open. The pieces of a closed ring (a polygon's) are closed along the edge
+	or, for a piece that goes from one side of the map to the other, i.e.
+	around a pole, along the map's top or bottom.
+	"""
+	pieces = [[(x[0], y[0])]]
+	
+	for i in range(1, len(x)):
+		if abs(x[i] - x[i-1]) > math.pi:
+			edge = math.copysign(math.pi, x[i-1])
+			t = (edge - x[i-1]) / (x[i] + 2 * edge - x[i-1])
+			crossing_y = y[i-1] + t * (y[i] - y[i-1])
+			
+			pieces[-1].append((edge, crossing_y))
+			pieces.append([(-edge, crossing_y)])
+		
+		pieces[-1].append((x[i], y[i]))
+	
+	if len(x) > 3 and x[0] == x[-1] and y[0] == y[-1]:
+		# the last piece goes on into the first one
+		pieces[0] = pieces.pop()[:-1] + pieces[0]
+		
+		for piece in pieces:
+			if piece[0][0] != piece[-1][0]:  # around a pole
+				mean_y = sum(point[1] for point in piece) / len(piece)
+				pole_y = projection.project([0], [90 if mean_y < 0 else -90])[1][0]
+				piece.append((piece[-1][0], pole_y))
+				piece.append((piece[0][0], pole_y))
+			piece.append(piece[0])
+	
+	return [
+		(np.array([point[0] for point in piece]), np.array([point[1] for point in piece]))
+		for piece in pieces
+	]
+
+
+
+def iter_parts(geometry):
+	"""
+	Yields the parts of the given GeoJSON geometry as lists of rings. Lines
+	are treated as single-ring parts; points are skipped.
+	"""
+	if not isinstance(geometry, dict):
+		return
+	
+	kind = geometry.get('type')
+	coordinates = geometry.get('coordinates') or []
+	
+	if kind == 'Polygon':
+		yield coordinates
+	elif kind == 'MultiPolygon':
+		yield from coordinates
+	elif kind == 'LineString':
+		yield [coordinates]
+	elif kind == 'MultiLineString':
+		yield coordinates
+	elif kind == 'GeometryCollection':
+		for member in geometry.get('geometries') or []:
+			yield from iter_parts(member)
+
+
+
+def get_projected_globe(globe, projection, detail=DEFAULT_DETAIL):
+	"""
+	Returns the JSON string of the given globe projected with the given
+	projection and detail level. The results are cached by the globe's content
+	hash or, for globes without one (i.e. with invalid GeoJSON), by the time
+	of the last modification, so that an edited globe is never served stale.
+	
+	The globe's geo_json is only accessed (and thus loaded, if deferred) if
+	the result is not cached yet.
+	"""
+	if globe.content_hash:
+		version = globe.content_hash
+	else:
+		version = '{}@{}'.format(globe.pk, globe.last_modified.timestamp())
+	
+	# v2: the rings are cut at the map's edge
+	key = 'projected-globe:v2:{}:{}:{}'.format(version, projection, detail)
+	
+	data = cache.get(key)
+	record_cache('projected_globe', data is not None)
+	
+	if data is None:
+		data = make_json({
+			'projection': str(projection),
+			'detail': detail,
+			'features': project_geo_json(globe.geo_json, projection, detail)
+		})
+		cache.set(key, data, None)
+	
+	return data
+
+
+
+def iter_projected_features(data):
+	"""
+	Returns the iterator over the features of the given projected globe's JSON
+	string (see get_projected_globe), which decodes these one at a time
+	instead of building the whole list of features at once. The document is
+	walked up to the features array before returning, so that ValueError is
+	raised early if it is not valid; the features are not checked until
+	iterated over.
+	"""
+	stream = JsonStream(io.StringIO(data))
+	stream.expect('{')
+	
+	if stream.peek() != '}':
+		while True:
+			key = stream.decode()
+			stream.expect(':')
+			
+			if key == 'features':
+				stream.expect('[')
+				return stream.iter_array()
+			
+			stream.decode()
+			
+			if stream.expect(',}') == '}':
+				break
+	
+	raise ValueError('The globe has no features.')
+
+
+
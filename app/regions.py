@@ -0,0 +1,365 @@
+"""
+Assigning points, e.g. the nodes of a graph, to the features (countries,
+landmasses) of a globe that they fall in.
+
+Each globe gets a RegionIndex: an R-tree of the bounding boxes of the
+features' polygons, bulk loaded with the Sort-Tile-Recursive algorithm, plus
+the polygons' rings for the exact point-in-polygon tests. The index is built
+from the globe's GeoJSON on first use and kept in memory, keyed by the
+globe's content hash (see get_region_index). All the points of a query go
+down the tree together, as NumPy arrays of (point, tree node) pairs.
+"""
+from django.conf import settings
+
+from app.globes import iter_features
+from app.metrics import record_cache
+from app.models import Globe
+from utils.json import read_json
+
+from collections import OrderedDict
+
+import math
+import threading
+
+import numpy as np
+
+
+
+"""
+The maximum number of children of an R-tree node.
+"""
+NODE_SIZE = 16
+
+
+"""
+The maximum number of points that a single query may ask about.
+"""
+POINT_LIMIT = 10000
+
+
+"""
+The point-in-polygon tests are run in batches of at most this many (point,
+ring vertex) combinations, which bounds their memory.
+"""
+BATCH_SIZE = 1024 * 1024
+
+
+"""
+Maps (globe pk, content hash) tuples to RegionIndex instances, least recently
+used first; see get_region_index.
+"""
+region_indexes = OrderedDict()
+region_indexes_lock = threading.Lock()
+
+
+
+class RegionIndex:
+	"""
+	The spatial index of a globe's features. Only polygons can contain
+	points, so features without (multi)polygons are never assigned to. Where
+	features overlap, a point is assigned to the first of them.
+	"""
+	
+	def __init__(self, geo_json):
+		"""
+		Constructor. Raises ValueError if the GeoJSON cannot be parsed.
+		"""
+		self.properties = []
+		
+		rings = []  # [] of the polygons' [] of rings
+		part_features = []
+		
+		for index, feature in enumerate(iter_features(read_json(geo_json))):
+			self.properties.append(feature.get('properties') or {})
+			
+			for polygon in iter_polygons(feature.get('geometry')):
+				try:
+					polygon = [
+						np.array(ring, dtype=np.float64)[:, :2] for ring in polygon
+						if isinstance(ring, list) and len(ring) >= 3
+					]
+				except (IndexError, TypeError, ValueError):
+					raise ValueError('Invalid polygon.')
+				
+				if polygon:
+					rings.append(polygon)
+					part_features.append(index)
+		
+		boxes = np.array([
+			np.concatenate([
+				np.min(polygon[0], axis=0), np.max(polygon[0], axis=0)
+			]) for polygon in rings
+		]).reshape(-1, 4)
+		
+		order = sort_tile_recursive(boxes)
+		
+		self.rings = [rings[i] for i in order]
+		self.part_features = np.array(part_features, dtype=np.intp)[order]
+		
+		self.levels = [boxes[order]]
+		while len(self.levels[-1]) > NODE_SIZE:
+			self.levels.append(group_boxes(self.levels[-1]))
+	
+	
+	def locate(self, longitudes, latitudes):
+		"""
+		Returns the array of the indices of the features that the given
+		points are in, -1 standing for none.
+		"""
+		longitudes = np.asarray(longitudes, dtype=np.float64)
+		latitudes = np.asarray(latitudes, dtype=np.float64)
+		
+		# Where features overlap the first one wins, so each point keeps the
+		# minimum index of the features it is in; none is len(properties).
+		none = len(self.properties)
+		result = np.full(len(longitudes), none, dtype=np.intp)
+		
+		points, parts = self.search(longitudes, latitudes)
+		
+		for part in np.unique(parts):
+			feature = self.part_features[part]
+			
+			candidates = points[parts == part]
+			candidates = candidates[result[candidates] > feature]
+			if not len(candidates):
+				continue
+			
+			inside = contains(self.rings[part],
+				longitudes[candidates], latitudes[candidates])
+			np.minimum.at(result, candidates[inside], feature)
+		
+		result[result == none] = -1
+		
+		return result
+	
+	
+	def search(self, longitudes, latitudes):
+		"""
+		Returns the (points, parts) arrays of the pairs of point and polygon
+		indices where the point is within the polygon's bounding box.
+		"""
+		if not len(self.levels[0]):
+			empty = np.array([], dtype=np.intp)
+			return empty, empty
+		
+		top = self.levels[-1]
+		
+		points = np.repeat(np.arange(len(longitudes)), len(top))
+		nodes = np.tile(np.arange(len(top)), len(longitudes))
+		
+		for depth in range(len(self.levels) - 1, -1, -1):
+			if depth < len(self.levels) - 1:
+				points = np.repeat(points, NODE_SIZE)
+				nodes = (nodes[:, None] * NODE_SIZE + np.arange(NODE_SIZE)).ravel()
+				
+				valid = nodes < len(self.levels[depth])
+				points, nodes = points[valid], nodes[valid]
+			
+			boxes = self.levels[depth][nodes]
+			
+			hit = (boxes[:, 0] <= longitudes[points]) \
+				& (longitudes[points] <= boxes[:, 2]) \
+				& (boxes[:, 1] <= latitudes[points]) \
+				& (latitudes[points] <= boxes[:, 3])
+			
+			points, nodes = points[hit], nodes[hit]
+		
+		return points, nodes
+
+
+
+def iter_polygons(geometry):
+	"""
+	Yields the polygons, i.e. lists of rings, of the given GeoJSON geometry.
+	"""
+	if not isinstance(geometry, dict):
+		return
+	
+	kind = geometry.get('type')
+	coordinates = geometry.get('coordinates') or []
+	
+	if kind == 'Polygon':
+		yield coordinates
+	elif kind == 'MultiPolygon':
+		yield from coordinates
+	elif kind == 'GeometryCollection':
+		for member in geometry.get('geometries') or []:
+			yield from iter_polygons(member)
+
+
+
+def sort_tile_recursive(boxes):
+	"""
+	Returns the order of the given (west, south, east, north) boxes that
+	packs them into R-tree leaves: the boxes are sorted into vertical slices
+	by their centres' x, and each slice by their centres' y.
+	"""
+	if not len(boxes):
+		return np.array([], dtype=np.intp)
+	
+	centres = (boxes[:, :2] + boxes[:, 2:]) / 2
+	
+	num_leaves = math.ceil(len(boxes) / NODE_SIZE)
+	slice_size = math.ceil(math.sqrt(num_leaves)) * NODE_SIZE
+	
+	order = np.argsort(centres[:, 0], kind='mergesort')
+	
+	slices = []
+	for start in range(0, len(order), slice_size):
+		piece = order[start:start + slice_size]
+		slices.append(piece[np.argsort(centres[piece, 1], kind='mergesort')])
+	
+	return np.concatenate(slices)
+
+
+
+def group_boxes(boxes):
+	"""
+	Returns the bounding boxes of consecutive groups of NODE_SIZE boxes, i.e.
+	the next level of the R-tree.
+	"""
+	starts = np.arange(0, len(boxes), NODE_SIZE)
+	
+	return np.column_stack([
+		np.minimum.reduceat(boxes[:, 0], starts),
+		np.minimum.reduceat(boxes[:, 1], starts),
+		np.maximum.reduceat(boxes[:, 2], starts),
+		np.maximum.reduceat(boxes[:, 3], starts),
+	])
+
+
+
+def contains(polygon, longitudes, latitudes):
+	"""
+	Returns the boolean array telling which of the given points are within
+	the given polygon, i.e. list of (n, 2) ring arrays. The even-odd rule
+	is applied to all the rings at once, so the holes need not be told apart.
+	"""
+	edges = np.concatenate([
+		np.column_stack((ring, np.roll(ring, -1, axis=0))) for ring in polygon
+	])
+	x1, y1, x2, y2 = edges.T
+	
+	# horizontal edges never straddle a point; a slope of 1 keeps them finite
+	dy = np.where(y2 == y1, 1, y2 - y1)
+	
+	inside = np.zeros(len(longitudes), dtype=bool)
+	step = max(1, BATCH_SIZE // len(edges))
+	
+	for start in range(0, len(longitudes), step):
+		x = longitudes[start:start + step, None]
+		y = latitudes[start:start + step, None]
+		
+		straddles = (y1 > y) != (y2 > y)
+		
+		crossing = x1 + (y - y1) * (x2 - x1) / dy
+		
+		crossings = np.count_nonzero(straddles & (x < crossing), axis=1)
+		inside[start:start + step] = crossings % 2 == 1
+	
+	return inside
+
+
+
+def get_region_index(globe):
+	"""
+	Returns the RegionIndex of the given globe, building it if it is not in
+	memory yet. The last REGION_INDEX_CACHE_SIZE indexes are kept; as they
+	are keyed by content hash, an edited globe is never served stale. The
+	globe's geo_json is only accessed (and thus loaded, if deferred) if the
+	index is built. Raises ValueError if the GeoJSON cannot be parsed.
+	"""
+	key = (globe.pk, globe.content_hash)
+	
+	with region_indexes_lock:
+		index = region_indexes.get(key)
+		if index is not None:
+			region_indexes.move_to_end(key)
+	
+	record_cache('region_index', index is not None)
+	
+	if index is not None:
+		return index
+	
+	index = RegionIndex(globe.geo_json)
+	
+	if globe.content_hash:
+		with region_indexes_lock:
+			region_indexes[key] = index
+			while len(region_indexes) > settings.REGION_INDEX_CACHE_SIZE:
+				region_indexes.popitem(last=False)
+	
+	return index
+
+
+
+def read_points(params):
+	"""
+	Returns the (latitudes, longitudes) lists of the points given in the
+	QueryDict as latitude,longitude pairs separated by |, which unlike ; the
+	query string parser leaves alone. Raises ValueError if the params are not
+	valid.
+	"""
+	latitudes, longitudes = [], []
+	
+	for item in params.get('points', '').split('|'):
+		if not item.strip():
+			continue
+		
+		try:
+			latitude, longitude = [float(value) for value in item.split(',')]
+		except ValueError:
+			raise ValueError('Points should be latitude,longitude pairs.')
+		
+		latitudes.append(latitude)
+		longitudes.append(longitude)
+	
+	if len(latitudes) > POINT_LIMIT:
+		raise ValueError('At most {} points at a time, please.'.format(POINT_LIMIT))
+	
+	return latitudes, longitudes
+
+
+
+def annotate_nodes(nodes, index):
+	"""
+	Returns a copy of the given {name: {latitude, longitude, ...}} node dicts
+	with the region key of each node set to the index of the feature that the
+	node is in, or None. The given dicts, which may be shared with a Graph
+	instance, are left unchanged.
+	"""
+	names = list(nodes)
+	
+	regions = index.locate(
+		[nodes[name]['longitude'] for name in names],
+		[nodes[name]['latitude'] for name in names]
+	).tolist()
+	
+	return {
+		name: dict(nodes[name], region=region if region >= 0 else None)
+		for name, region in zip(names, regions)
+	}
+
+
+
+def read_regions(params):
+	"""
+	Returns the RegionIndex of the globe whose pk is given in the QueryDict's
+	regions param, or None if there is no such param. Raises ValueError if the
+	globe does not exist or cannot be parsed.
+	"""
+	if not params.get('regions'):
+		return None
+	
+	try:
+		globe = Globe.objects.defer('geo_json').get(pk=params['regions'])
+	except (Globe.DoesNotExist, ValueError):
+		raise ValueError('Globe not found.')
+	
+	try:
+		return get_region_index(globe)
+	except ValueError:
+		raise ValueError('Globe could not be parsed.')
+
+
+
@@ -0,0 +1,199 @@
+"""
+Statistics of graphs computed on the server, so that analysts get the degree
+distribution, the connected components and the flow through each node along
+with the parsed graph instead of exporting it to compute them elsewhere.
+
+The statistics are computed with NumPy over integer-indexed edge arrays: the
+nodes are numbered in the order of the graph's nodes dict and each edge kind
+becomes a pair of head and tail index arrays (see EdgeArrays). The degrees and
+strengths are weighted bincounts; the connected components are found by an
+array-based union-find that hooks the larger root of each edge onto the
+smaller one and then shortcuts the nodes until each points at its root, all
+edges at once, until no edge joins two roots.
+"""
+import numpy as np
+
+
+
+"""
+The mean radius of the Earth, in kilometres.
+"""
+EARTH_RADIUS = 6371.0088
+
+
+"""
+The bin edges of the edge length histogram, in kilometres; the last one is
+half the Earth's circumference, the longest great-circle distance.
+"""
+EDGE_LENGTH_BINS = (0, 100, 250, 500, 1000, 2500, 5000, 10000, 20016)
+
+
+
+class EdgeArrays:
+	"""
+	The edges of a Graph instance as arrays: the names list maps the node
+	indexes to node names; the heads and tails are the node indexes of the
+	directed and of the undirected edges, and the weights are their weights,
+	1 for the edges without a weight.
+	"""
+	
+	def __init__(self, graph):
+		self.names = list(graph.nodes)
+		
+		indexes = {name: i for i, name in enumerate(self.names)}
+		
+		self.directed = self.get_arrays(graph.directed, indexes)
+		self.undirected = self.get_arrays(graph.undirected, indexes)
+		
+		self.latitudes = np.fromiter(
+			(graph.nodes[name]['latitude'] for name in self.names),
+			dtype=np.float64, count=len(self.names))
+		self.longitudes = np.fromiter(
+			(graph.nodes[name]['longitude'] for name in self.names),
+			dtype=np.float64, count=len(self.names))
+	
+	@staticmethod
+	def get_arrays(edges, indexes):
+		"""
+		Returns the (heads, tails, weights) arrays of the given edge dict.
+		"""
+		heads = np.fromiter(
+			(indexes[head] for head, tail in edges),
+			dtype=np.int64, count=len(edges))
+		tails = np.fromiter(
+			(indexes[tail] for head, tail in edges),
+			dtype=np.int64, count=len(edges))
+		
+		weights = np.fromiter(
+			(1 if info.get('weight') is None else info['weight']
+				for info in edges.values()),
+			dtype=np.float64, count=len(edges))
+		
+		return heads, tails, weights
+	
+	def get_all(self):
+		"""
+		Returns the (heads, tails, weights) arrays of all the edges.
+		"""
+		return tuple(
+			np.concatenate([a, b]) for a, b in zip(self.directed, self.undirected))
+
+
+
+def compute_stats(graph):
+	"""
+	Returns the statistics of the given Graph instance as a dict ready for
+	JSON serialisation; see app.views.file_api.FileApiView.post.
+	"""
+	arrays = EdgeArrays(graph)
+	num_nodes = len(arrays.names)
+	
+	d_heads, d_tails, d_weights = arrays.directed
+	u_heads, u_tails, u_weights = arrays.undirected
+	heads, tails, weights = arrays.get_all()
+	
+	out_degrees = np.bincount(d_heads, minlength=num_nodes)
+	in_degrees = np.bincount(d_tails, minlength=num_nodes)
+	undirected_degrees = np.bincount(u_heads, minlength=num_nodes) \
+		+ np.bincount(u_tails, minlength=num_nodes)
+	degrees = out_degrees + in_degrees + undirected_degrees
+	
+	out_strengths = np.bincount(d_heads, d_weights, minlength=num_nodes)
+	in_strengths = np.bincount(d_tails, d_weights, minlength=num_nodes)
+	strengths = np.bincount(heads, weights, minlength=num_nodes) \
+		+ np.bincount(tails, weights, minlength=num_nodes)
+	
+	components = find_components(num_nodes, heads, tails)
+	labels, sizes = np.unique(components, return_counts=True)
+	
+	# number the components by size, the largest 0, ties by first node
+	order = np.lexsort((labels, -sizes))
+	numbers = np.empty(len(labels), dtype=np.int64)
+	numbers[order] = np.arange(len(labels))
+	node_components = numbers[np.searchsorted(labels, components)]
+	
+	lengths = haversine(
+		arrays.latitudes[heads], arrays.longitudes[heads],
+		arrays.latitudes[tails], arrays.longitudes[tails])
+	
+	counts = np.histogram(lengths, bins=EDGE_LENGTH_BINS)[0]
+	
+	nodes = {}
+	for i, name in enumerate(arrays.names):
+		nodes[name] = {
+			'in': int(in_degrees[i]),
+			'out': int(out_degrees[i]),
+			'undirected': int(undirected_degrees[i]),
+			'strength': float(strengths[i]),
+			'in_strength': float(in_strengths[i]),
+			'out_strength': float(out_strengths[i]),
+			'component': int(node_components[i]),
+		}
+	
+	return {
+		'nodes': nodes,
+		'degrees': np.bincount(degrees).tolist() if num_nodes else [],
+		'components': {
+			'count': len(labels),
+			'sizes': sizes[order].tolist(),
+		},
+		'edge_lengths': {
+			'bins': list(EDGE_LENGTH_BINS),
+			'counts': counts.tolist(),
+			'mean': float(lengths.mean()) if len(lengths) else None,
+			'median': float(np.median(lengths)) if len(lengths) else None,
+			'max': float(lengths.max()) if len(lengths) else None,
+		},
+	}
+
+
+
+def find_components(num_nodes, heads, tails):
+	"""
+	Returns the array of the root of each node's connected component, the
+	root being the lowest node index in the component, given the arrays of
+	the edges' head and tail node indexes. Edge directions do not matter.
+	"""
+	parents = np.arange(num_nodes)
+	
+	while True:
+		head_roots = parents[heads]
+		tail_roots = parents[tails]
+		
+		joining = head_roots != tail_roots
+		if not joining.any():
+			return parents
+		
+		head_roots = head_roots[joining]
+		tail_roots = tail_roots[joining]
+		
+		# hook the larger root onto the smallest of the roots it meets
+		np.minimum.at(parents,
+			np.maximum(head_roots, tail_roots), np.minimum(head_roots, tail_roots))
+		
+		# shortcut until every node points at a root
+		while True:
+			grandparents = parents[parents]
+			if np.array_equal(grandparents, parents):
+				break
+			parents = grandparents
+
+
+
+def haversine(latitudes_one, longitudes_one, latitudes_two, longitudes_two):
+	"""
+	Returns the great-circle distances, in kilometres, between the points of
+	the given arrays of latitudes and longitudes in degrees, elementwise (or
+	as the arrays broadcast).
+	"""
+	phi_one = np.radians(latitudes_one)
+	phi_two = np.radians(latitudes_two)
+	
+	a = np.sin((phi_two - phi_one) / 2) ** 2 \
+		+ np.cos(phi_one) * np.cos(phi_two) \
+		* np.sin(np.radians(longitudes_two - longitudes_one) / 2) ** 2
+	
+	return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+
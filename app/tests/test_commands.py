@@ -1,9 +1,14 @@
 from django.core.management.base import CommandError
 from django.core.management import call_command
-from django.test import TestCase
+from django.test import LiveServerTestCase, TestCase
 from django.utils.six import StringIO
 
 from app.models import Language
+from utils.json import read_json
+
+import os
+import shutil
+import tempfile
 
 
 
@@ -52,3 +57,159 @@ class HarvestLanguagesTestCase(TestCase):
 
 
 
+class LoadLanguagesTestCase(TestCase):
+	def setUp(self):
+		self.stdout = StringIO()
+		self.stderr = StringIO()
+		
+		self.opts = {'stdout': self.stdout, 'stderr': self.stderr}
+	
+	def test_nargs(self):
+		for args in (
+				[],
+				['app/fixtures/locations'] * 2,
+			):
+			with self.assertRaises(CommandError):
+				call_command('load_languages', *args, **self.opts)
+	
+	def test_fixture(self):
+		call_command(
+			'load_languages', 'app/fixtures/languages.json',
+			batch_size=7, **self.opts
+		)
+		self.assertEqual('', self.stderr.getvalue())
+		self.assertIn('Inserted 130, updated 0', self.stdout.getvalue())
+		
+		self.assertEqual(Language.objects.count(), 130)
+		
+		fin = Language.objects.get(iso_code='fin')
+		self.assertEqual(fin.latitude, 62.0)
+		self.assertEqual(fin.longitude, 25.0)
+		self.assertEqual(fin.created.year, 2015)
+		
+		zho = Language.objects.get(iso_code='zho')
+		self.assertEqual(zho.pk, 130)
+	
+	def test_locations(self):
+		fin = Language.objects.create(iso_code='fin', latitude=0.0, longitude=0.0)
+		
+		call_command('load_languages', 'app/fixtures/locations', **self.opts)
+		self.assertIn('Inserted 129, updated 1', self.stdout.getvalue())
+		
+		self.assertEqual(Language.objects.count(), 130)
+		
+		fin = Language.objects.get(pk=fin.pk)
+		self.assertEqual(fin.latitude, 62.0)
+		self.assertEqual(fin.longitude, 25.0)
+		
+		isl = Language.objects.get(iso_code='isl')
+		self.assertEqual(isl.latitude, 65.0)
+		self.assertEqual(isl.longitude, -17.0)
+	
+	def test_replace(self):
+		Language.objects.create(iso_code='xxx', latitude=0.0, longitude=0.0)
+		
+		call_command(
+			'load_languages', 'app/fixtures/locations',
+			replace=True, **self.opts
+		)
+		self.assertEqual(Language.objects.count(), 130)
+		self.assertFalse(Language.objects.filter(iso_code='xxx').exists())
+
+
+
+class StartupTimingTestCase(TestCase):
+	def test_command(self):
+		stdout = StringIO()
+		call_command('startup_timing', runs=1, stdout=stdout)
+		
+		lines = stdout.getvalue().splitlines()
+		self.assertEqual(lines[0].split()[0], 'interpreter')
+		self.assertIn('django.setup', stdout.getvalue())
+		self.assertEqual(lines[-1].split()[0], 'total')
+		
+		with self.assertRaises(CommandError):
+			call_command('startup_timing', runs=0, stdout=stdout)
+
+
+
+class ConvertGraphsTestCase(TestCase):
+	
+	fixtures = ['languages.json']
+	
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.dir)
+		
+		os.mkdir(os.path.join(self.dir, 'dots'))
+		shutil.copy('app/fixtures/sample.dot', os.path.join(self.dir, 'dots'))
+		
+		with open(os.path.join(self.dir, 'dots', 'small.dot'), 'w') as f:
+			f.write('graph small { fin []; krl []; xxx []; subgraph s { fin -- xxx []; fin -- krl []; } }')
+		
+		self.output = os.path.join(self.dir, 'out')
+		self.stdout = StringIO()
+		self.stderr = StringIO()
+	
+	def test_command(self):
+		for workers in (1, 2):
+			call_command('convert_graphs', os.path.join(self.dir, 'dots'),
+				output=self.output, workers=workers,
+				stdout=self.stdout, stderr=self.stderr)
+			
+			self.assertEqual(sorted(os.listdir(self.output)), ['sample.json', 'small.json'])
+			
+			with open(os.path.join(self.output, 'small.json')) as f:
+				graph = read_json(f.read())
+			
+			self.assertEqual(graph['name'], 'small')
+			self.assertEqual(sorted(graph['nodes']), ['fin', 'krl'])
+			self.assertEqual(len(graph['edges']), 1)
+		
+		self.assertIn('Converted 2 of 2 files', self.stdout.getvalue())
+		self.assertIn('Skipped 1 unknown languages: xxx', self.stdout.getvalue())
+		self.assertEqual(self.stderr.getvalue(), '')
+	
+	def test_failures(self):
+		with open(os.path.join(self.dir, 'dots', 'broken.dot'), 'w') as f:
+			f.write('graph {')
+		
+		with self.assertRaises(CommandError):
+			call_command('convert_graphs', os.path.join(self.dir, 'dots', '*.dot'),
+				output=self.output, workers=2,
+				stdout=self.stdout, stderr=self.stderr)
+		
+		self.assertIn('Converted 2 of 3 files', self.stdout.getvalue())
+		self.assertIn('broken.dot', self.stderr.getvalue())
+		
+		for args in ([], [os.path.join(self.dir, 'missing')]):
+			with self.assertRaises(CommandError):
+				call_command('convert_graphs', *args, output=self.output,
+					stdout=self.stdout, stderr=self.stderr)
+
+
+
+class LoadTestTestCase(LiveServerTestCase):
+	
+	fixtures = ['globes.json', 'languages.json']
+	
+	def test_command(self):
+		stdout = StringIO()
+		stderr = StringIO()
+		
+		call_command('load_test', url=self.live_server_url, requests=24,
+			concurrency=4, nodes=10, edges=20, stdout=stdout, stderr=stderr)
+		
+		lines = stdout.getvalue().splitlines()
+		self.assertEqual(lines[0].split()[:4], ['workload', 'requests', 'errors', 'req/s'])
+		
+		rows = {line.split()[0]: line.split() for line in lines[1:-1]}
+		self.assertEqual(sorted(rows), ['globe', 'landing', 'sample', 'total', 'upload'])
+		self.assertEqual(rows['total'][1:3], ['24', '0'])
+		self.assertEqual(stderr.getvalue(), '')
+		
+		with self.assertRaises(CommandError):
+			call_command('load_test', url=self.live_server_url, mix='globe=1,ftp=1')
+
+
+
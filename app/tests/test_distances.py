@@ -0,0 +1,156 @@
+from django.core.urlresolvers import reverse
+from django.test import TestCase, override_settings
+
+from app.distances import *
+from app.models import Language
+from app.stats import haversine
+from app.views.graph_api import indexed_graphs
+from utils.json import read_json
+
+import random
+
+import numpy as np
+
+
+
+class DistanceMatrixTestCase(TestCase):
+	
+	def setUp(self):
+		random.seed(5)
+		
+		self.latitudes = [random.uniform(-90, 90) for i in range(300)]
+		self.longitudes = [random.uniform(-180, 180) for i in range(300)]
+		
+		self.latitudes[1], self.longitudes[1] = self.latitudes[0], self.longitudes[0]
+		self.latitudes[2], self.longitudes[2] = self.latitudes[0], self.longitudes[0]
+		
+		self.codes = ['l{:03d}'.format(i) for i in range(300)]
+		self.matrix = DistanceMatrix(self.codes, self.latitudes, self.longitudes)
+	
+	def get_expected(self):
+		latitudes = np.array(self.latitudes)
+		longitudes = np.array(self.longitudes)
+		
+		return haversine(
+			latitudes[:, None], longitudes[:, None], latitudes[None, :], longitudes[None, :])
+	
+	@override_settings(DISTANCE_TILE_BYTES=64 * 1024)
+	def test_matrix(self):
+		self.assertEqual(self.matrix.get_tile_rows(), 6)
+		
+		matrix = self.matrix.get_matrix()
+		
+		self.assertTrue(np.allclose(matrix, self.get_expected(), rtol=1e-9, atol=1e-6))
+		self.assertTrue(np.array_equal(matrix, matrix.T))
+		self.assertTrue((np.diagonal(matrix) == 0).all())
+		self.assertEqual(matrix[0, 1], 0)
+	
+	@override_settings(DISTANCE_TILE_BYTES=64 * 1024)
+	def test_nearest(self):
+		indexes, distances = self.matrix.get_nearest(5)
+		
+		expected = self.get_expected()
+		np.fill_diagonal(expected, np.inf)
+		
+		for i in range(len(self.codes)):
+			order = sorted(range(len(self.codes)), key=lambda j: (expected[i, j], j))
+			self.assertEqual(indexes[i].tolist(), order[:5])
+			self.assertTrue(np.allclose(distances[i], expected[i, order[:5]]))
+		
+		self.assertEqual(indexes[0, :2].tolist(), [1, 2])
+		self.assertEqual(indexes[1, :2].tolist(), [0, 2])
+		
+		indexes, distances = DistanceMatrix(['a', 'b'], [0, 0], [0, 90]).get_nearest(1)
+		self.assertEqual(indexes.tolist(), [[1], [0]])
+	
+	@override_settings(DISTANCE_TILE_BYTES=1)
+	def test_binary(self):
+		data = b''.join(self.matrix.iter_binary())
+		self.assertEqual(len(data), self.matrix.get_binary_size())
+		
+		magic, version, size = DISTANCES_HEADER.unpack_from(data)
+		self.assertEqual((magic, version, size), (DISTANCES_MAGIC, DISTANCES_VERSION, 300))
+		
+		offset = DISTANCES_HEADER.size
+		self.assertEqual(data[offset:offset + 8], b'l000l001')
+		
+		offset += CODE_SIZE * 300
+		matrix = np.frombuffer(data[offset:], dtype='<f4').reshape(300, 300)
+		self.assertTrue(np.allclose(matrix, self.get_expected(), rtol=1e-6, atol=1e-2))
+
+
+
+class DistanceApiTestCase(TestCase):
+	fixtures = ['languages.json']
+	
+	def test_languages(self):
+		url = reverse('distance_api')
+		
+		with self.assertNumQueries(1):
+			response = self.client.get(url, {'languages': 'fin,rus,xxx,fin, krl'})
+		
+		self.assertEqual(response.status_code, 200)
+		
+		d = read_json(response.content)
+		self.assertEqual(d['languages'], ['fin', 'rus', 'krl'])
+		self.assertEqual(d['skipped'], ['xxx'])
+		self.assertEqual(d['distances'][0][0], 0)
+		self.assertEqual(d['distances'][0][1], d['distances'][1][0])
+		
+		fin = Language.objects.get(iso_code='fin')
+		rus = Language.objects.get(iso_code='rus')
+		self.assertAlmostEqual(d['distances'][0][1], float(haversine(
+			fin.latitude, fin.longitude, rus.latitude, rus.longitude)), places=3)
+		
+		response = self.client.post(url, {'languages': 'fin,rus,krl', 'nearest': 1})
+		d = read_json(response.content)
+		self.assertNotIn('distances', d)
+		self.assertEqual(len(d['nearest']['fin']), 1)
+		self.assertIn(d['nearest']['fin'][0][0], ('rus', 'krl'))
+		
+		response = self.client.get(url, {'languages': 'fin,rus,krl'},
+			HTTP_ACCEPT=DISTANCES_CONTENT_TYPE)
+		self.assertEqual(response['Content-Type'], DISTANCES_CONTENT_TYPE)
+		self.assertEqual(len(b''.join(response.streaming_content)),
+			int(response['Content-Length']))
+	
+	def test_graph(self):
+		with open('app/fixtures/sample.dot') as f:
+			response = self.client.post(reverse('file_api'), {'file': f, 'permalink': 1})
+		
+		d = read_json(response.content)
+		
+		indexed_graphs.clear()
+		response = self.client.get(reverse('distance_api'), {'graph': d['permalink']})
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(read_json(response.content)['languages'], sorted(d['nodes']))
+		
+		response = self.client.get(reverse('distance_api'), {'graph': 'nope'})
+		self.assertEqual(response.status_code, 404)
+	
+	@override_settings(DISTANCE_JSON_LIMIT=2, DISTANCE_LIMIT=3)
+	def test_bad_requests(self):
+		url = reverse('distance_api')
+		
+		for params in (
+			{},
+			{'graph': 'nope', 'languages': 'fin'},
+			{'languages': 'fin,rus,krl'},
+			{'languages': 'fin,rus,krl,abk'},
+			{'languages': 'fin,rus', 'nearest': 2},
+			{'languages': 'fin', 'nearest': 1},
+			{'languages': 'fin,rus', 'nearest': 'one'},
+		):
+			response = self.client.get(url, params)
+			self.assertEqual(response.status_code, 400)
+			self.assertIn('error', read_json(response.content))
+		
+		response = self.client.get(url, {'languages': 'fin,rus,krl', 'nearest': 2})
+		self.assertEqual(response.status_code, 200)
+		
+		response = self.client.get(url, {'languages': 'fin,rus,krl'},
+			HTTP_ACCEPT=DISTANCES_CONTENT_TYPE)
+		self.assertEqual(response.status_code, 200)
+
+
+
@@ -0,0 +1,97 @@
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from utils.json import make_json, read_json
+
+
+
+class ExportApiTestCase(TestCase):
+	fixtures = ['globes.json', 'languages.json']
+	
+	def get_svg(self, response):
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response['Content-Type'], 'image/svg+xml')
+		return b''.join(response.streaming_content).decode()
+	
+	def test_dot_file(self):
+		with open('app/fixtures/sample.dot', 'r') as f:
+			response = self.client.post(reverse('export_api'), {
+				'globe': 1,
+				'file': f,
+				'projection': 'orthographic',
+				'centre': '62,25',
+				'crop': '-1000,-1000,2000,2000'
+			})
+		
+		svg = self.get_svg(response)
+		self.assertTrue(svg.startswith('<?xml'))
+		self.assertTrue(svg.endswith('</svg>\n'))
+		self.assertIn('<path fill-rule="evenodd"', svg)
+		self.assertEqual(svg.count('<circle'), 44)
+		self.assertEqual(svg.count('<line'), 87 + 17)
+		self.assertEqual(svg.count('marker-end'), 17)
+	
+	def test_graph_json(self):
+		graph = {
+			'name': 'test',
+			'nodes': {
+				'fin': {'latitude': 62, 'longitude': 25},
+				'krl': {'latitude': 64, 'longitude': 32, 'colour': '"><script>'}
+			},
+			'edges': [{'head': 'fin', 'tail': 'krl', 'is_directed': True}]
+		}
+		
+		response = self.client.post(reverse('export_api'), {
+			'globe': 1,
+			'graph': make_json(graph),
+			'projection': 'equirectangular',
+			'scale': 100,
+			'crop': '0,-200,100,200'
+		})
+		
+		svg = self.get_svg(response)
+		self.assertEqual(svg.count('<circle'), 2)
+		self.assertEqual(svg.count('<line'), 1)
+		self.assertNotIn('<script>', svg)
+		
+		# the crop rectangle excludes everything west of the centre
+		response = self.client.post(reverse('export_api'), {
+			'globe': 1,
+			'graph': make_json(graph),
+			'projection': 'equirectangular',
+			'centre': '0,40',
+			'scale': 100,
+			'crop': '0,-200,100,200'
+		})
+		
+		svg = self.get_svg(response)
+		self.assertEqual(svg.count('<circle'), 0)
+	
+	def test_bad_request(self):
+		for params, status in (
+				({'globe': 42}, 404),
+				({'globe': 'one'}, 404),
+				({'globe': 1, 'projection': 'azimuthal'}, 400),
+				({'globe': 1, 'crop': '1,2,3'}, 400),
+				({'globe': 1, 'scale': -1}, 400),
+				({'globe': 1, 'graph': '{"nodes": 42}'}, 400),
+				({'globe': 1, 'crop': 'nan,0,100,100'}, 400),
+				({'globe': 1, 'crop': '0,-inf,100,100'}, 400),
+				({'globe': 1, 'graph': make_json({'nodes': {
+					'fin': {'latitude': 91, 'longitude': 25}}, 'edges': []})}, 400),
+				({'globe': 1, 'graph': '{"nodes": {"fin": {"latitude": NaN, '
+					'"longitude": 25}}, "edges": []}'}, 400),
+			):
+			response = self.client.post(reverse('export_api'), params)
+			self.assertEqual(response.status_code, status)
+			self.assertIn('error', read_json(response.content))
+		
+		response = self.client.post(reverse('export_api'), {
+			'globe': 1, 'file': SimpleUploadedFile('graph.dot', b'digraph { "\xff" }')})
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual(
+			read_json(response.content), {'error': 'File could not be parsed.'})
+
+
+
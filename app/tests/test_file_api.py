@@ -1,8 +1,11 @@
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.urlresolvers import reverse
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from utils.json import read_json
 
+import tracemalloc
+
 
 
 class FileApiTestCase(TestCase):
@@ -37,6 +40,14 @@ class FileApiTestCase(TestCase):
 		self.assertEqual(len(d), 1)
 		
 		self.assertIn('error', d)
+		
+		for params in [{}, {'async': 1}]:
+			params['file'] = SimpleUploadedFile('graph.dot', b'digraph { "\xff" }')
+			response = self.client.post(reverse('file_api'), params)
+			
+			self.assertEqual(response.status_code, 400)
+			self.assertEqual(
+				read_json(response.content), {'error': 'File could not be parsed.'})
 	
 	def test_empty_upload(self):
 		response = self.client.post(reverse('file_api'))
@@ -47,6 +58,28 @@ class FileApiTestCase(TestCase):
 		
 		self.assertIn('error', d)
 	
+	def test_projection(self):
+		with open('app/fixtures/sample.dot', 'r') as f:
+			response = self.client.post(
+				reverse('file_api'),
+				{'file': f, 'projection': 'orthographic', 'centre': '62,25'}
+			)
+		
+		self.assertEqual(response.status_code, 200)
+		
+		d = read_json(response.content)
+		self.assertEqual(len(d['nodes']), 44)
+		self.assertIn('x', d['nodes']['fin'])
+		self.assertIn('y', d['nodes']['fin'])
+		
+		with open('app/fixtures/sample.dot', 'r') as f:
+			response = self.client.post(
+				reverse('file_api'),
+				{'file': f, 'projection': 'azimuthal'}
+			)
+		
+		self.assertEqual(response.status_code, 400)
+	
 	def test_get(self):
 		response = self.client.get(reverse('file_api'))
 		self.assertEqual(response.status_code, 200)
@@ -57,6 +90,183 @@ class FileApiTestCase(TestCase):
 		self.assertEqual(d['name'], 'LanguageGraph')
 		self.assertEqual(len(d['nodes']), 44)
 		self.assertEqual(len(d['edges']), 87 + 17)
+	
+	@override_settings(PARSE_BUDGET={'max_tokens': 10})
+	def test_parse_budget(self):
+		with open('app/fixtures/sample.dot', 'r') as f:
+			response = self.client.post(
+				reverse('file_api'),
+				{'file': f}
+			)
+		
+		self.assertEqual(response.status_code, 400)
+		
+		d = read_json(response.content)
+		self.assertEqual(d['error'], 'The file has too many statements.')
+	
+	def test_edge_list(self):
+		edges = SimpleUploadedFile(
+			'edges.csv',
+			b'head,tail,directed,weight\nfin,smn,1,3\nfin,krl,0,4\n',
+			content_type = 'text/csv'
+		)
+		nodes = SimpleUploadedFile(
+			'nodes.csv',
+			b'name,colour\nfin,#00cc66\n'
+		)
+		response = self.client.post(
+			reverse('file_api'),
+			{'file': edges, 'nodes': nodes}
+		)
+		
+		self.assertEqual(response.status_code, 200)
+		
+		d = read_json(response.content)
+		self.assertEqual(len(d['nodes']), 3)
+		self.assertEqual(d['nodes']['fin']['colour'], '#00cc66')
+		self.assertEqual(len(d['edges']), 2)
+		
+		edges = SimpleUploadedFile(
+			'edges.txt',
+			b'head\ttail\nfin\tsmn\n',
+			content_type = 'text/tab-separated-values'
+		)
+		response = self.client.post(reverse('file_api'), {'file': edges})
+		
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(len(read_json(response.content)['edges']), 1)
+	
+	def test_bad_edge_list(self):
+		edges = SimpleUploadedFile('edges.csv', b'head,weight\nfin,3\n')
+		response = self.client.post(reverse('file_api'), {'file': edges})
+		
+		self.assertEqual(response.status_code, 400)
+		
+		for weight in (b'nan', b'inf', b'-Infinity'):
+			edges = SimpleUploadedFile('edges.csv', b'head,tail,weight\nfin,krl,' + weight)
+			response = self.client.post(reverse('file_api'), {'file': edges})
+			self.assertEqual(response.status_code, 400)
+		
+		edges = SimpleUploadedFile('edges.csv', b'head,tail\nfin,krl\n')
+		nodes = SimpleUploadedFile('nodes.csv', b'name,latitude,longitude\nfin,nan,25\n')
+		response = self.client.post(reverse('file_api'), {'file': edges, 'nodes': nodes})
+		self.assertEqual(response.status_code, 400)
+		
+		with open('app/fixtures/sample.dot', 'r') as f:
+			nodes = SimpleUploadedFile('nodes.csv', b'name\nfin\n')
+			response = self.client.post(
+				reverse('file_api'),
+				{'file': f, 'nodes': nodes}
+			)
+		
+		self.assertEqual(response.status_code, 400)
+		
+		d = read_json(response.content)
+		self.assertEqual(d['error'], 'Node tables go with edge lists only.')
+	
+	def test_binary_response(self):
+		with open('app/fixtures/sample.dot', 'r') as f:
+			response = self.client.post(
+				reverse('file_api'),
+				{'file': f, 'permalink': 1},
+				HTTP_ACCEPT = 'application/x-sanavirta-graph, application/json;q=0.5'
+			)
+		
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response['Content-Type'], 'application/x-sanavirta-graph')
+		self.assertIn('Accept', response['Vary'])
+		self.assertTrue(response.content.startswith(b'SNVB'))
+		self.assertTrue(response['X-Permalink'])
+		
+		response = self.client.get(
+			reverse('file_api'),
+			HTTP_ACCEPT = 'application/x-sanavirta-graph;q=0, */*'
+		)
+		self.assertEqual(response['Content-Type'], 'application/json')
+	
+	def test_filters(self):
+		with open('app/fixtures/sample.dot', 'r') as f:
+			response = self.client.post(
+				reverse('file_api'),
+				{'file': f, 'bbox': '20,55,35,70', 'min_weight': 3, 'permalink': 1}
+			)
+		
+		self.assertEqual(response.status_code, 200)
+		
+		d = read_json(response.content)
+		self.assertIn('fin', d['nodes'])
+		self.assertNotIn('deu', d['nodes'])
+		self.assertTrue(d['edges'])
+		
+		for edge in d['edges']:
+			self.assertIn(edge['head'], d['nodes'])
+			self.assertIn(edge['tail'], d['nodes'])
+			self.assertGreaterEqual(edge['weight'], 3)
+		
+		response = self.client.get(reverse('graph_api', args=[d['permalink']]))
+		self.assertEqual(len(read_json(response.content)['nodes']), 44)
+		
+		with open('app/fixtures/sample.dot', 'r') as f:
+			response = self.client.post(
+				reverse('file_api'),
+				{'file': f, 'edges': 'sideways'}
+			)
+		
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual(read_json(response.content)['error'],
+			'Edges should be one of all, directed, undirected.')
+		
+		for latitude in (b'inf', b'nan'):
+			response = self.client.post(reverse('file_api'), {
+				'file': SimpleUploadedFile('graph.dot',
+					b'graph G { abk [latitude=' + latitude + b', longitude=40]; }'),
+				'bbox': '20,55,35,70'
+			})
+			self.assertEqual(response.status_code, 400)
+			self.assertEqual(read_json(response.content)['error'],
+				'File could not be parsed.')
+	
+	@override_settings(MEMORY_PROFILE=True)
+	def test_memory_profile(self):
+		with self.assertLogs('sanavirta.memory', 'INFO'):
+			with open('app/fixtures/sample.dot', 'r') as f:
+				response = self.client.post(
+					reverse('file_api'),
+					{'file': f}
+				)
+		
+		self.assertEqual(response.status_code, 200)
+		self.assertFalse(tracemalloc.is_tracing())
+		
+		phases = [item.split('=')[0] for item in response['X-Memory-Phases'].split(', ')]
+		self.assertEqual(phases,
+			['read', 'decode', 'clean', 'parse', 'populate', 'to_dict', 'encode'])
+		
+		self.assertGreater(int(response['X-Memory-Peak']), 0)
+		self.assertGreaterEqual(int(response['X-Memory-Peak']),
+			int(response['X-Memory-Retained']))
+		
+		with override_settings(MEMORY_PROFILE=False):
+			response = self.client.get(reverse('file_api'))
+		self.assertNotIn('X-Memory-Peak', response)
+	
+	@override_settings(PARSE_BUDGET={'max_memory': 1024})
+	def test_memory_budget(self):
+		with open('app/fixtures/sample.dot', 'r') as f:
+			response = self.client.post(
+				reverse('file_api'),
+				{'file': f}
+			)
+		
+		self.assertEqual(response.status_code, 400)
+		self.assertFalse(tracemalloc.is_tracing())
+		
+		d = read_json(response.content)
+		self.assertEqual(d['error'], 'The file takes too much memory to parse.')
+		
+		with override_settings(PARSE_BUDGET={'max_memory': 1024 * 1024 * 64}):
+			response = self.client.get(reverse('file_api'))
+		self.assertEqual(response.status_code, 200)
 
 
 
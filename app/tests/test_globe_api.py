@@ -1,7 +1,9 @@
 from django.core.urlresolvers import reverse
 from django.test import TestCase
+from django.utils import timezone
 
 from app.models import Globe
+from utils.json import read_json
 
 
 
@@ -22,3 +24,110 @@ class GlobeApiTestCase(TestCase):
 
 
 
+class GlobeListApiTestCase(TestCase):
+	fixtures = ['globes.json']
+	
+	def test_good_request(self):
+		response = self.client.get(reverse('globe_list_api'))
+		self.assertEqual(response.status_code, 200)
+		
+		d = read_json(response.content)
+		self.assertEqual(d['count'], 2)
+		self.assertEqual(d['page'], 1)
+		self.assertEqual(d['num_pages'], 1)
+		self.assertEqual(len(d['globes']), 2)
+		
+		globe = Globe.objects.get(pk=d['globes'][0]['id'])
+		self.assertNotIn('geo_json', d['globes'][0])
+		self.assertEqual(d['globes'][0]['name'], globe.name)
+		self.assertEqual(d['globes'][0]['byte_size'], len(globe.geo_json.encode()))
+		self.assertEqual(d['globes'][0]['feature_count'], 127)
+		self.assertEqual(len(d['globes'][0]['bbox']), 4)
+		self.assertEqual(len(d['globes'][0]['content_hash']), 64)
+	
+	def test_pagination(self):
+		response = self.client.get(reverse('globe_list_api'), {'per_page': 1})
+		d = read_json(response.content)
+		self.assertEqual(d['num_pages'], 2)
+		self.assertEqual(len(d['globes']), 1)
+		
+		response = self.client.get(
+			reverse('globe_list_api'), {'per_page': 1, 'page': 2}
+		)
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(read_json(response.content)['page'], 2)
+		
+		response = self.client.get(
+			reverse('globe_list_api'), {'per_page': 1, 'page': 3}
+		)
+		self.assertEqual(response.status_code, 404)
+	
+	def test_bad_request(self):
+		for params in (
+				{'page': 'one'},
+				{'page': 0},
+				{'per_page': 1000},
+			):
+			response = self.client.get(reverse('globe_list_api'), params)
+			self.assertEqual(response.status_code, 400)
+			self.assertIn('error', read_json(response.content))
+
+
+
+class ProjectedGlobeApiTestCase(TestCase):
+	fixtures = ['globes.json']
+	
+	def test_good_request(self):
+		url = reverse('projected_globe_api', args=[1])
+		
+		response = self.client.get(url, {
+			'projection': 'orthographic', 'centre': '62,25', 'detail': 0
+		})
+		self.assertEqual(response.status_code, 200)
+		
+		d = read_json(response.content)
+		self.assertEqual(d['projection'], 'orthographic:62.00,25.00')
+		self.assertEqual(d['detail'], 0)
+		self.assertEqual(len(d['features']), 127)
+		
+		with self.assertNumQueries(1):  # served from the cache
+			response = self.client.get(url, {
+				'projection': 'orthographic', 'centre': '62,25', 'detail': 0
+			})
+		self.assertEqual(read_json(response.content), d)
+	
+	def test_no_content_hash(self):
+		url = reverse('projected_globe_api', args=[1])
+		features = []
+		
+		for longitude in (10, 20):  # e.g. globes saved before content hashes
+			Globe.objects.filter(pk=1).update(
+				geo_json='{"type": "LineString", "coordinates": [[0, 0], [%d, 0]]}'
+					% longitude,
+				content_hash='', last_modified=timezone.now())
+			
+			response = self.client.get(url, {'projection': 'equirectangular'})
+			self.assertEqual(response.status_code, 200)
+			features.append(read_json(response.content)['features'])
+		
+		self.assertNotEqual(features[0], features[1])
+	
+	def test_bad_request(self):
+		url = reverse('projected_globe_api', args=[1])
+		
+		for params in (
+				{},
+				{'projection': 'azimuthal'},
+				{'projection': 'mercator', 'detail': 42},
+			):
+			response = self.client.get(url, params)
+			self.assertEqual(response.status_code, 400)
+		
+		response = self.client.get(
+			reverse('projected_globe_api', args=[42]),
+			{'projection': 'mercator'}
+		)
+		self.assertEqual(response.status_code, 404)
+
+
+
@@ -0,0 +1,232 @@
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from app.globes import read_metadata, read_geo_json_file
+from app.models import Globe
+from utils.json import make_json
+
+import io
+
+
+
+class ReadMetadataTestCase(TestCase):
+	def test_feature_collection(self):
+		geo_json = make_json({
+			'type': 'FeatureCollection',
+			'features': [
+				{
+					'type': 'Feature',
+					'properties': {},
+					'geometry': {
+						'type': 'Polygon',
+						'coordinates': [[[0, 0], [10, 5], [-20, 40], [0, 0]]]
+					}
+				},
+				{
+					'type': 'Feature',
+					'properties': {},
+					'geometry': {
+						'type': 'MultiPolygon',
+						'coordinates': [[[[30, -10], [31, -11], [30, -10]]]]
+					}
+				}
+			]
+		})
+		
+		meta = read_metadata(geo_json)
+		self.assertEqual(meta['byte_size'], len(geo_json.encode()))
+		self.assertEqual(meta['feature_count'], 2)
+		self.assertEqual(meta['bbox'], (-20, -11, 31, 40))
+		self.assertEqual(len(meta['content_hash']), 64)
+		
+		self.assertEqual(read_metadata(geo_json.encode()), meta)
+	
+	def test_empty(self):
+		meta = read_metadata('{"type": "FeatureCollection", "features": []}')
+		self.assertEqual(meta['feature_count'], 0)
+		self.assertIsNone(meta['bbox'])
+		
+		with self.assertRaises(ValueError):
+			read_metadata('{"type": ')
+
+
+
+class GlobeMetadataTestCase(TestCase):
+	def test_save(self):
+		globe = Globe()
+		globe.name = 'Point'
+		globe.geo_json = '{"type": "Point", "coordinates": [25.0, 62.0]}'
+		globe.save()
+		
+		globe = Globe.objects.defer('geo_json').get(pk=globe.pk)
+		self.assertEqual(globe.feature_count, 1)
+		self.assertEqual(globe.west, 25.0)
+		self.assertEqual(globe.north, 62.0)
+		
+		globe.description = 'A single point.'
+		globe.save()
+		
+		globe = Globe.objects.get(pk=globe.pk)
+		self.assertEqual(globe.feature_count, 1)
+		self.assertEqual(globe.byte_size, len(globe.geo_json))
+	
+	def test_set_geo_json(self):
+		globe = Globe(name='Point')
+		globe.set_geo_json('{"type": "Point"}', {
+			'byte_size': 17, 'feature_count': 5, 'bbox': None, 'content_hash': 'x'})
+		globe.save()
+		
+		globe = Globe.objects.defer('geo_json').get(pk=globe.pk)
+		self.assertEqual(globe.feature_count, 5)
+		self.assertEqual(globe.content_hash, 'x')
+
+
+
+class ReadGeoJsonFileTestCase(TestCase):
+	
+	fixtures = ['globes.json']
+	
+	def read(self, string, **kwargs):
+		return read_geo_json_file(io.BytesIO(string.encode('utf-8')), **kwargs)
+	
+	def test_globes(self):
+		for globe in Globe.objects.all():
+			for chunk_size in (7, 1024 * 64):
+				geo_json, meta = self.read(globe.geo_json, chunk_size=chunk_size)
+				self.assertEqual(geo_json, globe.geo_json)
+				self.assertEqual(meta, read_metadata(globe.geo_json))
+	
+	def test_unicode(self):
+		string = make_json({
+			'type': 'FeatureCollection',
+			'features': [{
+				'type': 'Feature',
+				'properties': {'name': 'Ma\u00e4n \u5730\u7403'},
+				'geometry': {'type': 'Point', 'coordinates': [25, 62]}
+			}]
+		})
+		
+		geo_json, meta = self.read(string, chunk_size=3)
+		self.assertEqual(geo_json, string)
+		self.assertEqual(meta, read_metadata(string))
+		
+		with self.assertRaisesRegex(ValueError, 'UTF-8'):
+			read_geo_json_file(io.BytesIO(string.encode('utf-16')))
+	
+	def test_invalid(self):
+		point = '{"type": "Feature", "geometry": {"type": "Point", "coordinates": %s}}'
+		
+		for string, message in [
+			('', 'Expected {'),
+			('[]', 'Expected {'),
+			('{"type": "Feature"}', 'not a GeoJSON FeatureCollection'),
+			('{"type": "FeatureCollection", "features": []}', 'no features'),
+			('{"type": "FeatureCollection", "features": [1]}', 'Feature 1'),
+			('{"type": "FeatureCollection", "features": [%s, %s]}' % (
+				point % '[0, 0]', point % '[200, 0]'), 'Feature 2: Position out of range'),
+			('{"type": "FeatureCollection", "features": [%s]}' % (
+				point % '[NaN, 10]'), 'Feature 1: Position out of range'),
+			('{"type": "FeatureCollection", "features": [%s]}' % (
+				point % '[0, -Infinity]'), 'Feature 1: Position out of range'),
+			('{"type": "FeatureCollection", "features": [%s]}' % (
+				point % '[[0, 0]]'), 'Feature 1: Invalid Point position'),
+			('{"type": "FeatureCollection", "features": [%s]}' % (
+				point % '["0", 0]'), 'Feature 1: Invalid Point position'),
+			('{"type": "FeatureCollection", "features": [%s %s]}' % (
+				point % '[0, 0]', point % '[0, 0]'), 'Expected'),
+			('{"type": "FeatureCollection", "features": [%s,]}' % (
+				point % '[0, 0]'), 'Invalid'),
+			('{"type": "FeatureCollection", "features": [%s]} []' % (
+				point % '[0, 0]'), 'Unexpected data'),
+			('{"type": "FeatureCollection", "features": [%s, %s, %s]}' % (
+				(point % '[0, 0]',) * 3), 'more than 2 features'),
+		]:
+			with self.assertRaisesRegex(ValueError, message):
+				self.read(string, max_features=2, chunk_size=5)
+
+
+
+class GlobeAdminTestCase(TestCase):
+	
+	fixtures = ['globes.json']
+	
+	def setUp(self):
+		user = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+		self.client.force_login(user)
+	
+	def upload(self, string):
+		return SimpleUploadedFile('globe.json', string.encode('utf-8'))
+	
+	def test_add(self):
+		string = Globe.objects.first().geo_json
+		
+		response = self.client.post(reverse('admin:app_globe_add'), {
+			'name': 'Uploaded',
+			'description': 'Uploaded.',
+			'geo_json_file': self.upload(string)
+		})
+		self.assertEqual(response.status_code, 302)
+		
+		globe = Globe.objects.get(name='Uploaded')
+		self.assertEqual(globe.geo_json, string)
+		self.assertEqual(globe.feature_count, read_metadata(string)['feature_count'])
+		
+		response = self.client.post(reverse('admin:app_globe_add'), {
+			'name': 'Missing',
+			'description': ''
+		})
+		self.assertEqual(response.status_code, 200)
+		self.assertContains(response, 'Please upload a GeoJSON file.')
+		
+		response = self.client.post(reverse('admin:app_globe_add'), {
+			'name': 'Invalid',
+			'description': 'Uploaded.',
+			'geo_json_file': self.upload('{"type": "Point"}')
+		})
+		self.assertEqual(response.status_code, 200)
+		self.assertContains(response, 'not a GeoJSON FeatureCollection')
+		self.assertFalse(Globe.objects.filter(name__in=['Missing', 'Invalid']).exists())
+	
+	def test_change(self):
+		globe = Globe.objects.first()
+		url = reverse('admin:app_globe_change', args=[globe.pk])
+		
+		response = self.client.get(url)
+		self.assertEqual(response.status_code, 200)
+		
+		response = self.client.post(url, {
+			'name': 'Renamed',
+			'description': 'Kept.'
+		})
+		self.assertEqual(response.status_code, 302)
+		
+		changed = Globe.objects.get(pk=globe.pk)
+		self.assertEqual(changed.name, 'Renamed')
+		self.assertEqual(changed.geo_json, globe.geo_json)
+		self.assertEqual(changed.content_hash, globe.content_hash)
+		
+		string = make_json({
+			'type': 'FeatureCollection',
+			'features': [{
+				'type': 'Feature',
+				'properties': {},
+				'geometry': {'type': 'Point', 'coordinates': [25, 62]}
+			}]
+		})
+		
+		response = self.client.post(url, {
+			'name': 'Renamed',
+			'description': 'Uploaded.',
+			'geo_json_file': self.upload(string)
+		})
+		self.assertEqual(response.status_code, 302)
+		
+		changed = Globe.objects.get(pk=globe.pk)
+		self.assertEqual(changed.geo_json, string)
+		self.assertEqual(changed.feature_count, 1)
+		self.assertEqual(changed.west, 25)
+
+
+
@@ -0,0 +1,191 @@
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from app.graphs import Graph
+from app.models import StoredGraph
+from app.packing import *
+from app.projections import Projection
+from app.views.graph_api import indexed_graphs
+from utils.json import make_json, read_json
+
+import numpy as np
+
+
+
+class PackingTestCase(TestCase):
+	fixtures = ['languages.json']
+	
+	def test_round_trip(self):
+		graph = Graph()
+		with open('app/fixtures/sample.dot') as f:
+			graph.read_dot_string(f.read())
+		
+		data = pack_graph(graph)
+		
+		other = Graph()
+		with self.assertNumQueries(0):
+			unpack_graph(data, other)
+		
+		self.assertEqual(other.name, graph.name)
+		self.assertEqual(other.nodes, graph.nodes)
+		self.assertEqual(other.undirected, graph.undirected)
+		self.assertEqual(other.directed, graph.directed)
+		self.assertEqual(other.to_dict(), graph.to_dict())
+	
+	def test_wire_format(self):
+		graph = Graph()
+		with open('app/fixtures/sample.dot') as f:
+			graph.read_dot_string(f.read())
+		
+		data = pack_graph_response(graph, Projection('orthographic'))
+		self.assertLess(len(data), len(make_json(graph.to_dict())) / 4)
+		
+		magic, version, flags, num_nodes, num_edges, name_size = \
+			WIRE_HEADER.unpack_from(data)
+		self.assertEqual(magic, WIRE_MAGIC)
+		self.assertEqual(flags, HAS_XY)
+		self.assertEqual(num_nodes, 44)
+		self.assertEqual(num_edges, 87 + 17)
+		
+		offset = WIRE_HEADER.size
+		self.assertEqual(data[offset:offset+name_size].decode(), 'LanguageGraph')
+		offset += name_size + (-name_size % 4)
+		
+		num_colours = COUNT.unpack_from(data, offset)[0]
+		colours, size = [], COUNT.size
+		for i in range(num_colours):
+			length = STRING_LENGTH.unpack_from(data, offset + size)[0]
+			size += STRING_LENGTH.size
+			colours.append(data[offset+size:offset+size+length].decode())
+			size += length
+		offset += size + (-size % 4)
+		
+		def column(dtype, count):
+			nonlocal offset
+			values = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+			offset += values.nbytes + (-values.nbytes % 4)
+			return values
+		
+		codes = [code.rstrip(b'\0').decode() for code in
+			column('S4', num_nodes).tolist()]
+		self.assertEqual(codes, list(graph.to_dict()['nodes']))
+		
+		coords = column('<f4', 2 * num_nodes)
+		xy = column('<f4', 2 * num_nodes)
+		index = codes.index('fin')
+		self.assertAlmostEqual(
+			coords[2*index], graph.nodes['fin']['latitude'], places=4)
+		self.assertLess(abs(xy[2*index]), 1)
+		
+		node_styles = column('<u2', 4 * num_nodes)
+		endpoints = column('<u4', 2 * num_edges)
+		weights = column('<f4', num_edges)
+		edge_styles = column('<u2', 2 * num_edges)
+		self.assertEqual(offset, len(data))
+		
+		edges = graph.to_dict()['edges']
+		for i in (0, num_edges - 1):
+			head = int(endpoints[2*i])
+			self.assertEqual(codes[head & ~EDGE_DIRECTED], edges[i]['head'])
+			self.assertEqual(codes[endpoints[2*i+1]], edges[i]['tail'])
+			self.assertEqual(bool(head & EDGE_DIRECTED), edges[i]['is_directed'])
+			self.assertEqual(weights[i], edges[i]['weight'])
+			self.assertEqual(colours[edge_styles[2*i]], edges[i]['colour'])
+			self.assertAlmostEqual(
+				edge_styles[2*i+1] / 255, edges[i]['opacity'], places=2)
+	
+	def test_bad_data(self):
+		for data in (b'', b'SNVG\x01garbage', b'SNVG\x01' + b'x\x9c\x03\x00\x00\x00\x00\x01'):
+			with self.assertRaises(ValueError):
+				unpack_graph(data, Graph())
+		
+		graph = Graph()
+		graph.nodes['fin'] = {'latitude': float('inf'), 'longitude': 25}
+		with self.assertRaises(ValueError):
+			unpack_graph(pack_graph(graph), Graph())
+	
+	def test_long_strings(self):
+		graph = Graph()
+		graph.name = 'x' * MAX_STRING_LENGTH
+		unpack_graph(pack_graph(graph), Graph())
+		
+		graph.name += 'x'
+		with self.assertRaises(ValueError):
+			pack_graph(graph)
+		
+		response = self.client.post(reverse('file_api'), {
+			'file': SimpleUploadedFile('long.dot', b'graph ' + b'x' * 70000 + b' { fin; }'),
+			'permalink': 1
+		})
+		self.assertEqual(response.status_code, 400)
+
+
+
+class GraphApiTestCase(TestCase):
+	fixtures = ['languages.json']
+	
+	def test_permalink(self):
+		with open('app/fixtures/sample.dot', 'r') as f:
+			response = self.client.post(
+				reverse('file_api'),
+				{'file': f, 'permalink': 1}
+			)
+		
+		self.assertEqual(response.status_code, 200)
+		
+		d = read_json(response.content)
+		self.assertIn('permalink', d)
+		self.assertEqual(StoredGraph.objects.count(), 1)
+		
+		with self.assertNumQueries(1):
+			response = self.client.get(reverse('graph_api', args=[d['permalink']]))
+		
+		self.assertEqual(response.status_code, 200)
+		
+		stored = read_json(response.content)
+		self.assertEqual(stored['name'], 'LanguageGraph')
+		self.assertEqual(stored['nodes'], d['nodes'])
+		self.assertEqual(stored['edges'], d['edges'])
+	
+	def test_not_found(self):
+		response = self.client.get(reverse('graph_api', args=['nonexistent']))
+		self.assertEqual(response.status_code, 404)
+		self.assertIn('error', read_json(response.content))
+	
+	def test_filters(self):
+		with open('app/fixtures/sample.dot', 'r') as f:
+			response = self.client.post(
+				reverse('file_api'),
+				{'file': f, 'permalink': 1}
+			)
+		
+		key = read_json(response.content)['permalink']
+		url = reverse('graph_api', args=[key])
+		
+		response = self.client.get(url, {'subset': 'fin,krl,olo,xxx', 'edges': 'undirected'})
+		self.assertEqual(response.status_code, 200)
+		
+		d = read_json(response.content)
+		self.assertEqual(sorted(d['nodes']), ['fin', 'krl', 'olo'])
+		self.assertTrue(d['edges'])
+		for edge in d['edges']:
+			self.assertFalse(edge['is_directed'])
+		
+		self.assertIn(key, indexed_graphs)
+		
+		with self.assertNumQueries(1):
+			response = self.client.get(url, {'bbox': '-180,-90,180,90'})
+		self.assertEqual(len(read_json(response.content)['nodes']), 44)
+		
+		response = self.client.get(url, {'bbox': 'everywhere'})
+		self.assertEqual(response.status_code, 400)
+		
+		StoredGraph.objects.filter(key=key).delete()
+		
+		response = self.client.get(url)
+		self.assertEqual(response.status_code, 404)
+		self.assertNotIn(key, indexed_graphs)
+
+
+
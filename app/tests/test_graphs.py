@@ -1,7 +1,14 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
+from app.filters import GraphFilter, read_filter
 from app.graphs import *
 
+from contextlib import ExitStack
+from unittest import mock
+
+import math
+import random
+
 
 
 class GraphTestCase(TestCase):
@@ -49,6 +56,135 @@ class GraphTestCase(TestCase):
 			{'weight': 2, 'colour': '#00cc66', 'opacity': 0.6235294117647059}
 		)
 	
+	def test_iter_dot_lines(self):
+		with open('app/fixtures/sample.dot') as f:
+			dot_string = f.read()
+		self.graph.read_dot_string(dot_string)
+		
+		for lines in (dot_string.splitlines(True), list(dot_string)):
+			graph = Graph()
+			items = list(graph.iter_dot_lines(lines))
+			self.assertEqual(graph.to_dict(), self.graph.to_dict())
+			self.assertEqual(len(items), 44 + 87 + 17)
+		
+		string = (
+			'graph G { /* a; { */ fin [color="#ff0000"]; // b }\n'
+			'subgraph { fin -- krl [penwidth=1]; } krl [color=blue]; '
+			'subgraph { fin -- krl [penwidth=2]; } } /* c'
+		)
+		graph = Graph()
+		items = list(graph.iter_dot_lines([string[i:i+3] for i in range(0, len(string), 3)]))
+		
+		self.assertEqual(graph.name, 'G')
+		self.assertEqual(items, [
+			('node', 'fin'), ('node', 'krl'), ('edge', (False, ('fin', 'krl')))])
+		self.assertEqual(graph.undirected, {('fin', 'krl'): {'weight': 2}})
+		
+		for string in ('', 'graph G { fin [];', 'graph G } {', 'graph G { } x', 'G { }'):
+			with self.assertRaises(ValueError):
+				list(Graph().iter_dot_lines([string]))
+	
+	def test_read_edge_list(self):
+		nodes = (
+			'name,latitude,longitude,colour\n'
+			'fin,,,#00cc66ed\n'
+			'smn,70.0,27.0,\n'
+		)
+		edges = [
+			'head,tail,directed,weight,colour\n',
+			'fin,smn,yes,3,#00cc66ed\n',
+			'fin,krl,no,4,\n',
+			'fin,xxx,,,\n',
+			'krl,fin\n',
+		]
+		self.graph.read_edge_list(edges, nodes)
+		
+		self.assertEqual(set(self.graph.nodes), {'fin', 'smn', 'krl'})
+		self.assertEqual(self.graph.nodes['fin']['colour'], '#00cc66')
+		self.assertEqual(self.graph.nodes['smn']['latitude'], 70.0)
+		
+		self.assertEqual(
+			self.graph.directed[('fin', 'smn')],
+			{'weight': 3, 'colour': '#00cc66', 'opacity': 0.9294117647058824}
+		)
+		self.assertEqual(self.graph.undirected[('fin', 'krl')], {})  # krl,fin is last
+		self.assertNotIn(('krl', 'fin'), self.graph.undirected)
+		self.assertEqual(len(self.graph.undirected), 1)
+		
+		graph = Graph()
+		graph.read_edge_list('head\ttail\tdirected\nfin\tsmn\tno\n', delimiter='\t')
+		self.assertEqual(len(graph.undirected), 1)
+		
+		with self.assertRaises(ValueError):
+			Graph().read_edge_list('head,weight\nfin,1\n')
+	
+	def test_add_edge(self):
+		for name in ('fin', 'krl', 'smn'):
+			self.graph.add_node(name)
+		
+		self.assertEqual(self.graph.add_edge('krl', 'fin', False, {'weight': 1}), ('fin', 'krl'))
+		self.assertEqual(self.graph.add_edge('krl', 'fin', True, {'weight': 2}), ('krl', 'fin'))
+		self.assertEqual(self.graph.add_edge('fin', 'krl', False, {'weight': 3}), ('fin', 'krl'))
+		self.assertIsNone(self.graph.add_edge('fin', 'xxx', False, {}))
+		
+		self.assertEqual(self.graph.undirected, {('fin', 'krl'): {'weight': 3}})
+		self.assertEqual(self.graph.directed, {('krl', 'fin'): {'weight': 2}})
+		
+		self.assertEqual(len(self.graph.to_dict()['edges']), 2)
+		
+		self.assertEqual(self.graph.add_edge('fin', 'smn'), ('fin', 'smn'))
+		self.assertEqual(self.graph.undirected[('fin', 'smn')], {})
+	
+	def test_non_finite(self):
+		for value in (math.inf, -math.inf, math.nan):
+			with self.assertRaises(ValueError):
+				self.graph.add_node('fin', {'latitude': value})
+			with self.assertRaises(ValueError):
+				self.graph.add_node('fin', {'longitude': value})
+			
+			self.graph.add_node('fin')
+			self.graph.add_node('krl')
+			with self.assertRaises(ValueError):
+				self.graph.add_edge('fin', 'krl', False, {'weight': value})
+		
+		for value in ('inf', '-inf', 'nan'):
+			with self.assertRaises(ValueError):
+				Graph().read_dot_string(
+					'graph G { fin [latitude=%s]; }' % value, ParseBudget())
+	
+	def test_edge_aggregation(self):
+		edges = [
+			{'weight': 2, 'colour': '#000000'},
+			{'colour': '#ffffff', 'opacity': 0.5},
+			{'weight': 5},
+			{'weight': 1, 'colour': '#00cc66'},
+		]
+		expected = {
+			('sum', 'first'): {'weight': 8, 'colour': '#000000'},
+			('max', 'last'): {'weight': 5, 'colour': '#00cc66'},
+			('first', 'first'): {'weight': 2, 'colour': '#000000'},
+			('last', 'last'): {'weight': 1, 'colour': '#00cc66'},
+		}
+		
+		for (weight, style), information in expected.items():
+			graph = Graph(aggregation=EdgeAggregation(weight, style))
+			graph.add_node('fin')
+			graph.add_node('krl')
+			
+			for i, edge in enumerate(edges):
+				if i % 2:
+					graph.add_edge('krl', 'fin', False, dict(edge))
+				else:
+					graph.add_edge('fin', 'krl', False, dict(edge))
+			
+			self.assertEqual(graph.undirected, {('fin', 'krl'): information})
+		
+		with self.assertRaises(ValueError):
+			EdgeAggregation('mean')
+		
+		with override_settings(EDGE_AGGREGATION={'weight': 'sum'}):
+			self.assertEqual(Graph().aggregation.weight, 'sum')
+	
 	def test_to_dict(self):
 		self.graph.add_node('fin')
 		self.graph.add_node('smn')
@@ -132,6 +268,347 @@ class ElementTestCase(TestCase):
 		self.assertEqual(f('white'), ('white', None))
 		self.assertEqual(f('#000000ff'), ('#000000', 1.0))
 		self.assertEqual(f('#00000000'), ('#000000', 0.0))
+	
+	def test_attr_stmt_element_unquoted(self):
+		elem = AttrStmtElement()
+		elem.parse('fontname=Arial, fontcolor=blue,color=#ff0000,penwidth=2')
+		self.assertEqual(elem.attr, {
+			'fontname': 'Arial',
+			'fontcolor': 'blue',
+			'color': '#ff0000',
+			'penwidth': '2'
+		})
+		
+		elem = AttrStmtElement()
+		with self.assertRaises(ValueError):
+			elem.parse('label="two words"')
+	
+	def test_clean_dot_string(self):
+		f = Graph()._clean_dot_string
+		
+		self.assertEqual(f('a /* b */ c /* d */ e'), 'a   c   e')
+		self.assertEqual(f('a // b\nc'), 'a   c')
+		self.assertEqual(f('a [URL="http://x"]; /* b'), 'a [URL="http://x"];  ')
+
+
+
+class CountingRegex:
+	"""
+	Wraps a compiled regex and counts the scans of the string, i.e. the calls
+	that are not anchored at a position, and the characters that these start
+	from.
+	"""
+	
+	def __init__(self, regex, counts):
+		self.regex = regex
+		self.counts = counts
+	
+	def count(self, string, pos=0):
+		self.counts['scans'] += 1
+		self.counts['chars'] += len(string) - pos
+	
+	def search(self, string, *args):
+		self.count(string, *args)
+		return self.regex.search(string, *args)
+	
+	def finditer(self, string, *args):
+		self.count(string, *args)
+		return self.regex.finditer(string, *args)
+	
+	def sub(self, repl, string, *args):
+		self.count(string)
+		return self.regex.sub(repl, string, *args)
+	
+	def __getattr__(self, name):
+		return getattr(self.regex, name)
+
+
+
+class ParseBudgetTestCase(TestCase):
+	"""
+	The adversarial inputs below took from seconds to minutes with the former
+	backtracking regexes and quadratic passes. Rather than timing the parses,
+	which is flaky on slow machines, the tests count the work: the number of
+	scans should not grow with the input, and the characters scanned and the
+	tokens spent should grow at most linearly.
+	"""
+	
+	sizes = (5000, 50000)
+	
+	def measure(self, string):
+		"""
+		Returns the (scans, chars, tokens) of parsing the given string; only
+		the parsing is measured, populating a graph hits the database.
+		"""
+		counts = {'scans': 0, 'chars': 0}
+		budget = ParseBudget()
+		
+		with ExitStack() as stack:
+			for cls in (GraphElement, SubgraphElement,
+					NodeStmtElement, EdgeStmtElement, AttrStmtElement):
+				stack.enter_context(mock.patch.object(
+					cls, 'regex', CountingRegex(cls.regex, counts)))
+			stack.enter_context(mock.patch.object(
+				Graph, 'clean_regex', CountingRegex(Graph.clean_regex, counts)))
+			
+			try:
+				GraphElement(budget).parse(Graph()._clean_dot_string(string, budget))
+			except ValueError:
+				pass
+		
+		return counts['scans'], counts['chars'], budget.tokens
+	
+	def assertLinear(self, make_string):
+		"""
+		Measures the parses of the strings that the given function makes for
+		each of the sizes.
+		"""
+		results = []
+		
+		for size in self.sizes:
+			string = make_string(size)
+			scans, chars, tokens = self.measure(string)
+			
+			self.assertLessEqual(chars, 10 * len(string))
+			self.assertLessEqual(tokens, len(string))
+			
+			results.append((scans, tokens / len(string)))
+		
+		self.assertEqual(results[0][0], results[1][0])
+		self.assertAlmostEqual(results[0][1], results[1][1], places=2)
+	
+	def test_adversarial_comments(self):
+		self.assertLinear(lambda n: 'graph G {' + '/* x ' * n + '}')
+		self.assertLinear(lambda n: 'graph G {' + '"/*' * n + '}')
+	
+	def test_adversarial_attributes(self):
+		self.assertLinear(lambda n: 'graph G { a [' + 'a=1,' * n + 'a=#]; }')
+		self.assertLinear(lambda n: 'graph G { a [' + 'a="1"' * n + '!]; }')
+	
+	def test_adversarial_statements(self):
+		self.assertLinear(lambda n: 'graph G { ' + 'a' * 2 * n + ' [ }')
+		self.assertLinear(lambda n: 'graph G { ' + 'a [' * n + ' }')
+		self.assertLinear(lambda n: 'graph G { subgraph {' + 'a -> b [' * n + '} }')
+	
+	def test_many_statements(self):
+		def make_string(n):
+			lines = ['graph G {']
+			for i in range(n // 5):
+				lines.append('fin [pos="3800.0,2650.0", width="0.1", height="0.05"];')
+			lines.append('}')
+			return '\n'.join(lines)
+		
+		self.assertLinear(make_string)
+	
+	def test_max_tokens(self):
+		string = 'graph G { fin [color=red]; krl [color=blue]; }'
+		
+		Graph().read_dot_string(string, ParseBudget(max_tokens=4))
+		
+		with self.assertRaises(ParseBudgetExceeded):
+			Graph().read_dot_string(string, ParseBudget(max_tokens=3))
+	
+	def test_max_depth(self):
+		string = 'graph G { subgraph { fin -- krl [color=red]; } }'
+		
+		Graph().read_dot_string(string, ParseBudget(max_depth=3))
+		
+		with self.assertRaises(ParseBudgetExceeded):
+			Graph().read_dot_string(string, ParseBudget(max_depth=2))
+	
+	def test_max_seconds(self):
+		with self.assertRaises(ParseBudgetExceeded):
+			Graph().read_dot_string('graph G { fin []; }', ParseBudget(max_seconds=-1))
+
+
+
+@override_settings(PARSE_PARALLEL_MIN_SIZE=0)
+class ParallelParseTestCase(TestCase):
+	fixtures = ['languages.json']
+	
+	def assertSameParse(self, string, **kwargs):
+		"""
+		Parses the string with and without workers and compares the graphs,
+		the order of the nodes and edges included.
+		"""
+		graphs = []
+		budgets = []
+		
+		for workers in (1, 2):
+			graphs.append(Graph())
+			budgets.append(ParseBudget(**kwargs))
+			graphs[-1].read_dot_string(string, budgets[-1], workers=workers)
+		
+		self.assertEqual(graphs[0].name, graphs[1].name)
+		self.assertEqual(list(graphs[0].nodes.items()), list(graphs[1].nodes.items()))
+		self.assertEqual(
+			list(graphs[0].undirected.items()), list(graphs[1].undirected.items()))
+		self.assertEqual(
+			list(graphs[0].directed.items()), list(graphs[1].directed.items()))
+		self.assertEqual(budgets[0].tokens, budgets[1].tokens)
+	
+	def test_sample(self):
+		with open('app/fixtures/sample.dot') as f:
+			self.assertSameParse(f.read(), max_tokens=100000)
+	
+	def test_precedence(self):
+		self.assertSameParse(
+			'graph G { fin [color=red]; subgraph { fin -- krl [penwidth=1]; } '
+			'krl [color=blue]; subgraph directed { fin -- krl [penwidth=2]; } '
+			'subgraph { fin -- krl [penwidth=3]; } fin [color=green]; }'
+		)
+	
+	def test_split_subgraphs(self):
+		string = 'a []; subgraph x { b -- c []; } d []; subgraph y { }'
+		
+		chunks, rest = split_subgraphs(string, 2)
+		self.assertEqual(chunks, ['subgraph x { b -- c []; }', 'subgraph y { }'])
+		self.assertEqual(rest, 'a [];  d []; ')
+		
+		self.assertIsNone(split_subgraphs('subgraph { subgraph { } }', 2))
+		self.assertIsNone(split_subgraphs('subgraph { } }', 2))
+		self.assertIsNone(split_subgraphs('subgraph subgraph x { } { }', 2))
+		self.assertIsNone(split_subgraphs('subgraph { } {', 2))
+		self.assertIsNone(split_subgraphs('} subgraph { }', 2))
+	
+	def test_share_tokens(self):
+		self.assertEqual(share_tokens(10, ['aaa', 'a', 'aaaaaa']), [3, 1, 6])
+		self.assertEqual(share_tokens(3, ['ab', 'ab']), [2, 1])
+		self.assertEqual(share_tokens(0, ['ab', 'ab']), [0, 0])
+		
+		items, tokens = parse_subgraph_chunk(
+			('subgraph x { fin -- krl [penwidth=2]; } subgraph { }', 4, None))
+		self.assertEqual(items, [('x', [('fin', 'krl', False, {'penwidth': '2'})]), ('', [])])
+		self.assertEqual(tokens, 4)
+		
+		with self.assertRaises(ParseBudgetExceeded):
+			parse_subgraph_chunk(('subgraph x { fin -- krl []; } subgraph { }', 2, None))
+	
+	def test_nested(self):
+		self.assertSameParse(
+			'graph G { fin []; krl []; subgraph { subgraph directed '
+			'{ fin -- krl [penwidth=1]; } krl -- fin [penwidth=2]; } '
+			'subgraph subgraph directed { fin -- krl [penwidth=3]; } { } }'
+		)
+	
+	def test_max_tokens(self):
+		string = 'graph G { subgraph { fin -- krl []; } subgraph { krl -- fin []; } }'
+		
+		Graph().read_dot_string(string, ParseBudget(max_tokens=4), workers=2)
+		
+		with self.assertRaises(ParseBudgetExceeded):
+			Graph().read_dot_string(string, ParseBudget(max_tokens=3), workers=2)
+
+
+
+class GraphFilterTestCase(TestCase):
+	fixtures = ['languages.json']
+	
+	def setUp(self):
+		self.graph = Graph()
+		with open('app/fixtures/sample.dot') as f:
+			self.graph.read_dot_string(f.read())
+	
+	def brute_force(self, graph_filter):
+		"""
+		Returns the (nodes, undirected, directed) sets of keys that the given
+		filter should select, going through the whole graph.
+		"""
+		def is_in_bbox(info):
+			if graph_filter.bbox is None:
+				return True
+			west, south, east, north = graph_filter.bbox
+			if not south <= info['latitude'] <= north:
+				return False
+			if west <= east:
+				return west <= info['longitude'] <= east
+			return info['longitude'] >= west or info['longitude'] <= east
+		
+		nodes = {
+			name for name, info in self.graph.nodes.items()
+			if is_in_bbox(info) and (graph_filter.subset is None
+				or name in graph_filter.subset)
+		}
+		
+		def is_selected(kind, key, info):
+			if kind not in graph_filter.kinds:
+				return False
+			if key[0] not in nodes or key[1] not in nodes:
+				return False
+			if graph_filter.min_weight is None:
+				return True
+			return info.get('weight') is not None \
+				and info['weight'] >= graph_filter.min_weight
+		
+		return nodes, {
+			key for key, info in self.graph.undirected.items()
+			if is_selected('undirected', key, info)
+		}, {
+			key for key, info in self.graph.directed.items()
+			if is_selected('directed', key, info)
+		}
+	
+	def test_filter(self):
+		rand = random.Random(42)
+		names = sorted(self.graph.nodes)
+		
+		for i in range(500):
+			bbox, subset = None, None
+			
+			if rand.random() < 0.6:
+				south, north = sorted([rand.uniform(-90, 90), rand.uniform(-90, 90)])
+				bbox = (rand.uniform(-180, 180), south, rand.uniform(-180, 180), north)
+			if rand.random() < 0.4:
+				subset = set(rand.sample(names, rand.randint(0, 20)))
+			
+			graph_filter = GraphFilter(bbox, subset,
+				rand.choice([None, 1, 2, 3, 4, 5]),
+				rand.choice([('undirected', 'directed'), ('undirected',), ('directed',)]))
+			
+			graph = self.graph.filter(graph_filter)
+			
+			nodes, undirected, directed = self.brute_force(graph_filter)
+			self.assertEqual(set(graph.nodes), nodes)
+			self.assertEqual(set(graph.undirected), undirected)
+			self.assertEqual(set(graph.directed), directed)
+		
+		self.assertIs(self.graph.filter(GraphFilter()), self.graph)
+	
+	def test_index(self):
+		index = self.graph.get_index()
+		self.assertIs(self.graph.get_index(), index)
+		
+		self.graph.add_node('sme')
+		self.assertIsNot(self.graph.get_index(), index)
+		
+		graph = self.graph.filter(GraphFilter(subset={'sme'}))
+		self.assertEqual(list(graph.nodes), ['sme'])
+	
+	def test_read_filter(self):
+		graph_filter = read_filter({})
+		self.assertTrue(graph_filter.is_empty())
+		
+		graph_filter = read_filter({
+			'bbox': '170,-10,-170,10',
+			'subset': 'fin, krl,,',
+			'min_weight': '2.5',
+			'edges': 'directed'
+		})
+		self.assertEqual(graph_filter.bbox, (170, -10, -170, 10))
+		self.assertEqual(graph_filter.subset, {'fin', 'krl'})
+		self.assertEqual(graph_filter.min_weight, 2.5)
+		self.assertEqual(graph_filter.kinds, ('directed',))
+		
+		for params in [
+			{'bbox': '1,2,3'},
+			{'bbox': '0,10,0,-10'},
+			{'bbox': '0,0,200,10'},
+			{'min_weight': 'heavy'},
+			{'min_weight': 'nan'},
+			{'edges': 'both'},
+		]:
+			with self.assertRaises(ValueError):
+				read_filter(params)
 
 
 
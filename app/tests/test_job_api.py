@@ -0,0 +1,91 @@
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from app.models import ParseJob
+from utils.json import read_json
+
+from unittest import mock
+
+
+
+class JobApiTestCase(TestCase):
+	fixtures = ['languages.json']
+	
+	def submit(self, file_name, **params):
+		with open(file_name, 'r') as f:
+			params.update({'file': f, 'async': 1})
+			response = self.client.post(reverse('file_api'), params)
+		
+		self.assertEqual(response.status_code, 202)
+		
+		d = read_json(response.content)
+		self.assertEqual(d['status'], 'pending')
+		
+		return d['job']
+	
+	def run_jobs(self):
+		stdout = StringIO()
+		call_command('run_jobs', once=True, stdout=stdout)
+		return stdout.getvalue()
+	
+	def test_good_job(self):
+		key = self.submit('app/fixtures/sample.dot', permalink=1)
+		
+		response = self.client.get(reverse('job_api', args=[key]))
+		self.assertEqual(response.status_code, 202)
+		self.assertEqual(read_json(response.content)['status'], 'pending')
+		
+		self.assertIn('Done 1 jobs', self.run_jobs())
+		
+		response = self.client.get(reverse('job_api', args=[key]), {'wait': 1})
+		self.assertEqual(response.status_code, 200)
+		
+		d = read_json(response.content)
+		self.assertEqual(d['name'], 'LanguageGraph')
+		self.assertEqual(len(d['nodes']), 44)
+		self.assertEqual(len(d['edges']), 87 + 17)
+		self.assertIn('permalink', d)
+		
+		self.assertEqual(ParseJob.objects.get(key=key).contents, '')
+	
+	def test_bad_job(self):
+		key = self.submit('app/fixtures/globes.json')
+		self.run_jobs()
+		
+		response = self.client.get(reverse('job_api', args=[key]))
+		self.assertEqual(response.status_code, 400)
+		self.assertIn('error', read_json(response.content))
+		
+		self.assertEqual(ParseJob.objects.get(key=key).status, ParseJob.FAILED)
+	
+	def test_long_poll_timeout(self):
+		key = self.submit('app/fixtures/sample.dot')
+		
+		response = self.client.get(reverse('job_api', args=[key]), {'wait': 0.3})
+		self.assertEqual(response.status_code, 202)
+	
+	def test_purged_while_waiting(self):
+		key = self.submit('app/fixtures/sample.dot')
+		
+		def purge(seconds):
+			ParseJob.objects.filter(key=key).delete()
+		
+		with mock.patch('app.views.job_api.time.sleep', side_effect=purge):
+			response = self.client.get(reverse('job_api', args=[key]), {'wait': 1})
+		
+		self.assertEqual(response.status_code, 404)
+		self.assertEqual(read_json(response.content), {'error': 'Job not found.'})
+	
+	def test_bad_request(self):
+		response = self.client.get(reverse('job_api', args=['nonexistent']))
+		self.assertEqual(response.status_code, 404)
+		
+		key = self.submit('app/fixtures/sample.dot')
+		for wait in ('forever', -1, 3600):
+			response = self.client.get(reverse('job_api', args=[key]), {'wait': wait})
+			self.assertEqual(response.status_code, 400)
+
+
+
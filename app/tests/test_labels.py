@@ -0,0 +1,165 @@
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from app.graphs import Graph
+from app.labels import *
+from app.projections import Projection
+from utils.json import read_json
+
+import random
+
+
+
+def overlap(one, two):
+	return one[0] < two[2] and two[0] < one[2] and one[1] < two[3] and two[1] < one[3]
+
+
+
+class SpatialHashTestCase(TestCase):
+	
+	def test_collides(self):
+		random.seed(7)
+		
+		spatial_hash = SpatialHash(cell_size=10)
+		boxes = []
+		
+		for i in range(500):
+			x, y = random.uniform(-100, 100), random.uniform(-100, 100)
+			box = (x, y, x + random.uniform(0, 30), y + random.uniform(0, 10))
+			
+			expected = any(overlap(box, other) for other in boxes)
+			self.assertEqual(spatial_hash.collides(box), expected)
+			
+			spatial_hash.insert(box)
+			boxes.append(box)
+
+
+
+class PlanLabelsTestCase(TestCase):
+	
+	def setUp(self):
+		random.seed(11)
+		
+		self.graph = Graph(languages={})
+		self.graph.nodes = {
+			'n{:03d}'.format(i): {
+				'latitude': random.uniform(48, 52),
+				'longitude': random.uniform(18, 24)
+			} for i in range(300)
+		}
+		
+		names = sorted(self.graph.nodes)
+		for i in range(600):
+			self.graph.undirected[tuple(random.sample(names, 2))] = {}
+		
+		self.projection = Projection('orthographic', 50, 20)
+	
+	def get_boxes(self, plan, zoom):
+		names = [
+			name for name in sorted(plan)
+			if plan[name]['zoom'] is not None and plan[name]['zoom'] <= zoom
+		]
+		
+		x, y, periods = get_positions(names, self.graph, self.projection)
+		
+		return [
+			get_box(
+				x_ * SCALE * zoom + plan[name]['dx'], y_ * SCALE * zoom + plan[name]['dy'],
+				len(name) * CHAR_WIDTH / 2, LINE_HEIGHT / 2
+			) for name, x_, y_ in zip(names, x, y)
+		]
+	
+	def test_no_overlaps(self):
+		plan = plan_labels(self.graph, self.projection)
+		
+		self.assertEqual(set(plan), set(self.graph.nodes))
+		self.assertIn(None, [label['zoom'] for label in plan.values()])
+		
+		num_shown = 0
+		
+		for zoom in ZOOM_LEVELS:
+			boxes = self.get_boxes(plan, zoom)
+			self.assertGreaterEqual(len(boxes), num_shown)
+			num_shown = len(boxes)
+			
+			for i, box in enumerate(boxes):
+				for other in boxes[:i]:
+					self.assertFalse(overlap(box, other))
+		
+		self.assertEqual(num_shown, len([
+			label for label in plan.values() if label['zoom'] is not None]))
+	
+	def test_priorities(self):
+		names = get_priorities(self.graph)
+		self.assertEqual(sorted(names), sorted(self.graph.nodes))
+		
+		graph = Graph(languages={})
+		for name in ('aaa', 'bbb', 'ccc', 'ddd', 'eee', 'fff', 'zzz'):
+			graph.nodes[name] = {'latitude': 50, 'longitude': 20}
+		graph.undirected[('zzz', 'fff')] = {}
+		graph.directed[('zzz', 'eee')] = {}
+		
+		self.assertEqual(get_priorities(graph)[:3], ['zzz', 'eee', 'fff'])
+		
+		plan = plan_labels(graph, self.projection)
+		
+		self.assertEqual(len(plan), len(graph.nodes))
+		self.assertEqual(len([
+			label for label in plan.values() if label['zoom'] is not None
+		]), len(OFFSETS))
+		self.assertEqual(plan['zzz']['dx'], 0)
+		self.assertEqual(plan['zzz']['dy'], 0)
+		self.assertEqual(plan['zzz']['zoom'], ZOOM_LEVELS[0])
+		self.assertIsNone(plan['ddd']['zoom'])
+		
+		self.assertEqual(plan, plan_labels(graph, self.projection))
+	
+	def test_view_independent(self):
+		self.graph.nodes['far'] = {'latitude': -50, 'longitude': -160}
+		
+		plan = plan_labels(self.graph, self.projection)
+		self.assertEqual(plan['far']['zoom'], ZOOM_LEVELS[0])
+		
+		self.assertEqual(plan, plan_labels(self.graph, Projection('orthographic')))
+		self.assertEqual(plan, plan_labels(
+			self.graph, Projection('orthographic', -50, -160)))
+	
+	def test_antimeridian(self):
+		graph = Graph(languages={})
+		graph.nodes['aaa'] = {'latitude': 10, 'longitude': 179.99}
+		graph.nodes['bbb'] = {'latitude': 10, 'longitude': -179.99}
+		
+		for projection in (self.projection, Projection('mercator')):
+			plan = plan_labels(graph, projection)
+			self.assertEqual((plan['aaa']['dx'], plan['aaa']['dy']), (0, 0))
+			self.assertNotEqual((plan['bbb']['dx'], plan['bbb']['dy']), (0, 0))
+
+
+
+class LabelsApiTestCase(TestCase):
+	fixtures = ['languages.json']
+	
+	def test_file_api(self):
+		with open('app/fixtures/sample.dot', 'r') as f:
+			response = self.client.post(
+				reverse('file_api'),
+				{'file': f, 'labels': 1, 'centre': '55,30'}
+			)
+		
+		self.assertEqual(response.status_code, 200)
+		
+		d = read_json(response.content)
+		self.assertTrue(d['labels'])
+		self.assertLessEqual(set(d['labels']), set(d['nodes']))
+		
+		for label in d['labels'].values():
+			self.assertIn(label['zoom'], ZOOM_LEVELS)
+		
+		response = self.client.get(reverse('file_api'))
+		self.assertNotIn('labels', read_json(response.content))
+		
+		response = self.client.get(reverse('file_api'), {'labels': 1, 'centre': '100,0'})
+		self.assertEqual(response.status_code, 400)
+
+
+
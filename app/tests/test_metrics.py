@@ -0,0 +1,113 @@
+from django.core.urlresolvers import reverse
+from django.test import TestCase, override_settings
+
+from app import metrics
+from utils.json import make_json, read_json
+
+import os
+import tempfile
+
+
+
+class MetricsTestCase(TestCase):
+	fixtures = ['languages.json', 'globes.json']
+	
+	def setUp(self):
+		with metrics.values_lock:
+			metrics.values.clear()
+	
+	def test_render(self):
+		metrics.observe('sanavirta_parse_size_bytes', 100, format='dot')
+		metrics.observe('sanavirta_parse_size_bytes', 1000, format='dot')
+		metrics.observe('sanavirta_parse_size_bytes', 10 ** 9, format='dot')
+		metrics.record_cache('projected_globe', True)
+		metrics.record_cache('projected_globe', True)
+		
+		lines = metrics.render(metrics.collect()).splitlines()
+		
+		self.assertIn('# TYPE sanavirta_parse_size_bytes histogram', lines)
+		self.assertIn('sanavirta_parse_size_bytes_bucket{format="dot",le="256"} 1', lines)
+		self.assertIn('sanavirta_parse_size_bytes_bucket{format="dot",le="1024"} 2', lines)
+		self.assertIn('sanavirta_parse_size_bytes_bucket{format="dot",le="67108864"} 2', lines)
+		self.assertIn('sanavirta_parse_size_bytes_bucket{format="dot",le="+Inf"} 3', lines)
+		self.assertIn('sanavirta_parse_size_bytes_sum{format="dot"} 1000001100', lines)
+		self.assertIn('sanavirta_parse_size_bytes_count{format="dot"} 3', lines)
+		self.assertIn(
+			'sanavirta_cache_requests_total{cache="projected_globe",result="hit"} 2', lines)
+	
+	def test_middleware(self):
+		self.client.get(reverse('globe_list_api'))
+		self.client.get(reverse('globe_api', args=[0]))
+		
+		response = self.client.get(reverse('metrics'))
+		self.assertEqual(response.status_code, 200)
+		self.assertTrue(response['Content-Type'].startswith('text/plain'))
+		
+		lines = response.content.decode().splitlines()
+		self.assertIn('sanavirta_request_duration_seconds_count'
+			'{view="globe_list_api",method="GET",status="200"} 1', lines)
+		self.assertIn('sanavirta_response_size_bytes_count{view="globe_list_api"} 1', lines)
+		self.assertIn('sanavirta_errors_total{view="globe_api",status="404"} 1', lines)
+		
+		self.client.generic('BREW', reverse('globe_list_api'))
+		
+		lines = metrics.render(metrics.collect()).splitlines()
+		self.assertIn('sanavirta_request_duration_seconds_count'
+			'{view="globe_list_api",method="other",status="405"} 1', lines)
+	
+	@override_settings(METRICS_ALLOWED_IPS=('10.0.0.1',))
+	def test_access(self):
+		response = self.client.get(reverse('metrics'))
+		self.assertEqual(response.status_code, 404)
+		
+		response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1')
+		self.assertEqual(response.status_code, 200)
+		
+		response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1',
+			HTTP_X_FORWARDED_FOR='203.0.113.1')
+		self.assertEqual(response.status_code, 404)
+	
+	def test_metrics_dir(self):
+		with tempfile.TemporaryDirectory() as temp_dir:
+			with override_settings(METRICS_DIR=temp_dir):
+				metrics.inc('sanavirta_errors_total', view='file_api', status='400')
+				metrics.observe('sanavirta_response_size_bytes', 300, view='file_api')
+				
+				with open(metrics.get_file_path(os.getpid() + 1), 'w') as f:
+					f.write(make_json([
+						['sanavirta_errors_total', ['file_api', '400'], 2],
+						['sanavirta_response_size_bytes', ['file_api'],
+							[1] + [0] * 9 + [100, 1]],
+					]))
+				
+				collected = metrics.collect()
+				self.assertTrue(os.path.exists(metrics.get_file_path()))
+		
+		self.assertEqual(collected[('sanavirta_errors_total', ('file_api', '400'))], 3)
+		self.assertEqual(
+			collected[('sanavirta_response_size_bytes', ('file_api',))],
+			[1, 1] + [0] * 8 + [400, 2])
+	
+	@override_settings(METRICS_FLUSH_SECONDS=0.5)
+	def test_flush_timer(self):
+		with tempfile.TemporaryDirectory() as temp_dir:
+			with override_settings(METRICS_DIR=temp_dir):
+				metrics.maybe_flush(force=True)
+				metrics.inc('sanavirta_errors_total', view='file_api', status='400')
+				
+				with open(metrics.get_file_path()) as f:
+					self.assertEqual(read_json(f.read()), [])
+				
+				timer = metrics.flush_timer
+				self.assertIsNotNone(timer)
+				timer.join()
+				
+				with open(metrics.get_file_path()) as f:
+					self.assertEqual(read_json(f.read()),
+						[['sanavirta_errors_total', ['file_api', '400'], 1]])
+				
+				self.assertIsNone(metrics.flush_timer)
+				self.assertFalse(metrics.is_dirty)
+
+
+
@@ -0,0 +1,143 @@
+from django.test import TestCase
+
+from app.projections import *
+
+
+
+class ProjectionTestCase(TestCase):
+	def test_init(self):
+		for args in (
+				('azimuthal',),
+				('orthographic', 91, 0),
+				('mercator', 0, -181),
+			):
+			with self.assertRaises(ValueError):
+				Projection(*args)
+	
+	def test_orthographic(self):
+		proj = Projection('orthographic', 0, 0)
+		x, y = proj.project([0, 90, 0, 180], [0, 0, 90, 0])
+		
+		self.assertAlmostEqual(x[0], 0)
+		self.assertAlmostEqual(y[0], 0)
+		self.assertAlmostEqual(x[1], 1)
+		self.assertAlmostEqual(y[1], 0)
+		self.assertAlmostEqual(x[2], 0)
+		self.assertAlmostEqual(y[2], -1)
+		
+		# the far side is pushed onto the horizon
+		self.assertAlmostEqual(x[3] ** 2 + y[3] ** 2, 1)
+		
+		proj = Projection('orthographic', 62, 25)
+		x, y = proj.project([25], [62])
+		self.assertAlmostEqual(x[0], 0)
+		self.assertAlmostEqual(y[0], 0)
+	
+	def test_cylindrical(self):
+		proj = Projection('equirectangular', 0, 170)
+		x, y = proj.project([-170], [45])
+		self.assertAlmostEqual(x[0], math.radians(20))
+		self.assertAlmostEqual(y[0], -math.radians(45))
+		
+		proj = Projection('mercator')
+		x, y = proj.project([0, 0], [0, 90])
+		self.assertAlmostEqual(y[0], 0)
+		self.assertTrue(math.isfinite(y[1]))
+	
+	def test_read_projection(self):
+		self.assertIsNone(read_projection({}))
+		
+		proj = read_projection({'projection': 'mercator', 'centre': '10,20'})
+		self.assertEqual(proj.name, 'mercator')
+		self.assertEqual(proj.latitude, 10)
+		self.assertEqual(proj.longitude, 20)
+		
+		proj = read_projection({'projection': 'orthographic', 'centre': '10.004,-20.006'})
+		self.assertEqual((proj.latitude, proj.longitude), (10.0, -20.01))
+		self.assertEqual(str(proj), 'orthographic:10.00,-20.01')
+		
+		with self.assertRaises(ValueError):
+			read_projection({'projection': 'mercator', 'centre': '10'})
+
+
+
+class ProjectGeoJsonTestCase(TestCase):
+	def test_project_geo_json(self):
+		geo_json = (
+			'{"type": "FeatureCollection", "features": ['
+			'{"type": "Feature", "properties": {}, "geometry": {'
+			'"type": "Polygon", "coordinates": [[[0, 0], [0, 0.0001], '
+			'[10, 10], [0, 0]]]}},'
+			'{"type": "Feature", "properties": {}, "geometry": {'
+			'"type": "Point", "coordinates": [0, 0]}}]}'
+		)
+		
+		features = project_geo_json(geo_json, Projection('equirectangular'), 1)
+		self.assertEqual(len(features), 2)
+		self.assertEqual(len(features[0]), 1)
+		self.assertEqual(len(features[0][0]), 1)
+		
+		ring = features[0][0][0]
+		self.assertEqual(len(ring), 6)  # the second vertex collapses
+		self.assertEqual(ring[:2], [0, 0])
+		self.assertEqual(ring[2:4], [0.175, -0.175])
+		
+		self.assertEqual(features[1], [])
+	
+	def test_iter_projected_features(self):
+		features = [[[[0, 0, 1, 1]]], [], [[[2, 2]], [[3, 3]]]]
+		data = make_json({
+			'projection': 'equirectangular', 'detail': 1, 'features': features})
+		
+		self.assertEqual(list(iter_projected_features(data)), features)
+		
+		data = make_json({'features': [], 'detail': 1})
+		self.assertEqual(list(iter_projected_features(data)), [])
+		
+		for data in ['', '[]', '{}', '{"detail": 1}', '{"features": {}}']:
+			with self.assertRaises(ValueError):
+				iter_projected_features(data)
+	
+	def test_antimeridian(self):
+		geo_json = (
+			'{"type": "FeatureCollection", "features": ['
+			'{"type": "Feature", "properties": {}, "geometry": {'
+			'"type": "Polygon", "coordinates": [[[170, 0], [-170, 0], '
+			'[-170, 10], [170, 10], [170, 0]]]}},'
+			'{"type": "Feature", "properties": {}, "geometry": {'
+			'"type": "Polygon", "coordinates": [[[0, -80], [120, -80], '
+			'[-120, -80], [0, -80]]]}},'
+			'{"type": "Feature", "properties": {}, "geometry": {'
+			'"type": "LineString", "coordinates": [[170, 0], [-170, 0]]}}]}'
+		)
+		
+		for projection in (Projection('equirectangular'), Projection('mercator')):
+			square, cap, line = project_geo_json(geo_json, projection, 1)
+			
+			for feature in (square, cap, line):
+				for ring in feature[0]:
+					xs = ring[0::2]
+					for a, b in zip(xs, xs[1:]):
+						if abs(a - b) > math.pi:  # only along the top or bottom
+							self.assertIs(feature, cap)
+			
+			self.assertEqual(len(square[0]), 2)
+			for ring in square[0]:
+				self.assertEqual(ring[:2], ring[-2:])
+				self.assertEqual(len(set(x > 0 for x in ring[0::2])), 1)
+			
+			self.assertEqual(len(cap[0]), 1)
+			self.assertEqual(sorted(set(cap[0][0][0::2]))[0], -3.142)
+			self.assertEqual(max(cap[0][0][1::2]),
+				round(projection.project([0], [-90])[1][0], 3))
+			
+			self.assertEqual(len(line[0]), 2)
+			self.assertEqual(line[0][0], [2.967, 0, 3.142, 0])
+			self.assertEqual(line[0][1], [-3.142, 0, -2.967, 0])
+		
+		square = project_geo_json(geo_json, Projection('equirectangular', 0, 180), 1)[0]
+		self.assertEqual(len(square[0]), 1)
+
+
+
+
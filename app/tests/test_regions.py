@@ -0,0 +1,172 @@
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from app.models import Globe
+from app.regions import RegionIndex, contains, get_region_index, region_indexes
+from utils.json import make_json, read_json
+
+import numpy as np
+
+
+
+def square(west, south, east, north):
+	return [[west, south], [east, south], [east, north], [west, north], [west, south]]
+
+
+
+class RegionIndexTestCase(TestCase):
+	fixtures = ['globes.json']
+	
+	def setUp(self):
+		self.geo_json = make_json({
+			'type': 'FeatureCollection',
+			'features': [
+				{
+					'type': 'Feature',
+					'properties': {'name': 'ring'},
+					'geometry': {
+						'type': 'Polygon',
+						'coordinates': [square(0, 0, 10, 10), square(4, 4, 6, 6)]
+					}
+				},
+				{
+					'type': 'Feature',
+					'properties': {'name': 'line'},
+					'geometry': {'type': 'LineString', 'coordinates': [[0, 0], [5, 5]]}
+				},
+				{
+					'type': 'Feature',
+					'properties': {'name': 'islands'},
+					'geometry': {
+						'type': 'MultiPolygon',
+						'coordinates': [
+							[square(-20, -20, -10, -10)],
+							[square(8, 8, 20, 20)]
+						]
+					}
+				}
+			]
+		})
+	
+	def test_locate(self):
+		index = RegionIndex(self.geo_json)
+		self.assertEqual(len(index.properties), 3)
+		
+		regions = index.locate(
+			[1, 5, -15, 9, 15, 50, -10.5],
+			[1, 5, -15, 9, 15, 50, -10.5]
+		)
+		self.assertEqual(regions.tolist(), [0, -1, 2, 0, 2, -1, 2])
+		
+		self.assertEqual(index.locate([], []).tolist(), [])
+		
+		# the features are indexed in the reverse order of their boxes
+		index = RegionIndex(make_json({
+			'type': 'FeatureCollection',
+			'features': [
+				{
+					'type': 'Feature',
+					'geometry': {'type': 'Polygon', 'coordinates': [square(-i, 0, 10-i, 10)]}
+				}
+				for i in range(0, 40, 5)
+			]
+		}))
+		self.assertEqual(index.locate([0, 4, -6], [5, 5, 5]).tolist(), [0, 0, 2])
+	
+	def test_globes(self):
+		rand = np.random.RandomState(42)
+		longitudes = rand.uniform(-180, 180, 300)
+		latitudes = rand.uniform(-90, 90, 300)
+		
+		for globe in Globe.objects.all():
+			index = RegionIndex(globe.geo_json)
+			self.assertGreater(len(index.levels), 1)
+			
+			expected = np.full(len(longitudes), -1)
+			for part in np.argsort(index.part_features, kind='mergesort')[::-1]:
+				inside = contains(index.rings[part], longitudes, latitudes)
+				expected[inside] = index.part_features[part]
+			
+			regions = index.locate(longitudes, latitudes)
+			self.assertEqual(regions.tolist(), expected.tolist())
+			self.assertTrue((regions >= 0).any())
+	
+	def test_cache(self):
+		globe = Globe.objects.defer('geo_json').first()
+		
+		index = get_region_index(globe)
+		self.assertIn((globe.pk, globe.content_hash), region_indexes)
+		
+		with self.assertNumQueries(0):
+			self.assertIs(get_region_index(globe), index)
+		
+		with self.assertRaises(ValueError):
+			RegionIndex('{"type": "Polygon", "coordinates": [[1, 2, 3]]}')
+
+
+
+class RegionApiTestCase(TestCase):
+	fixtures = ['globes.json', 'languages.json']
+	
+	def setUp(self):
+		self.globe = Globe.objects.defer('geo_json').first()
+		self.url = reverse('region_api', args=[self.globe.pk])
+	
+	def test_points(self):
+		response = self.client.get(self.url, {'points': '62,25|0,-150'})
+		self.assertEqual(response.status_code, 200)
+		
+		d = read_json(response.content)
+		self.assertIsNotNone(d['regions'][0])
+		self.assertIsNone(d['regions'][1])
+		self.assertEqual(list(d['features']), [str(d['regions'][0])])
+		
+		response = self.client.post(self.url, {'points': '62,25'})
+		self.assertEqual(read_json(response.content)['regions'], d['regions'][:1])
+		
+		response = self.client.get(self.url + '?points=62,25|0,-150&x=1')
+		self.assertEqual(read_json(response.content)['regions'], d['regions'])
+		
+		response = self.client.get(self.url, {'points': '62'})
+		self.assertEqual(response.status_code, 400)
+		
+		response = self.client.get(reverse('region_api', args=[0]))
+		self.assertEqual(response.status_code, 404)
+	
+	def test_graphs(self):
+		with open('app/fixtures/sample.dot', 'r') as f:
+			response = self.client.post(
+				reverse('file_api'),
+				{'file': f, 'permalink': 1, 'regions': self.globe.pk}
+			)
+		
+		self.assertEqual(response.status_code, 200)
+		
+		d = read_json(response.content)
+		self.assertEqual(len(d['nodes']), 44)
+		self.assertIsNotNone(d['nodes']['fin']['region'])
+		
+		response = self.client.get(self.url, {'permalink': d['permalink']})
+		self.assertEqual(response.status_code, 200)
+		
+		regions = read_json(response.content)
+		self.assertEqual(regions['regions'], [])
+		self.assertEqual(regions['nodes'], {
+			name: node['region'] for name, node in d['nodes'].items()
+		})
+		self.assertIn(str(d['nodes']['fin']['region']), regions['features'])
+		
+		response = self.client.get(reverse('graph_api', args=[d['permalink']]))
+		self.assertNotIn('region', read_json(response.content)['nodes']['fin'])
+		
+		with open('app/fixtures/sample.dot', 'r') as f:
+			response = self.client.post(
+				reverse('file_api'),
+				{'file': f, 'regions': 0}
+			)
+		
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual(read_json(response.content)['error'], 'Globe not found.')
+
+
+
@@ -0,0 +1,116 @@
+from django.contrib.staticfiles import storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.test.client import RequestFactory
+from django.utils.six import StringIO
+
+from utils.views import serve_static, accepts_encoding, IMMUTABLE, REVALIDATE
+
+import gzip
+import os
+import shutil
+import tempfile
+
+
+
+class StaticFilesTestCase(TestCase):
+	def setUp(self):
+		self.source_dir = tempfile.mkdtemp()
+		self.static_root = tempfile.mkdtemp()
+		
+		os.makedirs(os.path.join(self.source_dir, 'scripts'))
+		with open(os.path.join(self.source_dir, 'scripts/app.js'), 'w') as f:
+			f.write('var app = {};\n' * 100)
+		with open(os.path.join(self.source_dir, 'tiny.css'), 'w') as f:
+			f.write('body {}')
+		
+		self.settings = override_settings(
+			STATICFILES_DIRS = [self.source_dir],
+			STATIC_ROOT = self.static_root
+		)
+		self.settings.enable()
+		
+		call_command('collectstatic', interactive=False, stdout=StringIO())
+		
+		self.factory = RequestFactory()
+	
+	def tearDown(self):
+		self.settings.disable()
+		
+		shutil.rmtree(self.source_dir)
+		shutil.rmtree(self.static_root)
+	
+	def test_collectstatic(self):
+		hashed = storage.staticfiles_storage.stored_name('scripts/app.js')
+		self.assertNotEqual(hashed, 'scripts/app.js')
+		
+		path = os.path.join(self.static_root, hashed + '.gz')
+		self.assertTrue(os.path.exists(path))
+		with gzip.open(path, 'rt') as f:
+			self.assertEqual(f.read(), 'var app = {};\n' * 100)
+		
+		self.assertFalse(os.path.exists(os.path.join(self.static_root, 'tiny.css.gz')))
+	
+	@override_settings(DEBUG=False)
+	def test_no_manifest(self):
+		with self.assertRaises(ValueError):
+			storage.staticfiles_storage.url('scripts/missing.js')
+		
+		static_root = tempfile.mkdtemp()
+		
+		try:
+			with override_settings(STATIC_ROOT=static_root):
+				self.assertEqual(
+					storage.staticfiles_storage.url('scripts/app.js'),
+					'/static/scripts/app.js')
+		finally:
+			shutil.rmtree(static_root)
+	
+	def test_serve_static(self):
+		hashed = storage.staticfiles_storage.stored_name('scripts/app.js')
+		
+		request = self.factory.get('/static/' + hashed, HTTP_ACCEPT_ENCODING='gzip')
+		response = serve_static(request, hashed)
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response['Cache-Control'], IMMUTABLE)
+		self.assertEqual(response['Content-Encoding'], 'gzip')
+		self.assertEqual(
+			gzip.decompress(b''.join(response.streaming_content)).decode(),
+			'var app = {};\n' * 100
+		)
+		
+		request = self.factory.get('/static/scripts/app.js')
+		response = serve_static(request, 'scripts/app.js')
+		self.assertEqual(response['Cache-Control'], REVALIDATE)
+		self.assertNotIn('Content-Encoding', response)
+		self.assertEqual(
+			b''.join(response.streaming_content).decode(),
+			'var app = {};\n' * 100
+		)
+	
+	def test_accepts_encoding(self):
+		for header, expected in [
+			('gzip', True),
+			('deflate, GZIP;q=0.5', True),
+			('gzip;q=0', False),
+			('gzip;q=0.0, *', False),
+			('br, *', True),
+			('*;q=0', False),
+			('gzip;q=x', False),
+			('identity', False),
+			('', False),
+		]:
+			request = self.factory.get('/', HTTP_ACCEPT_ENCODING=header)
+			self.assertEqual(accepts_encoding(request, 'gzip'), expected, header)
+		
+		self.assertFalse(accepts_encoding(self.factory.get('/'), 'gzip'))
+	
+	def test_not_found(self):
+		from django.http import Http404
+		
+		for path in ('nonexistent.js', '../manage.py', 'scripts/app.js.gz'):
+			with self.assertRaises(Http404):
+				serve_static(self.factory.get('/static/' + path), path)
+
+
+
@@ -0,0 +1,118 @@
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from app.graphs import Graph
+from app.stats import *
+from utils.json import read_json
+
+import math
+import random
+
+import numpy as np
+
+
+
+class StatsTestCase(TestCase):
+	
+	def setUp(self):
+		self.graph = Graph(languages={})
+		self.graph.nodes = {
+			'aaa': {'latitude': 0, 'longitude': 0},
+			'bbb': {'latitude': 0, 'longitude': 90},
+			'ccc': {'latitude': 0, 'longitude': -90},
+			'ddd': {'latitude': 60, 'longitude': 25},
+			'eee': {'latitude': 60, 'longitude': 25},
+			'fff': {'latitude': -30, 'longitude': 150},
+		}
+		self.graph.directed[('aaa', 'bbb')] = {'weight': 3}
+		self.graph.directed[('ccc', 'aaa')] = {}
+		self.graph.undirected[('aaa', 'ccc')] = {'weight': 0.5}
+		self.graph.undirected[('ddd', 'eee')] = {'weight': 2}
+	
+	def test_compute_stats(self):
+		stats = compute_stats(self.graph)
+		
+		self.assertEqual(stats['nodes']['aaa'], {
+			'in': 1, 'out': 1, 'undirected': 1,
+			'strength': 4.5, 'in_strength': 1, 'out_strength': 3,
+			'component': 0,
+		})
+		self.assertEqual(stats['nodes']['ccc']['strength'], 1.5)
+		self.assertEqual(stats['nodes']['eee']['component'], 1)
+		self.assertEqual(stats['nodes']['fff']['component'], 2)
+		self.assertEqual(stats['nodes']['fff']['strength'], 0)
+		
+		self.assertEqual(stats['degrees'], [1, 3, 1, 1])
+		self.assertEqual(stats['components'], {'count': 3, 'sizes': [3, 2, 1]})
+		
+		lengths = stats['edge_lengths']
+		self.assertEqual(lengths['counts'], [1, 0, 0, 0, 0, 0, 0, 3])
+		self.assertEqual(lengths['max'], lengths['median'])
+		self.assertAlmostEqual(lengths['max'], math.pi * EARTH_RADIUS / 2)
+	
+	def test_empty_graph(self):
+		stats = compute_stats(Graph(languages={}))
+		
+		self.assertEqual(stats['nodes'], {})
+		self.assertEqual(stats['components'], {'count': 0, 'sizes': []})
+		self.assertIsNone(stats['edge_lengths']['mean'])
+	
+	def test_find_components(self):
+		random.seed(3)
+		
+		for num_nodes, num_edges in ((1, 0), (50, 20), (200, 180), (300, 1000)):
+			heads = [random.randrange(num_nodes) for i in range(num_edges)]
+			tails = [random.randrange(num_nodes) for i in range(num_edges)]
+			
+			roots = list(range(num_nodes))
+			def find(node):
+				while roots[node] != node:
+					node = roots[node]
+				return node
+			for head, tail in zip(heads, tails):
+				one, two = sorted((find(head), find(tail)))
+				roots[two] = one
+			
+			components = find_components(num_nodes,
+				np.array(heads, dtype=np.int64), np.array(tails, dtype=np.int64))
+			
+			self.assertEqual(components.tolist(), [find(i) for i in range(num_nodes)])
+	
+	def test_haversine(self):
+		self.assertAlmostEqual(float(haversine(60.17, 24.94, 59.33, 18.07)), 396, delta=2)
+		
+		distances = haversine(np.array([[0], [90]]), 0, 0, np.array([0, 180]))
+		self.assertEqual(distances.shape, (2, 2))
+		self.assertAlmostEqual(distances[0, 0], 0)
+		self.assertAlmostEqual(distances[0, 1], math.pi * EARTH_RADIUS)
+		self.assertAlmostEqual(distances[1, 1], math.pi * EARTH_RADIUS / 2)
+
+
+
+class StatsApiTestCase(TestCase):
+	fixtures = ['languages.json']
+	
+	def test_file_api(self):
+		with open('app/fixtures/sample.dot', 'r') as f:
+			response = self.client.post(reverse('file_api'), {'file': f, 'stats': 1})
+		
+		self.assertEqual(response.status_code, 200)
+		
+		d = read_json(response.content)
+		self.assertEqual(set(d['stats']['nodes']), set(d['nodes']))
+		self.assertEqual(sum(d['stats']['components']['sizes']), len(d['nodes']))
+		self.assertEqual(sum(d['stats']['edge_lengths']['counts']), len(d['edges']))
+		
+		response = self.client.get(reverse('file_api'))
+		self.assertNotIn('stats', read_json(response.content))
+		
+		with open('app/fixtures/sample.dot', 'r') as f:
+			response = self.client.post(reverse('file_api'),
+				{'file': f, 'stats': 1, 'min_weight': 1000})
+		
+		d = read_json(response.content)
+		self.assertEqual(d['edges'], [])
+		self.assertEqual(d['stats']['components']['count'], len(d['nodes']))
+
+
+
@@ -0,0 +1,167 @@
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.urlresolvers import reverse
+from django.test import TestCase, override_settings
+
+from utils.json import read_json
+
+
+
+def read_events(response):
+	"""
+	Returns the [] of (event, data) tuples of the given streaming response.
+	"""
+	content = b''.join(response.streaming_content).decode()
+	events = []
+	
+	for chunk in content.split('\n\n'):
+		if not chunk:
+			continue
+		
+		event, data = chunk.split('\n')
+		events.append((event[len('event: '):], read_json(data[len('data: '):])))
+	
+	return events
+
+
+
+class FileStreamApiTestCase(TestCase):
+	fixtures = ['languages.json']
+	
+	def test_good_upload(self):
+		with open('app/fixtures/sample.dot', 'r') as f:
+			response = self.client.post(
+				reverse('file_stream_api'),
+				{'file': f, 'batch': 10}
+			)
+		
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response['Content-Type'], 'text/event-stream')
+		
+		events = read_events(response)
+		
+		self.assertEqual(events[0], ('graph', {'name': 'LanguageGraph'}))
+		self.assertEqual(events[-1], ('done', {'nodes': 44, 'edges': 87 + 17}))
+		
+		nodes = set()
+		num_edges = 0
+		
+		for event, data in events[1:-1]:
+			if event == 'nodes':
+				self.assertLessEqual(len(data['nodes']), 10)
+				nodes.update(data['nodes'])
+			else:
+				self.assertEqual(event, 'edges')
+				self.assertLessEqual(len(data['edges']), 10)
+				for edge in data['edges']:
+					self.assertIn(edge['head'], nodes)
+					self.assertIn(edge['tail'], nodes)
+				num_edges += len(data['edges'])
+		
+		self.assertEqual(len(nodes), 44)
+		self.assertEqual(num_edges, 87 + 17)
+	
+	def test_bad_upload(self):
+		with open('app/fixtures/globes.json', 'r') as f:
+			response = self.client.post(
+				reverse('file_stream_api'),
+				{'file': f}
+			)
+		
+		self.assertEqual(response.status_code, 400)
+		self.assertIn('error', read_json(response.content))
+		
+		with open('app/fixtures/sample.dot', 'r') as f:
+			response = self.client.post(
+				reverse('file_stream_api'),
+				{'file': f, 'batch': 0}
+			)
+		
+		self.assertEqual(response.status_code, 400)
+		self.assertIn('error', read_json(response.content))
+		
+		response = self.client.post(reverse('file_stream_api'), {
+			'file': SimpleUploadedFile('graph.dot', b'digraph { "\xff" }')})
+		
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual(
+			read_json(response.content), {'error': 'File could not be parsed.'})
+	
+	def test_projection(self):
+		response = self.client.get(
+			reverse('file_stream_api'),
+			{'projection': 'orthographic', 'centre': '62,25'}
+		)
+		
+		self.assertEqual(response.status_code, 200)
+		
+		for event, data in read_events(response):
+			if event == 'nodes':
+				for node in data['nodes'].values():
+					self.assertIn('x', node)
+					self.assertIn('y', node)
+	
+	def test_edge_list(self):
+		edges = SimpleUploadedFile(
+			'edges.csv',
+			b'head,tail,directed\nfin,smn,1\nfin,krl,0\nfin,smn,1\n',
+			content_type = 'text/csv'
+		)
+		response = self.client.post(
+			reverse('file_stream_api'),
+			{'file': edges, 'batch': 1}
+		)
+		
+		self.assertEqual(response.status_code, 200)
+		
+		events = read_events(response)
+		
+		self.assertEqual([event for event, data in events], [
+			'graph', 'nodes', 'nodes', 'edges', 'nodes', 'edges', 'edges', 'done'])
+		self.assertEqual(events[-1][1], {'nodes': 3, 'edges': 3})
+	
+	def test_dot_midway(self):
+		response = self.client.post(reverse('file_stream_api'), {
+			'file': SimpleUploadedFile('graph.dot', b'graph G {\n'
+				b'fin [latitude=60, longitude=25];\n'
+				b'krl [latitude=nan];\n'
+				b'smn [latitude=69, longitude=27];\n}'),
+			'batch': 1
+		})
+		
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(read_events(response), [
+			('graph', {'name': 'G'}),
+			('nodes', {'nodes': {'fin': {'latitude': 60, 'longitude': 25}}}),
+			('error', {'error': 'File could not be parsed.'})
+		])
+	
+	@override_settings(JOB_PARSE_BUDGET={'max_tokens': 3})
+	def test_error_midway(self):
+		edges = SimpleUploadedFile(
+			'edges.csv',
+			b'head,tail\nfin,smn\nfin,krl\nkrl,smn\nfin,est\n',
+			content_type = 'text/csv'
+		)
+		response = self.client.post(reverse('file_stream_api'), {'file': edges})
+		
+		self.assertEqual(response.status_code, 200)
+		
+		events = read_events(response)
+		self.assertEqual(events[-1][0], 'error')
+		self.assertNotIn('done', [event for event, data in events])
+	
+	@override_settings(JOB_PARSE_BUDGET={'max_tokens': 3})
+	def test_parse_budget(self):
+		with open('app/fixtures/sample.dot', 'r') as f:
+			response = self.client.post(
+				reverse('file_stream_api'),
+				{'file': f}
+			)
+		
+		self.assertEqual(response.status_code, 400)
+		
+		d = read_json(response.content)
+		self.assertEqual(d['error'], 'The file has too many statements.')
+
+
+
@@ -0,0 +1,86 @@
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.test import TestCase, override_settings
+from django.utils.six import StringIO
+
+from app import warmup
+from app.graphs import Graph
+from app.models import Globe
+
+import gzip
+
+
+
+class WarmupTestCase(TestCase):
+	fixtures = ['languages.json', 'globes.json']
+	
+	def setUp(self):
+		warmup.warm_up()
+	
+	def tearDown(self):
+		warmup.reset()
+	
+	def test_warm_up(self):
+		self.assertIn('fin', warmup.languages)
+		self.assertEqual(warmup.languages['fin'], (62.0, 25.0))
+		
+		self.assertEqual(len(warmup.globes), Globe.objects.count())
+		for content_hash, geo_json, gzipped in warmup.globes.values():
+			self.assertEqual(gzip.decompress(gzipped).decode(), geo_json)
+		
+		self.assertEqual(set(warmup.timings), {'languages', 'globes'})
+	
+	def test_graph(self):
+		graph = Graph()
+		with self.assertNumQueries(0):
+			graph.add_node('fin')
+			graph.add_node('xxx')
+		self.assertEqual(set(graph.nodes), {'fin'})
+		
+		graph = Graph({'fin': (1.0, 2.0)})
+		graph.add_node('fin')
+		graph.add_node('krl')
+		self.assertEqual(graph.nodes, {'fin': {'latitude': 1.0, 'longitude': 2.0}})
+	
+	def test_globe_api(self):
+		globe = Globe.objects.first()
+		url = reverse('globe_api', args=[globe.pk])
+		
+		with self.assertNumQueries(1):
+			response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+		
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response['Content-Encoding'], 'gzip')
+		self.assertEqual(gzip.decompress(response.content).decode(), globe.geo_json)
+		
+		response = self.client.get(url)
+		self.assertEqual(response.content.decode(), globe.geo_json)
+		
+		response = self.client.get(url, HTTP_ACCEPT_ENCODING='br, gzip;q=0, *')
+		self.assertFalse(response.has_header('Content-Encoding'))
+		self.assertEqual(response.content.decode(), globe.geo_json)
+		
+		globe.geo_json = '{"type": "FeatureCollection", "features": []}'
+		globe.save()
+		
+		response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+		self.assertFalse(response.has_header('Content-Encoding'))
+		self.assertEqual(response.content.decode(), globe.geo_json)
+	
+	@override_settings(WARMUP=True)
+	def test_warm_up_server(self):
+		warmup.reset()
+		
+		call_command('check', stdout=StringIO())
+		self.assertIsNone(warmup.languages)
+		
+		warmup.warm_up_server()
+		self.assertIn('fin', warmup.languages)
+	
+	def test_landing(self):
+		with self.assertNumQueries(2):
+			response = self.client.get(reverse('landing'))
+		self.assertEqual(response.status_code, 200)
+
+
+
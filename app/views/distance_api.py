@@ -0,0 +1,170 @@
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.views.generic.base import View
+
+from app.distances import (
+	DistanceMatrix, DISTANCES_CONTENT_TYPE, find_locations, read_nearest)
+from app.models import StoredGraph
+from app.views.graph_api import load_indexed_graph
+from utils.views import accepts_media_type
+
+
+
+class DistanceApiView(View):
+	
+	def get(self, request):
+		"""
+		Returns the great-circle distances between the languages of a stored
+		graph or of a list of ISO 639-3 codes, in km to the metre: the whole
+		matrix or, if requested, the nearest neighbours of each language.
+		
+		GET
+			graph		# the permalink key of a stored graph, or
+			languages	# comma-separated ISO 639-3 codes
+			nearest		# optional, the number of nearest neighbours to return
+						# instead of the matrix, up to 100
+		
+		The graph's languages are listed in the order of their codes; the
+		given languages in the given order, without the repeated ones.
+		
+		200:
+			languages	# [] of the codes of the languages with a location
+			skipped		# [] of the given codes without a location
+			distances	# [] of rows, i.e. [] of km, in the order of the
+						# languages; unless nearest is requested
+			nearest		# {} of language: [] of [language, km], closest
+						# first, if requested
+		
+		200 if the Accept header lists app.distances.DISTANCES_CONTENT_TYPE
+		and nearest is not requested: the matrix in the binary format of
+		app.distances, streamed a tile at a time
+		
+		The matrix is served as JSON for up to DISTANCE_JSON_LIMIT languages;
+		the binary matrix and the nearest neighbours for up to DISTANCE_LIMIT.
+		
+		400: error
+		404: error
+		"""
+		return self.respond(request, request.GET)
+	
+	
+	def post(self, request):
+		"""
+		The same as GET, for lists of languages too long for a URL.
+		"""
+		return self.respond(request, request.POST)
+	
+	
+	def respond(self, request, params):
+		"""
+		Returns the response to the given QueryDict's request.
+		"""
+		is_binary = accepts_media_type(request, DISTANCES_CONTENT_TYPE)
+		
+		try:
+			codes, latitudes, longitudes, skipped = self.read_languages(params)
+			nearest = read_nearest(params, len(codes))
+			self.validate_size(len(codes), is_binary or nearest is not None)
+		except StoredGraph.DoesNotExist:
+			return JsonResponse({'error': 'Graph not found.'}, status=404)
+		except ValueError as error:
+			return JsonResponse({'error': str(error)}, status=400)
+		
+		matrix = DistanceMatrix(codes, latitudes, longitudes)
+		
+		if nearest is not None:
+			indexes, distances = matrix.get_nearest(nearest)
+			
+			response = JsonResponse({
+				'languages': codes,
+				'skipped': skipped,
+				'nearest': {
+					code: [[codes[i], d] for i, d in zip(row, row_distances)]
+					for code, row, row_distances in zip(
+						codes, indexes.tolist(), distances.round(3).tolist())
+				}
+			}, status=200)
+		elif is_binary:
+			response = StreamingHttpResponse(
+				matrix.iter_binary(), content_type=DISTANCES_CONTENT_TYPE)
+			response['Content-Length'] = str(matrix.get_binary_size())
+		else:
+			response = JsonResponse({
+				'languages': codes,
+				'skipped': skipped,
+				'distances': matrix.get_matrix().round(3).tolist()
+			}, status=200)
+		
+		patch_vary_headers(response, ('Accept',))
+		
+		return response
+	
+	
+	def read_languages(self, params):
+		"""
+		Input validation.
+		Returns the (codes, latitudes, longitudes, skipped) tuple of the
+		requested languages, see app.distances.find_locations. Raises
+		StoredGraph.DoesNotExist or ValueError.
+		"""
+		try:
+			assert bool(params.get('graph')) != bool(params.get('languages'))
+		except AssertionError:
+			raise ValueError('Please specify either a graph or languages.')
+		
+		if params.get('graph'):
+			try:
+				graph = load_indexed_graph(params['graph'])
+			except ValueError:
+				raise ValueError('Graph could not be decoded.')
+			
+			codes = sorted(graph.nodes)
+			
+			return (
+				codes,
+				[graph.nodes[code]['latitude'] for code in codes],
+				[graph.nodes[code]['longitude'] for code in codes],
+				[]
+			)
+		
+		codes = []
+		seen = set()
+		
+		for code in params['languages'].split(','):
+			code = code.strip()
+			if code and code not in seen:
+				seen.add(code)
+				codes.append(code)
+		
+		try:
+			assert len(codes) <= settings.DISTANCE_LIMIT
+		except AssertionError:
+			raise ValueError('At most {} languages, please.'.format(
+				settings.DISTANCE_LIMIT))
+		
+		return find_locations(codes)
+	
+	
+	def validate_size(self, num_languages, is_tiled):
+		"""
+		Input validation.
+		Checks the number of languages against the DISTANCE_LIMIT setting or,
+		if the whole matrix is to be served as JSON, DISTANCE_JSON_LIMIT.
+		"""
+		try:
+			assert num_languages <= settings.DISTANCE_LIMIT
+		except AssertionError:
+			raise ValueError('At most {} languages, please.'.format(
+				settings.DISTANCE_LIMIT))
+		
+		try:
+			assert is_tiled or num_languages <= settings.DISTANCE_JSON_LIMIT
+		except AssertionError:
+			raise ValueError(
+				'The distances between more than {} languages are only served '
+				'in the binary format or as nearest neighbours.'.format(
+					settings.DISTANCE_JSON_LIMIT))
+
+
+
@@ -0,0 +1,190 @@
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.generic.base import View
+
+from app.exports import SvgExport
+from app.graphs import Graph, ParseBudgetExceeded
+from app.models import Globe, StoredGraph
+from app.projections import Projection, read_projection, read_detail, \
+	get_projected_globe, iter_projected_features
+from app.views.file_api import validate_file
+from app.views.graph_api import load_stored_graph
+from utils.json import read_json
+
+import math
+
+
+
+class ExportApiView(View):
+	
+	def post(self, request):
+		"""
+		Streams the SVG image of a globe and, optionally, a graph drawn on top
+		of it. The graph is either a .dot file, a stored graph or a graph as
+		returned by the file API.
+		
+		POST
+			globe		# globe.pk
+			file		# optional, the .dot file
+			graph		# optional, the JSON of an already parsed graph
+			permalink	# optional, the key of a stored graph
+			projection	# defaults to orthographic
+			centre		# latitude,longitude; defaults to 0,0
+			detail		# 0-3; defaults to 1
+			scale		# pixels per globe radius; defaults to 500
+			crop		# left,top,width,height in pixels, relative to the
+						# projection centre; defaults to -500,-500,1000,1000
+			ocean, earth, edge, node	# optional colours
+		
+		200: the SVG image
+		
+		400: error
+		404: error
+		"""
+		try:
+			projection = read_projection(request.POST)
+			if projection is None:
+				projection = Projection('orthographic')
+			detail = read_detail(request.POST)
+			scale, crop = self.validate_canvas(request)
+			graph = self.validate_graph(request)
+		except ValueError as error:
+			return JsonResponse({'error': str(error)}, status=400)
+		
+		try:
+			globe = Globe.objects.defer('geo_json').get(pk=request.POST.get('globe'))
+		except (Globe.DoesNotExist, ValueError):
+			return JsonResponse({'error': 'Globe not found.'}, status=404)
+		
+		try:
+			features = iter_projected_features(
+				get_projected_globe(globe, projection, detail))
+		except ValueError:
+			return JsonResponse({'error': 'Globe could not be parsed.'}, status=400)
+		
+		colours = {}
+		for key in ('ocean', 'earth', 'edge', 'node'):
+			if request.POST.get(key):
+				colours[key] = request.POST[key]
+		
+		export = SvgExport(projection, crop, scale, colours)
+		
+		response = StreamingHttpResponse(
+			export.iter_svg(features, graph),
+			content_type='image/svg+xml'
+		)
+		response['Content-Disposition'] = 'attachment; filename="map.svg"'
+		
+		return response
+	
+	
+	def validate_canvas(self, request):
+		"""
+		Input validation.
+		Returns the (scale, crop) tuple.
+		"""
+		try:
+			scale = float(request.POST.get('scale', 500))
+			crop = [
+				float(item) for item in
+				request.POST.get('crop', '-500,-500,1000,1000').split(',')
+			]
+			assert len(crop) == 4
+		except (ValueError, AssertionError):
+			raise ValueError('Scale and crop should be numbers.')
+		
+		try:
+			assert 0 < scale <= 100000
+			assert math.isfinite(crop[0]) and math.isfinite(crop[1])
+			assert 0 < crop[2] <= 20000
+			assert 0 < crop[3] <= 20000
+		except AssertionError:
+			raise ValueError('Scale or crop out of range.')
+		
+		return scale, crop
+	
+	
+	def validate_graph(self, request):
+		"""
+		Input validation.
+		Returns the graph dict or None if no graph is given.
+		"""
+		if 'file' in request.FILES:
+			f = validate_file(request)
+			
+			contents = f.read()
+			
+			graph = Graph()
+			try:
+				if isinstance(contents, bytes):
+					contents = contents.decode()
+				graph.read_dot_string(contents)
+			except ParseBudgetExceeded:
+				raise
+			except ValueError:
+				raise ValueError('File could not be parsed.')
+			
+			return graph.to_dict()
+		
+		if request.POST.get('permalink'):
+			try:
+				return load_stored_graph(request.POST['permalink']).to_dict()
+			except (StoredGraph.DoesNotExist, ValueError):
+				raise ValueError('Graph not found.')
+		
+		if request.POST.get('graph'):
+			try:
+				return self.clean_graph_dict(read_json(request.POST['graph']))
+			except (ValueError, TypeError, KeyError, AttributeError):
+				raise ValueError('Graph could not be read.')
+		
+		return None
+	
+	
+	def clean_graph_dict(self, d):
+		"""
+		Returns a copy of the given graph dict with all the values the export
+		needs coerced to the expected types. Unknown keys are dropped. Raises
+		ValueError if a coordinate is out of range or a number is not finite.
+		"""
+		nodes = {}
+		
+		for name, node in d['nodes'].items():
+			clean = {
+				'latitude': float(node['latitude']),
+				'longitude': float(node['longitude'])
+			}
+			try:
+				assert math.isfinite(clean['latitude']) and abs(clean['latitude']) <= 90
+				assert math.isfinite(clean['longitude']) and abs(clean['longitude']) <= 180
+			except AssertionError:
+				raise ValueError('Node coordinates out of range.')
+			for key in ('colour', 'fontcolour', 'strokecolour'):
+				if key in node:
+					clean[key] = str(node[key])
+			if 'opacity' in node:
+				clean['opacity'] = float(node['opacity'])
+				if not math.isfinite(clean['opacity']):
+					raise ValueError('Opacity should be a finite number.')
+			nodes[str(name)] = clean
+		
+		edges = []
+		
+		for edge in d['edges']:
+			clean = {
+				'head': str(edge['head']),
+				'tail': str(edge['tail']),
+				'is_directed': bool(edge.get('is_directed'))
+			}
+			if 'colour' in edge:
+				clean['colour'] = str(edge['colour'])
+			for key in ('weight', 'opacity'):
+				if edge.get(key) is not None:
+					clean[key] = float(edge[key])
+					if not math.isfinite(clean[key]):
+						raise ValueError('Edge {} should be a finite number.'.format(key))
+			edges.append(clean)
+		
+		return {'name': str(d.get('name', '')), 'nodes': nodes, 'edges': edges}
+
+
+
@@ -1,93 +1,272 @@
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import patch_vary_headers
 from django.views.generic.base import View
 
-from app.models import Language
-from app.graphs import Graph
+from app.filters import read_filter
+from app.labels import read_labels
+from app.metrics import observe
+from app.models import ParseJob
+from app.packing import pack_graph_response, WIRE_CONTENT_TYPE
+from app.parsing import build_graph_response, read_graph, store_graph
+from app.profiling import MemoryProfile, phase
+from app.projections import read_projection
+from app.regions import read_regions
+from utils.json import make_json
+from utils.views import accepts_media_type
+
+import codecs
 
 
 
 class FileApiView(View):
 	
+	"""
+	Uploads are recognised as edge lists by their extension or content type;
+	anything else is taken for a .dot file.
+	"""
+	extensions = {
+		'.csv': 'csv',
+		'.tsv': 'tsv',
+		'.tab': 'tsv',
+	}
+	content_types = {
+		'text/csv': 'csv',
+		'text/tab-separated-values': 'tsv',
+	}
+	
+	"""
+	The parse budget setting of the view's parses.
+	"""
+	budget_name = 'PARSE_BUDGET'
+	
+	def dispatch(self, request, *args, **kwargs):
+		"""
+		Profiles the memory of the request's phases, if the MEMORY_PROFILE
+		setting is on or the view's budget setting has a max_memory; see
+		app.profiling. The profile is reported in the X-Memory-* headers.
+		"""
+		with MemoryProfile(self.budget_name) as profile:
+			response = super().dispatch(request, *args, **kwargs)
+		
+		profile.report(request.path, response)
+		
+		return response
+	
+	
 	def get(self, request):
 		"""
 		Equivalent to POST the app/fixtures/sample.dot file.
 		Used for development purposes.
 		"""
-		with open('app/fixtures/sample.dot', 'r') as f:
-			contents = f.read()
+		with phase('read'):
+			with open('app/fixtures/sample.dot', 'r') as f:
+				contents = f.read()
 		
-		graph = Graph()
+		params = request.GET.copy()
+		params['format'] = 'dot'
 		
-		try:
-			graph.read_dot_string(contents)
-		except ValueError as error:
-			return JsonResponse({
-				'error': 'File could not be parsed.'
-			}, status=400)
-		
-		return JsonResponse(graph.to_dict(), status=200)
+		return self.respond(request, contents, params)
 	
 	
 	def post(self, request):
 		"""
-		Receives .dot files and returns ready-for-front-end-consumption graphs.
+		Receives .dot files or edge lists and returns
+		ready-for-front-end-consumption graphs.
 		
 		POST
-			file	# the .dot file
+			file		# the .dot file or the .csv/.tsv edge list
+			nodes		# optional, the .csv/.tsv node table of an edge list
+			projection	# optional, see app.projections.read_projection
+			centre		# optional, latitude,longitude
+			permalink	# optional, if set the graph is stored
+			async		# optional, if set the file is parsed in the background
+			bbox, subset, min_weight, edges	# optional, see app.filters.read_filter
+			regions		# optional, globe.pk; the nodes get the index of the
+						# globe's feature that they are in (JSON only)
+			labels		# optional, if set the label plan is included (JSON
+						# only); see app.labels.read_labels
+			stats		# optional, if set the statistics are included (JSON
+						# only); see app.stats
+		
+		The edge list and node table columns are these listed in
+		app.graphs.Graph.read_edge_list. The filters only apply to the
+		response: the stored graph, if requested, is the whole graph.
 		
 		200:
 			name	# pretty file name
 			nodes	# {} of language: {latitude, longitude, colour, opacity, fontcolour, strokecolour}
+					# and also {x, y} if a projection is requested
+					# and also {region} if regions are requested
 			edges	# [] of {head, tail, is_directed, weight, colour, opacity}
+			permalink	# the key of the stored graph, if requested
+			labels	# {} of language: {zoom, dx, dy}, if requested: the lowest
+					# zoom to show the node's label at and its offset in pixels;
+					# a zoom of null means the label never fits; the plan does
+					# not depend on the centre of the globe
+			stats	# if requested, the statistics of the (filtered) graph:
+				nodes		# {} of language: {in, out, undirected, strength,
+							# in_strength, out_strength, component}; edges
+							# without a weight weigh 1 in the strengths
+				degrees		# [] of the number of nodes of each total degree
+				components	# {count, sizes}; the components are numbered
+							# from the largest, as listed in sizes
+				edge_lengths	# {bins, counts, mean, median, max}: the
+							# great-circle lengths of the edges in km
+		
+		200 if the Accept header lists app.packing.WIRE_CONTENT_TYPE: the
+		graph in the wire format of app.packing.pack_graph_response, with the
+		permalink, if requested, in the X-Permalink header
+		
+		202:
+			job		# the key to poll app.views.job_api.JobApiView with
+			status	# pending
 		
 		400: error
 		"""
+		is_async = bool(request.POST.get('async'))
 		
 		try:
-			f = self.validate_file(request)
+			if is_async:
+				f = validate_file(request, settings.JOB_FILE_SIZE_LIMIT)
+			else:
+				f = validate_file(request, settings.FILE_SIZE_LIMIT)
+			fmt = self.validate_format(request, is_async)
+			read_projection(request.POST)
+			read_filter(request.POST)
+			read_regions(request.POST)
+			read_labels(request.POST)
 		except ValueError as error:
 			return JsonResponse({'error': str(error)}, status=400)
 		
-		graph = Graph()
+		params = request.POST.copy()
+		params['format'] = fmt
+		
+		observe('sanavirta_parse_size_bytes', f.size, format=fmt)
+		
+		if is_async:
+			contents = f.read()
+			if isinstance(contents, bytes):
+				try:
+					contents = contents.decode()
+				except UnicodeDecodeError:
+					return JsonResponse({'error': 'File could not be parsed.'}, status=400)
+			
+			options = dict(params.items())
+			options.pop('async')
+			
+			job = ParseJob()
+			job.contents = contents
+			job.options = make_json(options)
+			job.save()
+			
+			return JsonResponse({'job': job.key, 'status': job.status}, status=202)
+		
+		nodes = None
 		
-		contents = f.read()
-		if isinstance(contents, bytes):
-			contents = contents.decode()
+		if fmt == 'dot':
+			with phase('read'):
+				contents = f.read()
+			if isinstance(contents, bytes):
+				try:
+					with phase('decode'):
+						contents = contents.decode()
+				except UnicodeDecodeError:
+					return JsonResponse({'error': 'File could not be parsed.'}, status=400)
+		else:  # streamed line by line
+			contents = codecs.iterdecode(f, 'utf-8')
+			if 'nodes' in request.FILES:
+				nodes = codecs.iterdecode(request.FILES['nodes'], 'utf-8')
 		
+		return self.respond(request, contents, params, nodes)
+	
+	
+	def respond(self, request, contents, params, nodes=None):
+		"""
+		Returns the response with the graph read out of the given contents:
+		JSON or, if the client accepts it, the binary wire format.
+		"""
 		try:
-			graph.read_dot_string(contents)
+			if accepts_media_type(request, WIRE_CONTENT_TYPE):
+				projection = read_projection(params)
+				graph_filter = read_filter(params)
+				graph = read_graph(contents, params, nodes=nodes)
+				with phase('pack'):
+					response = HttpResponse(
+						pack_graph_response(graph.filter(graph_filter), projection),
+						content_type = WIRE_CONTENT_TYPE
+					)
+				if params.get('permalink'):
+					response['X-Permalink'] = store_graph(graph)
+			else:
+				d = build_graph_response(contents, params, nodes=nodes)
+				with phase('encode'):
+					response = JsonResponse(d, status=200)
 		except ValueError as error:
-			return JsonResponse({
-				'error': 'File could not be parsed.'
-			}, status=400)
+			return JsonResponse({'error': str(error)}, status=400)
+		
+		patch_vary_headers(response, ('Accept',))
 		
-		return JsonResponse(graph.to_dict(), status=200)
+		return response
 	
 	
-	def validate_file(self, request):
+	def validate_format(self, request, is_async=False):
 		"""
 		Input validation.
-		Returns the UploadedFile instance.
+		Returns the format of the uploaded file: dot, csv, or tsv.
 		"""
-		try:
-			assert len(request.FILES) == 1
-			assert 'file' in request.FILES
-		except AssertionError:
-			raise ValueError('One file at a time, please.')
-		
 		f = request.FILES['file']
 		
-		try:
-			assert f.size > 0
-		except AssertionError:
-			raise ValueError('The file is empty.')
+		fmt = self.content_types.get(f.content_type, 'dot')
+		for extension, value in self.extensions.items():
+			if f.name.lower().endswith(extension):
+				fmt = value
 		
-		try:
-			assert f.size <= 1024 * 500
-		except AssertionError:
-			raise ValueError('The file exceeds the 500 KB limit.')
+		if 'nodes' in request.FILES:
+			try:
+				assert fmt != 'dot'
+			except AssertionError:
+				raise ValueError('Node tables go with edge lists only.')
+			
+			try:
+				assert not is_async
+			except AssertionError:
+				raise ValueError('Node tables cannot be parsed in the background.')
 		
-		return f
+		return fmt
+
+
+
+def validate_file(request, limit=None):
+	"""
+	Input validation of the uploads of the file API and the views that take
+	the same files. Returns the UploadedFile instance; the size limit defaults
+	to the FILE_SIZE_LIMIT setting.
+	"""
+	if limit is None:
+		limit = settings.FILE_SIZE_LIMIT
+	
+	try:
+		assert 'file' in request.FILES
+		assert set(request.FILES) <= {'file', 'nodes'}
+	except AssertionError:
+		raise ValueError('One file at a time, please.')
+	
+	f = request.FILES['file']
+	
+	try:
+		assert f.size > 0
+	except AssertionError:
+		raise ValueError('The file is empty.')
+	
+	try:
+		assert f.size <= limit
+		assert 'nodes' not in request.FILES \
+			or request.FILES['nodes'].size <= limit
+	except AssertionError:
+		raise ValueError('The file exceeds the {} KB limit.'.format(limit // 1024))
+	
+	return f
 
 
 
@@ -1,7 +1,14 @@
+from django.core.paginator import Paginator, InvalidPage
 from django.http import JsonResponse, HttpResponse
+from django.utils.cache import patch_vary_headers
 from django.views.generic.base import View
 
-from app.models import Globe
+from app.models import Globe, StoredGraph
+from app.projections import read_projection, read_detail, get_projected_globe
+from app.regions import get_region_index, read_points, annotate_nodes
+from app.views.graph_api import load_stored_graph
+from app.warmup import get_warm_globe
+from utils.views import accepts_encoding
 
 
 
@@ -9,7 +16,8 @@ class GlobeApiView(View):
 	
 	def get(self, request, globe_id):
 		"""
-		Returns the GeoJSON of the requested globe.
+		Returns the GeoJSON of the requested globe. Warm globes (see
+		app.warmup) are served from memory, gzipped if the client accepts it.
 		
 		GET
 			id		# globe.pk
@@ -19,6 +27,20 @@ class GlobeApiView(View):
 		
 		404: error
 		"""
+		warm = get_warm_globe(globe_id)
+		
+		if warm is not None:
+			geo_json, gzipped = warm
+			
+			if accepts_encoding(request, 'gzip'):
+				response = HttpResponse(gzipped, status=200)
+				response['Content-Encoding'] = 'gzip'
+			else:
+				response = HttpResponse(geo_json, status=200)
+			
+			patch_vary_headers(response, ('Accept-Encoding',))
+			return response
+		
 		try:
 			globe = Globe.objects.get(pk=globe_id)
 		except Globe.DoesNotExist:
@@ -28,3 +50,188 @@ class GlobeApiView(View):
 
 
 
+class ProjectedGlobeApiView(View):
+	
+	def get(self, request, globe_id):
+		"""
+		Returns the requested globe projected onto the plane. Results are
+		cached per globe, projection and detail level.
+		
+		GET
+			id			# globe.pk
+			projection	# orthographic, equirectangular or mercator
+			centre		# latitude,longitude; defaults to 0,0
+			detail		# 0-3; defaults to 1
+		
+		200:
+			projection	# the projection with its centre
+			detail		# the detail level
+			features	# [] of parts, i.e. [] of rings, i.e. [x0, y0, x1, ...]
+		
+		400: error
+		404: error
+		"""
+		try:
+			projection = read_projection(request.GET)
+			detail = read_detail(request.GET)
+		except ValueError as error:
+			return JsonResponse({'error': str(error)}, status=400)
+		
+		if projection is None:
+			return JsonResponse({'error': 'Please specify a projection.'}, status=400)
+		
+		try:
+			globe = Globe.objects.defer('geo_json').get(pk=globe_id)
+		except Globe.DoesNotExist:
+			return JsonResponse({'error': 'Globe not found.'}, status=404)
+		
+		try:
+			data = get_projected_globe(globe, projection, detail)
+		except ValueError:
+			return JsonResponse({'error': 'Globe could not be parsed.'}, status=400)
+		
+		return HttpResponse(data, content_type='application/json', status=200)
+
+
+
+class RegionApiView(View):
+	
+	def get(self, request, globe_id):
+		"""
+		Tells which features of the requested globe the given points and/or
+		the nodes of the given stored graph are in. The globe's spatial index
+		(see app.regions) is built on the first request and kept in memory.
+		
+		GET
+			id			# globe.pk
+			points		# optional, latitude,longitude pairs separated by |
+			permalink	# optional, the key of a stored graph
+		
+		200:
+			regions		# [] of the points' feature indices or nulls
+			nodes		# {} of node: feature index or null, if permalink
+			features	# {} of feature index: properties, of the features above
+		
+		400: error
+		404: error
+		"""
+		return self.respond(request.GET, globe_id)
+	
+	
+	def post(self, request, globe_id):
+		"""
+		Same as GET, for point lists too long for the URL.
+		"""
+		return self.respond(request.POST, globe_id)
+	
+	
+	def respond(self, params, globe_id):
+		"""
+		Helper for get and post.
+		"""
+		try:
+			latitudes, longitudes = read_points(params)
+		except ValueError as error:
+			return JsonResponse({'error': str(error)}, status=400)
+		
+		try:
+			globe = Globe.objects.defer('geo_json').get(pk=globe_id)
+		except Globe.DoesNotExist:
+			return JsonResponse({'error': 'Globe not found.'}, status=404)
+		
+		nodes = {}
+		if params.get('permalink'):
+			try:
+				nodes = load_stored_graph(params['permalink']).nodes
+			except (StoredGraph.DoesNotExist, ValueError):
+				return JsonResponse({'error': 'Graph not found.'}, status=404)
+		
+		try:
+			index = get_region_index(globe)
+		except ValueError:
+			return JsonResponse({'error': 'Globe could not be parsed.'}, status=400)
+		
+		d = {'regions': [
+			region if region >= 0 else None
+			for region in index.locate(longitudes, latitudes).tolist()
+		]}
+		
+		found = set(d['regions'])
+		
+		if params.get('permalink'):
+			nodes = annotate_nodes(nodes, index)
+			d['nodes'] = {name: node['region'] for name, node in nodes.items()}
+			found.update(d['nodes'].values())
+		
+		d['features'] = {
+			region: index.properties[region]
+			for region in sorted(found - {None})
+		}
+		
+		return JsonResponse(d, status=200)
+
+
+
+class GlobeListApiView(View):
+	
+	def get(self, request):
+		"""
+		Returns a page of globe metadata. The GeoJSON strings are deferred, so
+		that listing does not cost more than the metadata itself.
+		
+		GET
+			page		# defaults to 1
+			per_page	# defaults to 20, at most 100
+		
+		200:
+			count		# total number of globes
+			page		# the current page
+			num_pages	# total number of pages
+			globes		# [] of {id, name, description, byte_size,
+						#	feature_count, bbox, content_hash, last_modified}
+		
+		400: error
+		404: error
+		"""
+		try:
+			page, per_page = self.validate_params(request)
+		except ValueError as error:
+			return JsonResponse({'error': str(error)}, status=400)
+		
+		globes = Globe.objects.defer('geo_json')
+		paginator = Paginator(globes, per_page)
+		
+		try:
+			current = paginator.page(page)
+		except InvalidPage:
+			return JsonResponse({'error': 'Page not found.'}, status=404)
+		
+		return JsonResponse({
+			'count': paginator.count,
+			'page': current.number,
+			'num_pages': paginator.num_pages,
+			'globes': [globe.to_dict() for globe in current]
+		}, status=200)
+	
+	
+	def validate_params(self, request):
+		"""
+		Input validation.
+		Returns the (page, per_page) tuple.
+		"""
+		try:
+			page = int(request.GET.get('page', 1))
+			per_page = int(request.GET.get('per_page', 20))
+		except ValueError:
+			raise ValueError('Page parameters should be integers.')
+		
+		try:
+			assert page >= 1
+			assert 1 <= per_page <= 100
+		except AssertionError:
+			raise ValueError('Page parameters out of range.')
+		
+		return page, per_page
+
+
+
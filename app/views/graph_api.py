@@ -0,0 +1,116 @@
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.generic.base import View
+
+from app.filters import read_filter
+from app.graphs import Graph
+from app.metrics import record_cache
+from app.models import StoredGraph
+from app.packing import unpack_graph
+from app.projections import read_projection
+
+from collections import OrderedDict
+
+import threading
+
+
+
+"""
+Maps permalink keys to decoded and indexed Graph instances, least recently
+used first; see load_indexed_graph.
+"""
+indexed_graphs = OrderedDict()
+indexed_graphs_lock = threading.Lock()
+
+
+
+class GraphApiView(View):
+	
+	def get(self, request, key):
+		"""
+		Returns a stored graph in the same form as the file API does. This is
+		a single row read plus decoding: no .dot parsing, no language lookups.
+		Recently requested graphs are not even decoded again.
+		
+		GET
+			key			# the permalink key
+			projection	# optional, see app.projections.read_projection
+			centre		# optional, latitude,longitude
+			bbox, subset, min_weight, edges	# optional, see app.filters.read_filter
+		
+		200:
+			name	# pretty file name
+			nodes	# {} of language: {latitude, longitude, ...}
+			edges	# [] of {head, tail, is_directed, ...}
+		
+		400: error
+		404: error
+		"""
+		try:
+			projection = read_projection(request.GET)
+			graph_filter = read_filter(request.GET)
+		except ValueError as error:
+			return JsonResponse({'error': str(error)}, status=400)
+		
+		try:
+			graph = load_indexed_graph(key)
+		except StoredGraph.DoesNotExist:
+			return JsonResponse({'error': 'Graph not found.'}, status=404)
+		except ValueError:
+			return JsonResponse({'error': 'Graph could not be decoded.'}, status=400)
+		
+		graph = graph.filter(graph_filter)
+		
+		return JsonResponse(graph.to_dict(projection), status=200)
+
+
+
+def load_stored_graph(key):
+	"""
+	Returns the Graph instance stored under the given permalink key. Raises
+	StoredGraph.DoesNotExist or ValueError.
+	"""
+	data = StoredGraph.objects.values_list('data', flat=True).get(key=key)
+	
+	graph = Graph()
+	unpack_graph(data, graph)
+	
+	return graph
+
+
+
+def load_indexed_graph(key):
+	"""
+	Returns the Graph instance stored under the given permalink key, with its
+	index built (see app.filters). The last STORED_GRAPH_CACHE_SIZE graphs are
+	kept in memory; as stored graphs never change, a cached graph only needs
+	to be checked for still existing. The returned graph is shared and must
+	not be changed. Raises StoredGraph.DoesNotExist or ValueError.
+	"""
+	with indexed_graphs_lock:
+		graph = indexed_graphs.get(key)
+		if graph is not None:
+			indexed_graphs.move_to_end(key)
+	
+	record_cache('indexed_graph', graph is not None)
+	
+	if graph is not None:
+		if StoredGraph.objects.filter(key=key).exists():
+			return graph
+		
+		with indexed_graphs_lock:
+			indexed_graphs.pop(key, None)
+		raise StoredGraph.DoesNotExist()
+	
+	graph = load_stored_graph(key)
+	graph.get_index()
+	
+	with indexed_graphs_lock:
+		indexed_graphs[key] = graph
+		while len(indexed_graphs) > settings.STORED_GRAPH_CACHE_SIZE:
+			indexed_graphs.popitem(last=False)
+	
+	return graph
+
+
+
@@ -0,0 +1,76 @@
+from django.conf import settings
+from django.http import JsonResponse, HttpResponse
+from django.views.generic.base import View
+
+from app.models import ParseJob
+
+import time
+
+
+
+class JobApiView(View):
+	
+	"""
+	How often a waiting request checks its job; the most seconds it may wait
+	is the JOB_MAX_WAIT setting.
+	"""
+	poll_interval = 0.25
+	
+	def get(self, request, key):
+		"""
+		Returns the status of a background parse job or, if it is done, its
+		result. With wait set, the request is held open until the job finishes
+		or the wait is over (long polling). A waiting request holds its worker,
+		hence the short JOB_MAX_WAIT.
+		
+		GET
+			key		# the job key returned by the file API
+			wait	# optional, seconds to wait for the job to finish
+		
+		200: the same as the file API's 200
+		
+		202:
+			job		# the job key
+			status	# pending or running
+		
+		400: error
+		404: error
+		"""
+		max_wait = settings.JOB_MAX_WAIT
+		
+		try:
+			wait = float(request.GET.get('wait', 0))
+			assert 0 <= wait <= max_wait
+		except (ValueError, AssertionError):
+			return JsonResponse({
+				'error': 'Wait should be between 0 and {} seconds.'.format(max_wait)
+			}, status=400)
+		
+		jobs = ParseJob.objects.defer('contents', 'result')
+		
+		try:
+			job = jobs.get(key=key)
+		except ParseJob.DoesNotExist:
+			return JsonResponse({'error': 'Job not found.'}, status=404)
+		
+		deadline = time.monotonic() + wait
+		
+		try:
+			while job.status in (ParseJob.PENDING, ParseJob.RUNNING):
+				if time.monotonic() >= deadline:
+					return JsonResponse({'job': job.key, 'status': job.status}, status=202)
+				time.sleep(self.poll_interval)
+				job.status = jobs.values_list('status', flat=True).get(pk=job.pk)
+			
+			if job.status == ParseJob.FAILED:
+				job.refresh_from_db(fields=['error'])
+				return JsonResponse({'error': job.error}, status=400)
+			
+			result = ParseJob.objects.values_list('result', flat=True).get(pk=job.pk)
+		except ParseJob.DoesNotExist:  # purged in the meantime
+			return JsonResponse({'error': 'Job not found.'}, status=404)
+		
+		return HttpResponse(result, content_type='application/json', status=200)
+
+
+
@@ -4,6 +4,7 @@ from django.views.decorators.csrf import ensure_csrf_cookie
 from django.views.generic.base import View
 
 from app.models import Globe
+from app.warmup import get_warm_globe
 
 
 
@@ -21,10 +22,20 @@ class LandingView(View):
 		"""
 		Renders the landing page.
 		"""
-		globes = Globe.objects.all()
+		globes = list(Globe.objects.defer('geo_json'))
+
+		earth = None
+
+		if globes:
+			warm = get_warm_globe(globes[0].pk)
+			if warm is not None:
+				earth = warm[0]
+			else:
+				earth = Globe.objects.values_list(
+					'geo_json', flat=True).get(pk=globes[0].pk)
 
 		context = {
 			'globes': globes,
-			'EARTH': globes[0].geo_json }
+			'EARTH': earth if earth is not None else 'null' }
 
 		return render(request, 'landing.html', context)
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.views.generic.base import View
+
+from app.metrics import collect, render
+
+
+
+class MetricsView(View):
+	
+	def get(self, request):
+		"""
+		Returns the metrics of all the processes in the Prometheus text format,
+		see app.metrics. Only served to the METRICS_ALLOWED_IPS addresses.
+		
+		Behind a reverse proxy on the same host, all the requests come from an
+		allowed address; those that the proxy forwards are told apart by the
+		X-Forwarded-For header, which the proxy should set, and are refused.
+		
+		200: text/plain of the metrics
+		404: error
+		"""
+		if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS \
+				or 'HTTP_X_FORWARDED_FOR' in request.META:
+			return JsonResponse({'error': 'Not found.'}, status=404)
+		
+		return HttpResponse(render(collect()),
+			content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+
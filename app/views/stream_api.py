@@ -0,0 +1,253 @@
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+
+from app.graphs import Graph, ParseBudget, ParseBudgetExceeded
+from app.metrics import observe
+from app.parsing import DELIMITERS
+from app.projections import read_projection
+from app.views.file_api import FileApiView, validate_file
+from utils.json import make_json
+
+import codecs
+import itertools
+
+
+
+"""
+The default and the maximum number of nodes or edges per event.
+"""
+DEFAULT_BATCH_SIZE = 500
+MAX_BATCH_SIZE = 10000
+
+
+
+class FileStreamApiView(FileApiView):
+	
+	budget_name = 'JOB_PARSE_BUDGET'
+	
+	def get(self, request):
+		"""
+		Equivalent to POST the app/fixtures/sample.dot file.
+		Used for development purposes.
+		"""
+		try:
+			read_projection(request.GET)
+			batch_size = self.validate_batch_size(request.GET)
+		except ValueError as error:
+			return JsonResponse({'error': str(error)}, status=400)
+		
+		with open('app/fixtures/sample.dot', 'r') as f:
+			contents = f.read()  # the file is closed before the stream
+		
+		return self.respond_stream(request.GET, 'dot', contents, None, batch_size)
+	
+	
+	def post(self, request):
+		"""
+		Receives the same files as the file API and streams the graph as
+		server-sent events while it is being read, so that clients can start
+		drawing huge graphs early. The file is read as the events are sent:
+		.dot files one top-level statement at a time (see
+		Graph.iter_dot_lines), edge lists one row at a time.
+		
+		Being meant for huge graphs, the stream takes files up to the
+		JOB_FILE_SIZE_LIMIT setting and parses within JOB_PARSE_BUDGET. The
+		budget's max_memory does not apply: the stream is not profiled.
+		
+		POST
+			file		# the .dot file or the .csv/.tsv edge list
+			nodes		# optional, the .csv/.tsv node table of an edge list
+			projection	# optional, see app.projections.read_projection
+			centre		# optional, latitude,longitude
+			batch		# optional, nodes or edges per event; defaults to 500
+		
+		200: text/event-stream of the events
+			graph	# {name}, first
+			nodes	# {nodes} as in the file API's response, batch by batch
+			edges	# {edges} as in the file API's response, batch by batch;
+					# the edges' nodes are always sent before the edges
+			error	# {error}, if the parse fails midway; last
+			done	# {nodes, edges}, the total numbers sent; last
+		
+		Nodes are sent once, as first added: should a file repeat them, the
+		later attributes are not sent, unlike in the file API. The edges are
+		dropped once sent, so an edge that a file repeats is merged with the
+		pending one if that is not sent yet and is sent again otherwise.
+		In .dot files, the edges whose nodes come later are left out.
+		
+		The memory taken is thus bounded by the batch size, save for the
+		nodes, which are kept to check the edges against and whose number is
+		bounded by the languages known, and the names of the nodes looked up.
+		
+		400: error, if the file could not be parsed at all
+		"""
+		try:
+			validate_file(request, settings.JOB_FILE_SIZE_LIMIT)
+			fmt = self.validate_format(request)
+			read_projection(request.POST)
+			batch_size = self.validate_batch_size(request.POST)
+		except ValueError as error:
+			return JsonResponse({'error': str(error)}, status=400)
+		
+		f = request.FILES['file']
+		nodes = None
+		
+		observe('sanavirta_parse_size_bytes', f.size, format=fmt)
+		
+		contents = codecs.iterdecode(f, 'utf-8')
+		if fmt != 'dot' and 'nodes' in request.FILES:
+			nodes = codecs.iterdecode(request.FILES['nodes'], 'utf-8')
+		
+		return self.respond_stream(request.POST, fmt, contents, nodes, batch_size)
+	
+	
+	def validate_batch_size(self, params):
+		"""
+		Input validation.
+		Returns the number of nodes or edges per event.
+		"""
+		try:
+			batch_size = int(params.get('batch', DEFAULT_BATCH_SIZE))
+			assert 0 < batch_size <= MAX_BATCH_SIZE
+		except (ValueError, AssertionError):
+			raise ValueError('Batch should be a number between 1 and {}.'.format(
+				MAX_BATCH_SIZE))
+		
+		return batch_size
+	
+	
+	def respond_stream(self, params, fmt, contents, nodes, batch_size):
+		"""
+		Starts reading the graph and returns the streaming response; returns
+		the 400 response instead if the reading fails before anything is
+		added to the graph. The contents are a string or an iterable of
+		strings; the errors of decoding the latter are UnicodeDecodeError,
+		which is a ValueError.
+		"""
+		graph = Graph()
+		budget = ParseBudget.from_settings(self.budget_name)
+		
+		if fmt == 'dot':
+			items = graph.iter_dot_lines(contents, budget)
+		else:
+			items = graph.iter_edge_list(contents, nodes, DELIMITERS[fmt], budget)
+		
+		try:
+			first = list(itertools.islice(items, 1))
+		except ParseBudgetExceeded as error:
+			return JsonResponse({'error': str(error)}, status=400)
+		except ValueError:
+			return JsonResponse({'error': 'File could not be parsed.'}, status=400)
+		
+		events = iter_graph_events(graph, itertools.chain(first, items),
+			read_projection(params), batch_size)
+		
+		response = StreamingHttpResponse(events, content_type='text/event-stream')
+		response['Cache-Control'] = 'no-cache'
+		response['X-Accel-Buffering'] = 'no'  # for nginx not to buffer the stream
+		
+		return response
+
+
+
+def iter_graph_events(graph, items, projection, batch_size):
+	"""
+	Yields the server-sent events of the given Graph instance as it is being
+	populated by the given items generator (see Graph.iter_dot_lines). The
+	pending nodes are always flushed before the pending edges, so that clients
+	never get an edge before its nodes. The edges are removed from the graph
+	once sent, see pop_edge_dicts.
+	"""
+	sent_nodes = set()
+	num_edges = 0
+	nodes = []
+	edges = []
+	pending_edges = set()
+	
+	yield format_event('graph', {'name': graph.name})
+	
+	try:
+		for kind, key in items:
+			if kind == 'node':
+				if key not in sent_nodes:
+					sent_nodes.add(key)
+					nodes.append(key)
+			elif key not in pending_edges:
+				pending_edges.add(key)
+				edges.append(key)
+			
+			if len(nodes) >= batch_size or (nodes and len(edges) >= batch_size):
+				yield format_event('nodes', {
+					'nodes': get_node_dicts(graph, nodes, projection)})
+				nodes = []
+			
+			if len(edges) >= batch_size:
+				yield format_event('edges', {'edges': pop_edge_dicts(graph, edges)})
+				num_edges += len(edges)
+				edges = []
+				pending_edges = set()
+	except ValueError as error:
+		if not isinstance(error, ParseBudgetExceeded):
+			error = 'File could not be parsed.'
+		yield format_event('error', {'error': str(error)})
+		return
+	
+	if nodes:
+		yield format_event('nodes', {
+			'nodes': get_node_dicts(graph, nodes, projection)})
+	if edges:
+		yield format_event('edges', {'edges': pop_edge_dicts(graph, edges)})
+		num_edges += len(edges)
+	
+	yield format_event('done', {'nodes': len(sent_nodes), 'edges': num_edges})
+
+
+
+def get_node_dicts(graph, names, projection=None):
+	"""
+	Returns {name: node dict} of the given nodes of the given Graph instance,
+	as listed by Graph.to_dict. The projection, if any, is applied to these
+	nodes only.
+	"""
+	if projection is None:
+		return {name: graph.nodes[name] for name in names}
+	
+	x, y = projection.project(
+		[graph.nodes[name]['longitude'] for name in names],
+		[graph.nodes[name]['latitude'] for name in names]
+	)
+	
+	return {
+		name: dict(graph.nodes[name], x=x_, y=y_)
+		for name, x_, y_ in zip(names, x.tolist(), y.tolist())
+	}
+
+
+
+def pop_edge_dicts(graph, keys):
+	"""
+	Returns the dicts of the given (is_directed, key) edges of the given Graph
+	instance, as listed by Graph.to_dict, and removes the edges from the
+	graph, which is thus left with its nodes only.
+	"""
+	dicts = [graph.get_edge_dict(*key) for key in keys]
+	
+	for is_directed, key in keys:
+		if is_directed:
+			del graph.directed[key]
+		else:
+			del graph.undirected[key]
+	
+	return dicts
+
+
+
+def format_event(event, data):
+	"""
+	Returns the given event with the given data as JSON in the wire format of
+	server-sent events.
+	"""
+	return 'event: {}\ndata: {}\n\n'.format(event, make_json(data))
+
+
+
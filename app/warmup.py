@@ -0,0 +1,151 @@
+"""
+Warming up the process before the web server forks its workers. If the WARMUP
+setting is on, project.wsgi loads the globes' GeoJSON strings, their gzip
+variants and the languages' locations into the module-level tables below (see
+warm_up_server); other processes, e.g. management commands, do not. Workers
+forked afterwards (e.g. by gunicorn --preload) share these copy-on-write
+instead of each fetching them from the database on its first requests.
+
+The languages table is a snapshot: languages added or moved afterwards are
+only picked up when the workers are restarted. The globes are checked against
+their content hash before being served, so an edited globe is never stale.
+"""
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+from app.metrics import record_cache
+from app.models import Globe, Language
+
+import gzip
+import logging
+import time
+
+
+
+logger = logging.getLogger('sanavirta.error')
+
+
+
+"""
+Maps ISO 639-3 codes to (latitude, longitude) tuples; None unless warmed up.
+"""
+languages = None
+
+"""
+Maps globe pks to (content_hash, geo_json, gzipped geo_json) tuples.
+"""
+globes = {}
+
+"""
+Maps the warm-up stages to the seconds they took.
+"""
+timings = {}
+
+
+
+def warm_up_server():
+	"""
+	Warms the process up if the WARMUP setting is on and closes the database
+	connections used for this, so that processes forked afterwards do not
+	share them. A database that is not set up yet, e.g. before the first
+	migrate, only makes for a cold start. Called by project.wsgi only, so that
+	the server's processes are the only ones to warm up.
+	"""
+	if not getattr(settings, 'WARMUP', False):
+		return
+	
+	try:
+		warm_up()
+	except DatabaseError:
+		logger.warning('Warm-up skipped: the database is not ready.')
+	finally:
+		connections.close_all()
+
+
+
+def warm_up():
+	"""
+	Fills the module-level tables. The caller is responsible for closing the
+	database connections afterwards, so that forked workers do not share them.
+	"""
+	global languages
+	
+	start = time.perf_counter()
+	languages = load_language_table()
+	timings['languages'] = time.perf_counter() - start
+	
+	start = time.perf_counter()
+	globes.clear()
+	globes.update(load_globe_table())
+	timings['globes'] = time.perf_counter() - start
+
+
+
+def reset():
+	"""
+	Empties the module-level tables, i.e. undoes warm_up.
+	"""
+	global languages
+	
+	languages = None
+	globes.clear()
+	timings.clear()
+
+
+
+def load_language_table():
+	"""
+	Returns {iso_code: (latitude, longitude)} of the languages with known
+	locations, fetched in a single query.
+	"""
+	rows = Language.objects.filter(
+		latitude__isnull = False,
+		longitude__isnull = False
+	).values_list('iso_code', 'latitude', 'longitude')
+	
+	return {iso_code: (latitude, longitude) for iso_code, latitude, longitude in rows}
+
+
+
+def load_globe_table():
+	"""
+	Returns {pk: (content_hash, geo_json, gzipped geo_json)} of the globes.
+	Globes without content hash, i.e. with invalid GeoJSON, are left out, as
+	there would be no telling whether they are stale.
+	"""
+	table = {}
+	
+	rows = Globe.objects.exclude(content_hash='').values_list(
+		'pk', 'content_hash', 'geo_json').iterator()
+	
+	for pk, content_hash, geo_json in rows:
+		table[pk] = (content_hash, geo_json, gzip.compress(geo_json.encode(), 6))
+	
+	return table
+
+
+
+def get_warm_globe(pk):
+	"""
+	Returns the (geo_json, gzipped geo_json) tuple of the given globe if it is
+	warm and not stale; None otherwise. Checking for staleness costs a query
+	but does not load the GeoJSON from the database.
+	"""
+	if not globes:
+		return None
+	
+	try:
+		content_hash, geo_json, gzipped = globes[int(pk)]
+	except (KeyError, ValueError):
+		record_cache('warm_globe', False)
+		return None
+	
+	if not Globe.objects.filter(pk=pk, content_hash=content_hash).exists():
+		record_cache('warm_globe', False)
+		return None
+	
+	record_cache('warm_globe', True)
+	return geo_json, gzipped
+
+
+
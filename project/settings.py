@@ -18,6 +18,7 @@ INSTALLED_APPS = (
     'utils',
 )
 MIDDLEWARE_CLASSES = (
+    'app.middleware.MetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -54,6 +55,125 @@ TEMPLATES = [
 ]
 
 
+"""
+Static files
+The storage fingerprints and precompresses the files during collectstatic;
+set SERVE_STATIC to True in order to have Django serve them itself. Until
+collectstatic is run, the files are referred to by their unhashed names.
+"""
+STATICFILES_STORAGE = 'utils.storage.CompressedManifestStaticFilesStorage'
+SERVE_STATIC = False
+
+
+"""
+File API
+The size limits of uploaded files, in bytes. Files submitted as background
+jobs (see app.jobs) can be larger.
+"""
+FILE_SIZE_LIMIT = 1024 * 500
+JOB_FILE_SIZE_LIMIT = 1024 * 1024 * 20
+
+
+"""
+Globes
+The limits of the GeoJSON files uploaded through the admin.
+"""
+GLOBE_FILE_SIZE_LIMIT = 1024 * 1024 * 100
+GLOBE_FEATURE_LIMIT = 100000
+
+
+"""
+Parse budgets
+The limits of a single .dot parse (see app.graphs.ParseBudget): the number of
+statements and attributes, the nesting depth of braces and brackets, and the
+wall-clock seconds. Parses exceeding them are rejected with an error. A
+max_memory, in bytes, also limits the memory that the parse allocates, at the
+cost of tracing the allocations (see app.profiling).
+"""
+PARSE_BUDGET = {
+	'max_tokens': 200000,
+	'max_depth': 8,
+	'max_seconds': 10,
+}
+JOB_PARSE_BUDGET = {
+	'max_tokens': 5000000,
+	'max_depth': 8,
+	'max_seconds': 300,
+}
+
+
+"""
+Job polling
+The most seconds that a request to the job API may wait for its job to finish
+(see app.views.job_api). A waiting request holds its worker, which is why the
+wait is short: with gunicorn's sync workers, a few clients long-polling at
+once would block the server. Raise it only with an async worker class, e.g.
+gunicorn -k gevent.
+"""
+JOB_MAX_WAIT = 5
+
+
+"""
+Edge aggregation
+How an edge repeated in a file (an undirected one, in either direction) is
+merged into the one already read, see app.graphs.EdgeAggregation: the weights
+are summed, maxed, or the first or the last kept; the colour and the opacity
+are these of the first or of the last edge.
+"""
+EDGE_AGGREGATION = {
+	'weight': 'last',
+	'style': 'last',
+}
+
+
+"""
+Parallel parsing
+The number of processes that parse the subgraphs of a .dot file of at least
+PARSE_PARALLEL_MIN_SIZE characters (see app.graphs.GraphElement); 1 parses
+all files in the calling process.
+"""
+PARSE_WORKERS = 1
+PARSE_PARALLEL_MIN_SIZE = 1024 * 1024
+
+
+"""
+Warm-up
+If set, the globes and the languages' locations are loaded into memory when
+project.wsgi is loaded, see app.warmup; serve with gunicorn --preload for the
+workers to share them. Management commands do not warm up.
+"""
+WARMUP = False
+
+
+"""
+Stored graphs
+The number of stored graphs that each process keeps decoded and indexed for
+the graph API's filters (see app.views.graph_api.load_indexed_graph).
+"""
+STORED_GRAPH_CACHE_SIZE = 32
+
+
+"""
+Regions
+The number of globes that each process keeps a spatial index of, for telling
+which of their features points fall in (see app.regions.get_region_index).
+"""
+REGION_INDEX_CACHE_SIZE = 4
+
+
+"""
+Distances
+The most languages that the distance API serves the whole matrix of as JSON,
+and the most that it serves the binary matrix or the nearest neighbours of.
+The matrix is computed in tiles of about DISTANCE_TILE_BYTES bytes (see
+app.distances), so only the JSON matrix takes memory quadratic in the number
+of languages.
+"""
+DISTANCE_JSON_LIMIT = 1000
+DISTANCE_LIMIT = 10000
+DISTANCE_TILE_BYTES = 16 * 1024 * 1024
+
+
 """
 Physical time and place settings
 """
@@ -64,6 +184,31 @@ USE_L10N = True
 USE_TZ = True
 
 
+"""
+Memory profiling
+If set, the memory allocated by the phases of the file API's requests and of
+the parse jobs is traced, logged and, for the requests, reported in the
+X-Memory-* headers; see app.profiling. Tracing slows the parses down.
+"""
+MEMORY_PROFILE = False
+
+
+"""
+Metrics
+The metrics of the requests and of the caches, served at /metrics/ to the
+METRICS_ALLOWED_IPS addresses; see app.metrics. With METRICS_DIR set, each
+process writes its metrics into that directory at most every
+METRICS_FLUSH_SECONDS and the metrics of all the processes are served. The
+directory should exist, be writable by the workers and be emptied whenever
+the server (re)starts. Behind a reverse proxy on the same host, every request
+comes from an allowed address: the proxy should set X-Forwarded-For, as the
+requests that carry it are refused, or not pass /metrics/ on at all.
+"""
+METRICS_DIR = None
+METRICS_FLUSH_SECONDS = 1
+METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')
+
+
 """
 Logging
 """
@@ -75,6 +220,10 @@ LOGGING = {
 			'class': 'django.utils.log.AdminEmailHandler',
 			'include_html': True,
 			'level': 'DEBUG'
+		},
+		'console': {
+			'class': 'logging.StreamHandler',
+			'level': 'DEBUG'
 		}
 	},
 	'loggers': {
@@ -82,6 +231,11 @@ LOGGING = {
 			'handlers': ['mail_admins'],
 			'level': 'DEBUG',
 			'propagate': True
+		},
+		'sanavirta.memory': {
+			'handlers': ['console'],
+			'level': 'INFO',
+			'propagate': False
 		}
 	}
 }
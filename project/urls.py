@@ -1,18 +1,45 @@
+from django.conf import settings
 from django.conf.urls import include, url
 from django.contrib import admin
 
+from app.views.distance_api import DistanceApiView
+from app.views.export_api import ExportApiView
 from app.views.file_api import FileApiView
-from app.views.globe_api import GlobeApiView
+from app.views.globe_api import (
+	GlobeApiView, GlobeListApiView, ProjectedGlobeApiView, RegionApiView)
+from app.views.graph_api import GraphApiView
+from app.views.job_api import JobApiView
 from app.views.landing import LandingView
+from app.views.metrics import MetricsView
+from app.views.stream_api import FileStreamApiView
+from utils.views import serve_static
 
 
 
 urlpatterns = [
 	url(r'^admin/', include(admin.site.urls)),
+	url(r'^api/distances/$', DistanceApiView.as_view(), name='distance_api'),
+	url(r'^api/export/$', ExportApiView.as_view(), name='export_api'),
 	url(r'^api/file/$', FileApiView.as_view(), name='file_api'),
+	url(r'^api/file/stream/$', FileStreamApiView.as_view(), name='file_stream_api'),
+	url(r'^api/graph/(\w+)/$', GraphApiView.as_view(), name='graph_api'),
 	url(r'^api/globe/([\d]+)/$', GlobeApiView.as_view(), name='globe_api'),
+	url(r'^api/globe/([\d]+)/projected/$',
+		ProjectedGlobeApiView.as_view(), name='projected_globe_api'),
+	url(r'^api/globe/([\d]+)/regions/$',
+		RegionApiView.as_view(), name='region_api'),
+	url(r'^api/globes/$', GlobeListApiView.as_view(), name='globe_list_api'),
+	url(r'^api/job/(\w+)/$', JobApiView.as_view(), name='job_api'),
+	url(r'^metrics/$', MetricsView.as_view(), name='metrics'),
 	url(r'^$', LandingView.as_view(), name='landing'),
 ]
 
 
+if settings.SERVE_STATIC:
+	urlpatterns.append(
+		url(r'^{}(?P<path>.*)$'.format(settings.STATIC_URL.lstrip('/')),
+			serve_static, name='static')
+	)
+
+
 
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings")
 
 application = get_wsgi_application()
+
+# after the setup, before gunicorn --preload forks the workers
+from app.warmup import warm_up_server
+
+warm_up_server()
@@ -100,6 +100,9 @@ var app = (function() {
 		if(location.search.substr(0, 7) == '?sample') {
 			appInstance.map.loadSampleGraph();
 		}
+		else if(location.search.substr(0, 7) == '?graph=') {
+			appInstance.map.loadStoredGraph(location.search.substr(7));
+		}
 	});
 	
 	
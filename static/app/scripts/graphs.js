@@ -37,6 +37,15 @@ app.graphs = (function() {
 		 */
 		self.edges = [];
 		
+		/**
+		 * The label plan, if any: the keys are ISO codes, the values are {zoom,
+		 * dx, dy}; a null zoom means that the label is never shown. The nodes
+		 * not listed are labelled as if there were no plan.
+		 * 
+		 * @see app.labels.plan_labels.
+		 */
+		self.labels = null;
+		
 		/**
 		 * The paper.js layers.
 		 */
@@ -146,6 +155,8 @@ app.graphs = (function() {
 			self.reset();
 		}
 		
+		self.labels = data.labels || null;
+		
 		var isoCode, node;
 		for(isoCode in data.nodes) {
 			node = new Node(self);
@@ -424,6 +435,17 @@ app.graphs = (function() {
 		self.textItem.position = [self.x, self.y];
 		self.circleItem.position = [self.x, self.y];
 		
+		if(self.graph.labels) {
+			var label = self.graph.labels[self.name];
+			if(label && (label.zoom === null
+					|| self.graph.map.viewport.zoom < label.zoom)) {
+				self.textItem.visible = false;
+			}
+			else if(label) {
+				self.textItem.position = [self.x + label.dx, self.y + label.dy];
+			}
+		}
+		
 		if(self.colour) {
 			self.circleItem.fillColor = self.colour;
 		}
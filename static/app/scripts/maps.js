@@ -139,6 +139,7 @@ app.maps = (function() {
 		var self = this;
 		var formData = new FormData();
 		formData.append('file', file);
+		formData.append('labels', 1);
 		
 		$.ajax({
 			url: '/api/file/',
@@ -161,6 +162,25 @@ app.maps = (function() {
 		});
 	};
 	
+	/**
+	 * Makes AJAX request to the API for a stored graph and sets it.
+	 * 
+	 * @see app.views.graph_api.GraphApiView.
+	 * @param The permalink key of the graph.
+	 */
+	Map.prototype.loadStoredGraph = function(key) {
+		var self = this;
+		
+		$.get('/api/graph/'+ encodeURIComponent(key) +'/')
+		.done(function(data) {
+			app.messages.success('Graph loaded.');
+			self.graph.setData(data);
+		})
+		.fail(function() {
+			app.messages.error('Graph not found.');
+		});
+	};
+	
 	/**
 	 * Loads a sample graph and centres it on the screen.
 	 * Used for development and showcasing.
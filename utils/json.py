@@ -1,6 +1,7 @@
 from django.core.serializers.json import DjangoJSONEncoder
 
 import json
+import re
 
 
 def make_json(python_things):
@@ -18,3 +19,126 @@ def read_json(json_things):
 		json_things = json_things.decode()
 	return json.loads(json_things)
 
+
+def iter_json_array(f, chunk_size=1024 * 64):
+	"""
+	Yields the items of the JSON array in the given text file one by one. The
+	file is read in chunks (see JsonStream), so that only the current item is
+	held in memory. Raises ValueError if the file does not contain a JSON
+	array.
+	"""
+	stream = JsonStream(f, chunk_size)
+	
+	try:
+		stream.expect('[')
+	except ValueError:
+		raise ValueError('Expected a JSON array.')
+	
+	try:
+		yield from stream.iter_array()
+	except ValueError:
+		raise ValueError('Invalid JSON array.')
+
+
+class JsonStream:
+	"""
+	Walks a JSON document in a text file without holding all of it in memory:
+	the file is read in chunks and only the values asked for with decode() are
+	built. The structure around these is walked with peek() and expect().
+	"""
+	
+	whitespace = re.compile(r'[ \t\n\r]*')
+	
+	def __init__(self, f, chunk_size=1024 * 64):
+		self.f = f
+		self.chunk_size = chunk_size
+		self.decoder = json.JSONDecoder()
+		self.buffer = ''
+		self.index = 0
+		self.eof = False
+	
+	def read_chunk(self, size=None):
+		"""
+		Drops the consumed part of the buffer and appends the next chunk of
+		the file to it. Returns False if the end of the file is reached.
+		"""
+		if self.eof:
+			return False
+		
+		chunk = self.f.read(size or self.chunk_size)
+		if not chunk:
+			self.eof = True
+			return False
+		
+		self.buffer = self.buffer[self.index:] + chunk
+		self.index = 0
+		return True
+	
+	def peek(self):
+		"""
+		Skips whitespace and returns the next character, which is not consumed;
+		returns the empty string at the end of the file.
+		"""
+		while True:
+			self.index = self.whitespace.match(self.buffer, self.index).end()
+			if self.index < len(self.buffer):
+				return self.buffer[self.index]
+			if not self.read_chunk():
+				return ''
+	
+	def expect(self, chars):
+		"""
+		Consumes and returns the next non-whitespace character. Raises
+		ValueError if it is not one of the given characters.
+		"""
+		char = self.peek()
+		if not char or char not in chars:
+			raise ValueError('Expected {}.'.format(' or '.join(chars)))
+		
+		self.index += 1
+		return char
+	
+	def iter_array(self):
+		"""
+		Yields the values of the array whose opening bracket has just been
+		consumed, one by one, and consumes its closing bracket. Raises
+		ValueError.
+		"""
+		if self.peek() == ']':
+			self.index += 1
+			return
+		
+		while True:
+			yield self.decode()
+			
+			if self.expect(',]') == ']':
+				return
+	
+	def decode(self):
+		"""
+		Consumes and returns the next JSON value. Values that are cut by the
+		end of the buffer are decoded again once more of the file is read; the
+		reads double in size, which keeps huge values linear. Raises ValueError.
+		"""
+		self.peek()
+		size = self.chunk_size
+		
+		while True:
+			try:
+				value, end = self.decoder.raw_decode(self.buffer, self.index)
+			except ValueError:
+				end = None
+			
+			# a number at the end of the buffer might go on in the next chunk
+			if end is not None and end < len(self.buffer):
+				self.index = end
+				return value
+			
+			if not self.read_chunk(size):
+				if end is None:
+					raise ValueError('Invalid JSON.')
+				self.index = end
+				return value
+			
+			size *= 2
+
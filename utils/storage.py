@@ -0,0 +1,82 @@
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+import gzip
+
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+	"""
+	Static files storage that, on top of fingerprinting the files (i.e. adding
+	the hash of their contents to their names), writes gzip variants of the
+	compressible ones during collectstatic. The variants are stored next to
+	the originals, with .gz appended to their names.
+	
+	See utils.views.serve_static for serving these files.
+	"""
+	
+	compressible = (
+		'.css', '.js', '.json', '.svg', '.html', '.txt', '.map',
+		'.eot', '.otf', '.ttf',
+	)
+	
+	"""
+	Files smaller than this are not worth compressing.
+	"""
+	min_size = 256
+	
+	def stored_name(self, name):
+		"""
+		Returns the name itself, unhashed, if there is no manifest at all, i.e.
+		collectstatic has not been run, so that the pages still render (e.g.
+		in tests or before the first deploy). Names missing from an existing
+		manifest are still an error.
+		"""
+		if not self.hashed_files:
+			return name
+		
+		return super().stored_name(name)
+	
+	def post_process(self, paths, dry_run=False, **options):
+		"""
+		Compresses the files once they are all hashed; CSS files are yielded
+		more than once by the parent, as their references get substituted.
+		"""
+		names = set()
+		
+		for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+			if hashed_name is not None and not isinstance(processed, Exception):
+				names.add(name)
+				names.add(hashed_name)
+			yield name, hashed_name, processed
+		
+		if dry_run:
+			return
+		
+		for name in sorted(names):
+			if name.endswith(self.compressible):
+				self.compress(name)
+	
+	def compress(self, name):
+		"""
+		Writes the gzip variant of the given file, unless it would not be
+		smaller than the original.
+		"""
+		with self.open(name) as f:
+			contents = f.read()
+		
+		if len(contents) < self.min_size:
+			return
+		
+		compressed = gzip.compress(contents, 9)
+		if len(compressed) >= len(contents):
+			return
+		
+		gz_name = name + '.gz'
+		if self.exists(gz_name):
+			self.delete(gz_name)
+		
+		self._save(gz_name, ContentFile(compressed))
+
+
+
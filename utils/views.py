@@ -0,0 +1,143 @@
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+import mimetypes
+import os
+import posixpath
+import re
+
+
+
+"""
+Cache-Control header values for fingerprinted and for other static files.
+"""
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, max-age=0, must-revalidate'
+
+
+"""
+Matches the names of fingerprinted files, e.g. scripts/app.0123456789ab.js
+"""
+HASHED_NAME = re.compile(r'^(?P<root>.+)\.[0-9a-f]{12}(?P<ext>\.[^/.]+)?$')
+
+
+
+def serve_static(request, path):
+	"""
+	Serves the collected static files, for when Django serves static files
+	itself. Fingerprinted files are served with far-future caching headers;
+	the gzip variants written by utils.storage are served to clients that
+	accept them.
+	"""
+	path = posixpath.normpath(path).lstrip('/')
+	if path.startswith('..') or path.endswith('.gz'):
+		raise Http404('Not found.')
+	
+	full_path = os.path.join(settings.STATIC_ROOT, path)
+	if not os.path.isfile(full_path):
+		raise Http404('Not found.')
+	
+	stat = os.stat(full_path)
+	if not was_modified_since(
+			request.META.get('HTTP_IF_MODIFIED_SINCE'),
+			stat.st_mtime, stat.st_size):
+		response = HttpResponseNotModified()
+		response['Cache-Control'] = get_cache_control(path)
+		return response
+	
+	content_type, encoding = mimetypes.guess_type(full_path)
+	
+	if accepts_encoding(request, 'gzip') and os.path.isfile(full_path + '.gz'):
+		response = FileResponse(
+			open(full_path + '.gz', 'rb'),
+			content_type = content_type or 'application/octet-stream'
+		)
+		response['Content-Encoding'] = 'gzip'
+		response['Content-Length'] = os.path.getsize(full_path + '.gz')
+	else:
+		response = FileResponse(
+			open(full_path, 'rb'),
+			content_type = content_type or 'application/octet-stream'
+		)
+		response['Content-Length'] = stat.st_size
+		if encoding:
+			response['Content-Encoding'] = encoding
+	
+	response['Vary'] = 'Accept-Encoding'
+	response['Last-Modified'] = http_date(stat.st_mtime)
+	response['Cache-Control'] = get_cache_control(path)
+	
+	return response
+
+
+
+def get_cache_control(path):
+	"""
+	Returns the Cache-Control header value for the given static file path.
+	Only the files that the storage knows as fingerprinted are immutable.
+	"""
+	match = HASHED_NAME.match(path)
+	if match is None:
+		return REVALIDATE
+	
+	name = match.group('root') + (match.group('ext') or '')
+	hashed_files = getattr(staticfiles_storage, 'hashed_files', {})
+	
+	if hashed_files.get(name) == path:
+		return IMMUTABLE
+	
+	return REVALIDATE
+
+
+
+def accepts_encoding(request, encoding):
+	"""
+	Checks whether the request's Accept-Encoding header lists the given
+	content coding, or else the * wildcard, with a non-zero quality.
+	"""
+	qualities = {}
+	
+	for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+		params = [param.strip() for param in item.split(';')]
+		quality = 1
+		
+		for param in params[1:]:
+			if param.startswith('q='):
+				try:
+					quality = float(param[2:])
+				except ValueError:
+					quality = 0
+		
+		qualities[params[0].lower()] = quality
+	
+	return qualities.get(encoding, qualities.get('*', 0)) > 0
+
+
+
+def accepts_media_type(request, media_type):
+	"""
+	Checks whether the request's Accept header lists the given media type
+	explicitly and with a non-zero quality. Wildcards do not count, so that
+	clients that do not ask for the media type get the views' default.
+	"""
+	for item in request.META.get('HTTP_ACCEPT', '').split(','):
+		params = [param.strip() for param in item.split(';')]
+		if params[0].lower() != media_type:
+			continue
+		
+		for param in params[1:]:
+			if param.startswith('q='):
+				try:
+					return float(param[2:]) > 0
+				except ValueError:
+					return False
+		
+		return True
+	
+	return False
+
+
+